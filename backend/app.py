@@ -1,53 +1,320 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-from capture import capture_packets, get_cached_packets
+from engine import CaptureEngine
+from flows import FlowTable
+from columns import ColumnStore
+from timeseries import TrafficSeries, parse_duration
+from talkers import TopTalkers, DIMENSIONS as TOP_DIMENSIONS
+from scans import ScanDetector, ALERT_TYPES
+from store import PacketStore, parse_time
+from archive import FrameArchive, pcap_stream
+from filters import filter_from_args, query_from_args, PROTOCOL_NUMBERS
+from enrichment import Enricher, IpApiProvider
+from geodb import OfflineGeoProvider
+from services import ServiceTable
+from ingest import IngestJob
+from stream import PacketStream
+from serialize import FastJSONProvider, dumps, loads, packet_list
+from httpcache import CompressedCache, encoded_etag, make_etag, matching_etag, negotiate
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram
+import capture
+import atexit
 import logging
 import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Configuration
 app.config['PACKET_COUNT'] = int(os.environ.get('PACKET_COUNT', 10))
-app.config['CACHE_TIMEOUT'] = int(os.environ.get('CACHE_TIMEOUT', 30))
+app.config['RING_SIZE'] = int(os.environ.get('RING_SIZE', 4096))
+app.config['DISSECT_WORKERS'] = int(os.environ.get('DISSECT_WORKERS', 0))
+app.config['CAPTURE_IFACE'] = os.environ.get('CAPTURE_IFACE') or None
+app.config['CAPTURE_FILTER'] = os.environ.get('CAPTURE_FILTER') or None
+app.config['SNAPLEN'] = int(os.environ.get('SNAPLEN', 0))
+app.config['ANALYSIS_WINDOW'] = int(os.environ.get('ANALYSIS_WINDOW', 1024))
+app.config['ENRICHMENT'] = os.environ.get('ENRICHMENT', 'True').lower() == 'true'
+app.config['ENRICHMENT_WORKERS'] = int(os.environ.get('ENRICHMENT_WORKERS', 4))
+app.config['ENRICHMENT_CACHE_SIZE'] = int(os.environ.get('ENRICHMENT_CACHE_SIZE', 4096))
+app.config['ENRICHMENT_TTL'] = int(os.environ.get('ENRICHMENT_TTL', 3600))
+app.config['ENRICHMENT_NEGATIVE_TTL'] = int(os.environ.get('ENRICHMENT_NEGATIVE_TTL', 300))
+app.config['GEO_PROVIDER'] = os.environ.get('GEO_PROVIDER', 'ip-api').lower()
+app.config['GEO_API_URL'] = os.environ.get('GEO_API_URL', 'http://ip-api.com/json')
+app.config['GEO_DB_PATH'] = os.environ.get('GEO_DB_PATH')
+app.config['SERVICES_FILE'] = os.environ.get('SERVICES_FILE')
+app.config['MAX_INGEST_JOBS'] = int(os.environ.get('MAX_INGEST_JOBS', 20))
+app.config['STREAM_BATCH_SIZE'] = int(os.environ.get('STREAM_BATCH_SIZE', 50))
+app.config['STREAM_BATCH_MS'] = int(os.environ.get('STREAM_BATCH_MS', 250))
+app.config['STREAM_MAX_BACKLOG'] = int(os.environ.get('STREAM_MAX_BACKLOG', 1000))
+app.config['FLOW_IDLE_TIMEOUT'] = int(os.environ.get('FLOW_IDLE_TIMEOUT', 300))
+app.config['FLOW_MAX'] = int(os.environ.get('FLOW_MAX', 100000))
+app.config['HISTORY_SIZE'] = int(os.environ.get('HISTORY_SIZE', 1000000))
+app.config['TIMESERIES_SECONDS'] = int(os.environ.get('TIMESERIES_SECONDS', 3600))
+app.config['TIMESERIES_MINUTES'] = int(os.environ.get('TIMESERIES_MINUTES', 1440))
+app.config['TOP_CAPACITY'] = int(os.environ.get('TOP_CAPACITY', 200))
+app.config['TOP_INTERVAL'] = int(os.environ.get('TOP_INTERVAL', 60))
+app.config['TOP_INTERVALS'] = int(os.environ.get('TOP_INTERVALS', 60))
+app.config['SCAN_WINDOW'] = int(os.environ.get('SCAN_WINDOW', 60))
+app.config['SCAN_PORT_THRESHOLD'] = int(os.environ.get('SCAN_PORT_THRESHOLD', 100))
+app.config['SCAN_HOST_THRESHOLD'] = int(os.environ.get('SCAN_HOST_THRESHOLD', 100))
+app.config['SCAN_MIN_SYNS'] = int(os.environ.get('SCAN_MIN_SYNS', 50))
+app.config['SCAN_SYN_ACK_RATIO'] = float(os.environ.get('SCAN_SYN_ACK_RATIO', 0.2))
+app.config['SCAN_MAX_SOURCES'] = int(os.environ.get('SCAN_MAX_SOURCES', 10000))
+app.config['STORE_DIR'] = os.environ.get('STORE_DIR') or None
+app.config['STORE_SEGMENT_MB'] = int(os.environ.get('STORE_SEGMENT_MB', 64))
+app.config['STORE_RETENTION'] = parse_duration(os.environ.get('STORE_RETENTION', '7d'))
+app.config['STORE_MAX_MB'] = int(os.environ.get('STORE_MAX_MB', 0))
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR') or None
+app.config['ARCHIVE_FILE_MB'] = int(os.environ.get('ARCHIVE_FILE_MB', 100))
+app.config['ARCHIVE_FILE_TIME'] = parse_duration(os.environ.get('ARCHIVE_FILE_TIME', '1h'))
+app.config['ARCHIVE_MAX_FILES'] = int(os.environ.get('ARCHIVE_MAX_FILES', 10))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+app.config['COMPRESS_CACHE_SIZE'] = int(os.environ.get('COMPRESS_CACHE_SIZE', 32))
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+capture.set_analysis_window(app.config['ANALYSIS_WINDOW'])
+
+if app.config['SERVICES_FILE']:
+    capture.set_service_table(ServiceTable.load(app.config['SERVICES_FILE']))
+
+if app.config['GEO_PROVIDER'] == 'offline':
+    if not app.config['GEO_DB_PATH']:
+        raise RuntimeError('GEO_PROVIDER=offline requires GEO_DB_PATH')
+    capture.set_geo_provider(OfflineGeoProvider(app.config['GEO_DB_PATH']))
+else:
+    capture.set_geo_provider(IpApiProvider(app.config['GEO_API_URL']))
+
+if app.config['ENRICHMENT']:
+    capture.set_enricher(Enricher(
+        dns_resolver=capture.dns_lookup,
+        geo_provider=capture.geo_provider,
+        workers=app.config['ENRICHMENT_WORKERS'],
+        cache_size=app.config['ENRICHMENT_CACHE_SIZE'],
+        ttl=app.config['ENRICHMENT_TTL'],
+        negative_ttl=app.config['ENRICHMENT_NEGATIVE_TTL']
+    ))
+
+store = None
+if app.config['STORE_DIR']:
+    store = PacketStore(app.config['STORE_DIR'],
+                        segment_bytes=app.config['STORE_SEGMENT_MB'] * 1024 * 1024,
+                        retention_seconds=app.config['STORE_RETENTION'],
+                        retention_bytes=app.config['STORE_MAX_MB'] * 1024 * 1024 or None)
+    atexit.register(store.close)
+
+archive = None
+if app.config['ARCHIVE_DIR']:
+    archive = FrameArchive(app.config['ARCHIVE_DIR'],
+                           max_bytes=app.config['ARCHIVE_FILE_MB'] * 1024 * 1024,
+                           max_seconds=app.config['ARCHIVE_FILE_TIME'],
+                           max_files=app.config['ARCHIVE_MAX_FILES'])
+    atexit.register(archive.close)
+
+# Sequence numbers continue after the stored history, so ids stay unique across restarts
+engine = CaptureEngine(ring_size=app.config['RING_SIZE'], iface=app.config['CAPTURE_IFACE'],
+                       workers=app.config['DISSECT_WORKERS'],
+                       services_file=app.config['SERVICES_FILE'],
+                       bpf_filter=app.config['CAPTURE_FILTER'],
+                       snaplen=app.config['SNAPLEN'],
+                       first_seq=store.last_seq + 1 if store is not None else 1,
+                       archive=archive)
+if store is not None:
+    engine.add_consumer(store.add_packet)
+flow_table = FlowTable(idle_timeout=app.config['FLOW_IDLE_TIMEOUT'],
+                       max_flows=app.config['FLOW_MAX'])
+engine.add_consumer(flow_table.add_packet)
+history = ColumnStore(capacity=app.config['HISTORY_SIZE'])
+engine.add_consumer(history.add_packet)
+traffic = TrafficSeries(seconds=app.config['TIMESERIES_SECONDS'],
+                        minutes=app.config['TIMESERIES_MINUTES'])
+engine.add_consumer(traffic.add_packet)
+talkers = TopTalkers(capacity=app.config['TOP_CAPACITY'], interval=app.config['TOP_INTERVAL'],
+                     intervals=app.config['TOP_INTERVALS'])
+engine.add_consumer(talkers.add_packet)
+scan_detector = ScanDetector(window=app.config['SCAN_WINDOW'],
+                             port_threshold=app.config['SCAN_PORT_THRESHOLD'],
+                             host_threshold=app.config['SCAN_HOST_THRESHOLD'],
+                             min_syns=app.config['SCAN_MIN_SYNS'],
+                             syn_ack_ratio=app.config['SCAN_SYN_ACK_RATIO'],
+                             max_sources=app.config['SCAN_MAX_SOURCES'])
+engine.add_consumer(scan_detector.add_packet)
+ingest_jobs = {}
+compressed_bodies = CompressedCache(max_entries=app.config['COMPRESS_CACHE_SIZE'],
+                                    level=app.config['COMPRESS_LEVEL'],
+                                    min_size=app.config['COMPRESS_MIN_BYTES'])
+
+# Metrics (see /metrics): request timing here, pipeline state read at scrape time
+REQUEST_SECONDS = Histogram('osi_http_request_seconds', 'Flask view latency', labelnames=('endpoint',))
+REQUESTS = Counter('osi_http_requests_total', 'HTTP requests by endpoint and status',
+                   labelnames=('endpoint', 'status'))
+
+def _newest_packet_age():
+    newest = engine.latest(1)
+    if not newest:
+        return None
+    return (datetime.now() - datetime.fromisoformat(newest[0]['timestamp'])).total_seconds()
+
+def _kernel_stats(key):
+    return {(name,): stats[key] for name, stats in engine.kernel_stats().items()}
+
+def _enrichment_stat(key):
+    return capture.enricher.status()[key] if capture.enricher else None
+
+Gauge('osi_capture_running', 'Whether the capture engine is sniffing', lambda: int(engine.running))
+Gauge('osi_captured_packets_total', 'Packets received by the capture engine',
+      lambda: engine.stats['captured'], kind='counter')
+Gauge('osi_capture_errors_total', 'Packets the capture engine failed to process',
+      lambda: engine.stats['errors'], kind='counter')
+Gauge('osi_kernel_packets_received_total', 'Frames that passed the kernel capture filter',
+      lambda: _kernel_stats('received'), labelnames=('filter',), kind='counter')
+Gauge('osi_kernel_packets_dropped_total', 'Frames the kernel dropped for lack of buffer space',
+      lambda: _kernel_stats('dropped'), labelnames=('filter',), kind='counter')
+Gauge('osi_ring_packets', 'Packets held in the ring buffer', lambda: len(engine.ring))
+Gauge('osi_ring_last_seq', 'Sequence number of the newest packet', lambda: engine.ring.last_seq)
+Gauge('osi_newest_packet_age_seconds', 'Age of the newest packet in the ring', _newest_packet_age)
+for _key, _help in (('hits', 'Enrichment cache hits'), ('misses', 'Enrichment cache misses'),
+                    ('lookups', 'Enrichment lookups performed'),
+                    ('failures', 'Enrichment lookups that returned nothing')):
+    Gauge(f'osi_enrichment_{_key}_total', _help, lambda key=_key: _enrichment_stat(key), kind='counter')
+Gauge('osi_enrichment_cache_entries', 'Entries in the enrichment cache', lambda: _enrichment_stat('cached'))
+Gauge('osi_enrichment_inflight', 'Enrichment lookups in progress', lambda: _enrichment_stat('inflight'))
+Gauge('osi_history_packets', 'Packets held in the columnar history', lambda: len(history))
+Gauge('osi_history_bytes', 'Memory used by the columnar history columns', lambda: history.nbytes)
+Gauge('osi_scan_alerts_total', 'Scan alerts raised by type',
+      lambda: {(kind,): count for kind, count in scan_detector.stats['alerts'].items()},
+      labelnames=('type',), kind='counter')
+Gauge('osi_scan_sources', 'Source addresses tracked by the scan detector', lambda: len(scan_detector))
+Gauge('osi_store_bytes', 'Size of the persistent packet store',
+      lambda: store.nbytes if store is not None else None)
+Gauge('osi_store_segments', 'Segment files in the persistent packet store',
+      lambda: len(store._segments) if store is not None else None)
+Gauge('osi_store_written_total', 'Packets written to the persistent store',
+      lambda: store.stats['written'] if store is not None else None, kind='counter')
+Gauge('osi_store_dropped_total', 'Packets dropped because the store writer fell behind',
+      lambda: store.stats['dropped'] if store is not None else None, kind='counter')
+Gauge('osi_archive_frames_total', 'Raw frames written to the pcapng archive',
+      lambda: archive.stats['archived'] if archive is not None else None, kind='counter')
+Gauge('osi_archive_dropped_total', 'Raw frames dropped because the archive writer fell behind',
+      lambda: archive.stats['dropped'] if archive is not None else None, kind='counter')
+Gauge('osi_compressed_cache_hits_total', 'Responses served from the compressed body cache',
+      lambda: compressed_bodies.stats['hits'], kind='counter')
+Gauge('osi_compressed_cache_misses_total', 'Response bodies compressed',
+      lambda: compressed_bodies.stats['misses'], kind='counter')
+Gauge('osi_flows_active', 'Conversations in the flow table', lambda: len(flow_table))
+Gauge('osi_flows_evicted_total', 'Conversations evicted from the flow table',
+      lambda: {('idle',): flow_table.stats['evicted_idle'],
+               ('capacity',): flow_table.stats['evicted_capacity']},
+      labelnames=('reason',), kind='counter')
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+class _PacketSummaries:
+    """One line per packet, built only if the log record is emitted."""
+    __slots__ = ('packets',)
+
+    def __init__(self, packets):
+        self.packets = packets
+
+    def __str__(self):
+        return '\n'.join(f"  #{p.get('id')} {p.get('size')}B {p.get('summary')}" for p in self.packets)
+
+def _log_request(packets, response):
+    """Summary line for a packet response, plus a sampled debug dump."""
+    if logger.isEnabledFor(logging.INFO):
+        start = g.get('request_start')
+        elapsed = (time.perf_counter() - start) * 1000 if start is not None else 0.0
+        logger.info("%s %s: %d packets, %d bytes, %.1f ms", request.method, request.path,
+                    len(packets), response.content_length or 0, elapsed)
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < app.config['LOG_SAMPLE_RATE']:
+        logger.debug("Pacotes retornados:\n%s", _PacketSummaries(packets))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of the capture and analysis pipeline."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/api/packets', methods=['GET'])
 def get_packets():
-    """Get network packets with optional caching."""
+    """Get the newest packets from the capture engine's ring buffer.
+
+    The ``cache`` parameter is still accepted for older clients but has no
+    effect: capture runs continuously, so every read is already fresh.
+    Reads never change the capture filter (that is PUT /api/capture/filter),
+    so ``filter`` is rejected here.
+
+    Any of QUERY_ARGS turns the request into a query (see _query_packets):
+    ``after_id``/``limit`` cursor paging, ``fields`` projection and
+    predicates on ``ip``/``src_ip``/``dst_ip`` (address or CIDR),
+    ``src_port``, ``dst_port``, ``protocol``, ``risk``,
+    ``since``/``until`` (epoch seconds or ISO datetimes) and
+    ``host``/``port`` on the side ``direction`` picks.
+    """
+    if 'filter' in request.args:
+        return jsonify({'error': 'Capture filters are not set by reads',
+                        'message': 'Use PUT /api/capture/filter to change the capture filter, '
+                                   'or host/port/protocol/direction to filter what is read',
+                        'packets': [], 'count': 0}), 400
     try:
-        use_cache = request.args.get('cache', 'true').lower() == 'true'
-        count = int(request.args.get('count', app.config['PACKET_COUNT']))
-        
-        if use_cache:
-            packets = get_cached_packets(count)
-        else:
-            packets = capture_packets(count)
+        query = query_from_args(request.args, app.config['PACKET_COUNT'])
+    except ValueError as e:
+        return jsonify({'error': 'Invalid packet query', 'message': str(e), 'packets': [], 'count': 0}), 400
+    if query is not None:
+        return _query_packets(query)
 
-        # Log detalhado do conteúdo dos pacotes para debug
-        import pprint
-        logger.info("Pacotes retornados:\n" + pprint.pformat(packets))
+    try:
+        count = int(request.args.get('count', app.config['PACKET_COUNT']))
+        state = _packets_state()
+        last_seq = state[0]
+        selected = []
 
-        try:
-            return jsonify({
-                'packets': packets,
+        def build():
+            # The newest packets as of the ETag's state, not whatever arrived since
+            packets = engine.ring.since(max(last_seq - count, 0), count) if count > 0 else []
+            selected.extend(packets)
+            # Settled packets were encoded once and are spliced in as bytes
+            return packet_list(engine.ring.encoded(packets), {
                 'count': len(packets),
-                'timestamp': packets[0]['timestamp'] if packets else None
+                'timestamp': packets[0]['timestamp'] if packets else None,
+                'last_seq': last_seq,
+                'filter': engine.filter
             })
+
+        try:
+            response = _conditional_response(make_etag(request.full_path, state), build)
         except Exception as e:
-            import traceback
-            logger.error('Erro ao serializar resposta JSON: %s', str(e))
-            logger.error('Traceback:\n' + traceback.format_exc())
-            logger.error('Pacote problemático:\n' + pprint.pformat(packets))
+            logger.exception('Erro ao serializar resposta JSON: %s', str(e))
+            logger.error('Pacotes problemáticos (ids): %s', [p.get('id') for p in selected])
             return jsonify({
                 'error': 'Failed to serialize packets',
                 'message': str(e),
                 'packets': [],
                 'count': 0
             }), 500
+        if selected:
+            _log_request(selected, response)
+        return response
     except Exception as e:
         logger.error(f"Error capturing packets: {str(e)}")
         return jsonify({
@@ -57,10 +324,372 @@ def get_packets():
             'count': 0
         }), 500
 
+def _packets_state():
+    """What packet responses depend on besides the request: new packets,
+    enrichment results, the capture filter and the persistent store."""
+    enricher = capture.enricher
+    return (engine.ring.last_seq, enricher.generation if enricher else 0, engine.filter,
+            engine.filter_since,
+            (store.last_seq, store.stats['expired_segments']) if store is not None else None)
+
+def _conditional_response(etag, build):
+    """JSON response with a strong ``etag``.
+
+    A client that already has it, in any content coding, gets 304 Not
+    Modified. Otherwise the body is ``build()``'s bytes, compressed when the
+    client accepts it and tagged with the coding; while the ETag holds, the
+    compressed body is reused across requests.
+    """
+    matched = matching_etag(request.if_none_match, etag)
+    if matched is not None:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        encoding = negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            body = build()
+        else:
+            body, encoding = compressed_bodies.get(etag, encoding, build)
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(encoded_etag(etag, encoding))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _fetch_packets(seqs):
+    """``(seq, source, packet)`` for each sequence number: the ring's full dict,
+    else the persistent store's JSON bytes, else the columnar record."""
+    ring = engine.ring
+    found = {}
+    for seq in seqs:
+        packet = ring.get(seq)
+        if packet is not None:
+            found[seq] = ('ring', packet)
+    missing = [seq for seq in seqs if seq not in found]
+    if missing and store is not None:
+        found.update((seq, ('json', payload)) for seq, payload in store.get(missing).items())
+    entries = []
+    for seq in seqs:
+        source, packet = found.get(seq) or ('record', history.record(seq))
+        if packet is not None:
+            entries.append((seq, source, packet))
+    return entries
+
+def _query_packets(query):
+    """Cursor-paged, projected and filtered /api/packets.
+
+    Predicates are evaluated on the columnar history's columns and the
+    matching packets are then read by id. A time range with no other
+    predicate goes through the persistent store's time index instead,
+    when it is enabled, as it reaches further back. Packets come oldest
+    first; ``next_after_id`` is the cursor for the next page.
+    """
+    after_id, limit, fields = query['after_id'], query['limit'], query['fields']
+    predicates = dict(query['predicates'])
+
+    state = _packets_state()
+    built = []
+
+    def build():
+        if store is not None and predicates and set(predicates) <= {'since', 'until'}:
+            records = store.read(after=after_id, limit=limit + 1, **predicates)
+            more = len(records) > limit
+            entries = [(seq, 'json', payload) for seq, _, payload in records[:limit]]
+        else:
+            seqs, more = history.select(after_id, limit, **predicates)
+            entries = _fetch_packets(seqs)
+
+        if fields is None:
+            # Whole packets: ring packets reuse their cached encoding, stored ones are spliced as is
+            ring_encoded = iter(engine.ring.encoded([packet for _, source, packet in entries if source == 'ring']))
+            encoded = [next(ring_encoded) if source == 'ring' else packet if source == 'json' else dumps(packet)
+                       for _, source, packet in entries]
+        else:
+            encoded = []
+            for _, source, packet in entries:
+                if source == 'json':
+                    packet = loads(packet)
+                encoded.append(dumps({name: packet[name] for name in fields if name in packet}))
+        built.append(len(encoded))
+        return packet_list(encoded, {
+            'count': len(encoded),
+            'next_after_id': entries[-1][0] if entries else after_id,
+            'has_more': more,
+            'last_seq': state[0],
+            'filter': engine.filter
+        })
+
+    response = _conditional_response(make_etag(request.full_path, state), build)
+    if built:
+        logger.info("%s %s: %d packets (query), %d bytes", request.method, request.path,
+                    built[0], response.content_length or 0)
+    return response
+
+@app.route('/api/capture/filter', methods=['GET', 'PUT'])
+def capture_filter():
+    """Read or replace the kernel-side BPF capture filter.
+
+    PUT takes JSON with ``filter`` and/or ``host``, ``port``, ``protocol``
+    and ``direction``; ``{"filter": null}`` removes the filter.
+    """
+    if request.method == 'PUT':
+        try:
+            body = request.get_json(silent=True) or {}
+            _, bpf = filter_from_args({k: v for k, v in body.items() if v is not None})
+            engine.set_filter(bpf)
+        except ValueError as e:
+            return jsonify({'error': 'Invalid capture filter', 'message': str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({'error': 'Capture filters unavailable', 'message': str(e)}), 503
+    status = engine.status()
+    return jsonify({
+        'filter': status['filter'],
+        'since_seq': engine.filter_since,
+        'kernel': status['kernel'],
+        'filters': status['filters']
+    })
+
+@app.route('/api/flows', methods=['GET'])
+def get_flows():
+    """Conversations aggregated by 5-tuple, one page at a time."""
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 50))), 1000)
+        total, flows = flow_table.query(offset=offset, limit=limit,
+                                        sort=request.args.get('sort', 'last_seen'),
+                                        protocol=request.args.get('protocol'),
+                                        state=request.args.get('state'),
+                                        ip=request.args.get('ip'))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid flow query', 'message': str(e)}), 400
+    return jsonify({
+        'flows': flows,
+        'count': len(flows),
+        'total': total,
+        'offset': offset,
+        'limit': limit
+    })
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Long packet history from the columnar store.
+
+    Records carry the stored fields only (addresses, ports, size, protocol,
+    flags, risk, application); the full analysis of recent packets is in
+    /api/packets. ``since`` returns packets after that sequence number,
+    otherwise the newest ``count`` are returned.
+    """
+    try:
+        limit = min(max(1, int(request.args.get('count', 100))), 10000)
+        since = request.args.get('since')
+        since = int(since) if since not in (None, '') else None
+    except ValueError as e:
+        return jsonify({'error': 'Invalid history query', 'message': str(e)}), 400
+
+    def build():
+        if since is not None:
+            packets = history.records(since=since, limit=limit)
+        else:
+            packets = history.records(latest=limit)
+        return dumps({
+            'packets': packets,
+            'count': len(packets),
+            'first_seq': history.first_seq,
+            'last_seq': history.last_seq
+        })
+
+    return _conditional_response(make_etag(request.full_path, history.stats['packets']), build)
+
+@app.route('/api/stats/timeseries', methods=['GET'])
+def get_timeseries():
+    """Packets and bytes over time from the pre-aggregated buckets.
+
+    ``window`` and ``resolution`` take seconds or ``30s``/``5m``/``1h``;
+    ``group_by`` is protocol, layer, risk, application or none.
+    """
+    group_by = request.args.get('group_by', 'protocol')
+    try:
+        result = traffic.query(window=parse_duration(request.args.get('window')) or 300,
+                               resolution=parse_duration(request.args.get('resolution')),
+                               group_by=None if group_by == 'none' else group_by)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid timeseries query', 'message': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/top', methods=['GET', 'DELETE'])
+def top_talkers():
+    """Heaviest source/destination IPs, IP pairs, destination ports and
+    application protocols; DELETE resets the counters.
+
+    ``k`` entries per dimension (``dimension`` narrows them, comma-separated),
+    ranked by ``by`` (bytes or packets) over the last ``window``.
+    """
+    if request.method == 'DELETE':
+        talkers.reset()
+        return jsonify({'status': 'reset'})
+    dimensions = request.args.get('dimension')
+    try:
+        k = min(max(1, int(request.args.get('k', 10))), 100)
+        result = talkers.query(k=k, window=parse_duration(request.args.get('window')),
+                               by=request.args.get('by', 'bytes'),
+                               dimensions=dimensions.split(',') if dimensions else TOP_DIMENSIONS)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid top query', 'message': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Scan alerts from the stateful detector, newest first.
+
+    ``type`` (port_scan, host_sweep, syn_scan) and ``source`` narrow them.
+    """
+    try:
+        limit = min(max(1, int(request.args.get('limit', 100))), 1000)
+        alerts = scan_detector.alerts(limit=limit, kind=request.args.get('type'),
+                                      source=request.args.get('source'))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid alert query', 'message': str(e)}), 400
+    return jsonify({'alerts': alerts, 'count': len(alerts), 'types': list(ALERT_TYPES)})
+
+def _find_packet(packet_id):
+    """Packet dict by id, from the ring or else the persistent store."""
+    found = engine.ring.since(packet_id - 1, 1)
+    if not (found and found[0]['id'] == packet_id) and store is not None:
+        found = store.records(after=packet_id - 1, limit=1)
+    return found[0] if found and found[0]['id'] == packet_id else None
+
+def _pcap_response(frames, filename):
+    return Response(stream_with_context(pcap_stream(frames)), mimetype='application/vnd.tcpdump.pcap',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/archive/<int:packet_id>', methods=['GET'])
+def archived_packet(packet_id):
+    """One packet's original frame as a pcap file."""
+    if archive is None:
+        return jsonify({'error': 'Frame archive disabled', 'message': 'Set ARCHIVE_DIR to keep raw frames'}), 503
+    packet = _find_packet(packet_id)
+    if packet is None:
+        return jsonify({'error': 'Unknown packet'}), 404
+    frame = archive.frames([packet.get('archive')])[0]
+    if frame is None:
+        return jsonify({'error': 'Frame not archived', 'archive': packet.get('archive')}), 404
+    return _pcap_response([frame], f"packet-{packet_id}.pcap")
+
+@app.route('/api/archive', methods=['GET'])
+def archived_slice():
+    """Original frames of a selection of packets as a pcap file.
+
+    Packets come from the persistent store for a ``since``/``until`` range
+    when it is enabled, otherwise from the ring buffer, and can be narrowed
+    by ``host``, ``port`` and ``protocol`` (tcp, udp, icmp, icmp6).
+    """
+    if archive is None:
+        return jsonify({'error': 'Frame archive disabled', 'message': 'Set ARCHIVE_DIR to keep raw frames'}), 503
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        count = min(max(1, int(request.args.get('count', 1000))), 10000)
+        port = request.args.get('port')
+        port = int(port) if port not in (None, '') else None
+        protocol = request.args.get('protocol')
+        if protocol:
+            if protocol.lower() not in PROTOCOL_NUMBERS:
+                raise ValueError(f"Invalid protocol {protocol!r}; expected one of {', '.join(PROTOCOL_NUMBERS)}")
+            protocol = PROTOCOL_NUMBERS[protocol.lower()]
+    except ValueError as e:
+        return jsonify({'error': 'Invalid archive query', 'message': str(e)}), 400
+    host = request.args.get('host') or None
+
+    if store is not None and (since is not None or until is not None):
+        packets = store.records(since=since, until=until, limit=10000)
+    else:
+        packets = engine.latest(engine.ring.capacity)
+        if since is not None or until is not None:
+            times = [datetime.fromisoformat(p['timestamp']).timestamp() for p in packets]
+            packets = [p for p, t in zip(packets, times)
+                       if (since is None or t >= since) and (until is None or t < until)]
+    selected = [p['archive'] for p in packets if p.get('archive')
+                and (host is None or host in (p.get('src_ip'), p.get('dst_ip')))
+                and (port is None or port in (p.get('src_port'), p.get('dst_port')))
+                and (protocol is None or p.get('protocol') == protocol)][:count]
+    frames = [frame for frame in archive.frames(selected) if frame is not None]
+    return _pcap_response(frames, "packets.pcap")
+
+@app.route('/api/stream', methods=['GET'])
+def stream_packets():
+    """Push newly dissected packets as Server-Sent Events.
+
+    Optional ``since`` (or the Last-Event-ID header sent by EventSource on
+    reconnect) resumes after that sequence number; ``batch`` and
+    ``interval_ms`` override the server's batching.
+    """
+    try:
+        since = request.args.get('since', request.headers.get('Last-Event-ID'))
+        since = int(since) if since not in (None, '') else None
+        batch_size = min(int(request.args.get('batch', app.config['STREAM_BATCH_SIZE'])),
+                         app.config['STREAM_MAX_BACKLOG'])
+        interval_ms = int(request.args.get('interval_ms', app.config['STREAM_BATCH_MS']))
+    except ValueError:
+        return jsonify({'error': 'Invalid stream parameters',
+                        'message': 'since, batch and interval_ms must be integers'}), 400
+
+    stream = PacketStream(engine, since=since, batch_size=batch_size,
+                          batch_interval=max(0, interval_ms) / 1000.0,
+                          max_backlog=app.config['STREAM_MAX_BACKLOG'])
+    return Response(stream_with_context(stream.events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/pcap', methods=['POST'])
+def upload_pcap():
+    """Upload a pcap/pcapng file and feed it through the capture pipeline."""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No file uploaded', 'message': "Send the capture as multipart field 'file'"}), 400
+
+    # Streamed to disk; ingestion reads it back one packet at a time
+    fd, path = tempfile.mkstemp(prefix='osi-upload-', suffix=os.path.splitext(upload.filename)[1])
+    os.close(fd)
+    upload.save(path)
+
+    # Forget the oldest finished jobs
+    finished = [job_id for job_id, job in ingest_jobs.items() if not job.is_alive()]
+    for job_id in finished[:max(0, len(ingest_jobs) - app.config['MAX_INGEST_JOBS'] + 1)]:
+        del ingest_jobs[job_id]
+
+    job_id = uuid.uuid4().hex
+    job = IngestJob(path, process_raw=engine.process_raw, delete=True, name=upload.filename)
+    ingest_jobs[job_id] = job
+    job.start()
+    logger.info(f"Ingesting uploaded capture {upload.filename} as job {job_id}")
+    return jsonify({'job_id': job_id, 'status_url': f'/api/pcap/{job_id}'}), 202
+
+@app.route('/api/pcap/<job_id>', methods=['GET'])
+def pcap_status(job_id):
+    """Progress and packets/sec of an ingestion job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown ingestion job'}), 404
+    return jsonify(job.as_dict())
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'service': 'osi-visualizer-backend'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'osi-visualizer-backend',
+        'capture': engine.status(),
+        'flows': flow_table.status(),
+        'history': history.status(),
+        'timeseries': traffic.status(),
+        'top': talkers.status(),
+        'scans': scan_detector.status(),
+        'store': store.status() if store is not None else None,
+        'archive': archive.status() if archive is not None else None,
+        'compression': compressed_bodies.status(),
+        'enrichment': capture.enricher.status() if capture.enricher else None
+    })
 
 @app.errorhandler(404)
 def not_found(error):
@@ -73,4 +702,7 @@ def internal_error(error):
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('DEBUG', 'True').lower() == 'true'
+    # With the debug reloader only the child process should sniff
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        engine.start()
     app.run(host='127.0.0.1', port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,238 @@
+import os
+import queue
+import struct
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# pcapng blocks (https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-02.html)
+SHB = struct.Struct('<IIIHHqI')  # section header: type, length, byte-order magic, version, section length, length
+IDB = struct.Struct('<IIHHII')  # interface description: type, length, linktype, reserved, snaplen, length
+EPB = struct.Struct('<IIIIIII')  # enhanced packet header: type, length, interface, ts high/low, caplen, wirelen
+BLOCK = struct.Struct('<II')  # type and total length, common to every block
+SHB_TYPE, IDB_TYPE, EPB_TYPE = 0x0A0D0D0A, 1, 6
+ARCHIVE_SUFFIX = '.pcapng'
+
+# Classic libpcap format, used for exports
+PCAP_HEADER = struct.Struct('<IHHiIII')  # magic, version, thiszone, sigfigs, snaplen, linktype
+PCAP_RECORD = struct.Struct('<IIII')  # ts seconds, ts microseconds, caplen, wirelen
+PCAP_SNAPLEN = 262144
+
+
+def _section_header():
+    return SHB.pack(SHB_TYPE, SHB.size, 0x1A2B3C4D, 1, 0, -1, SHB.size)
+
+
+def _interface(linktype):
+    return IDB.pack(IDB_TYPE, IDB.size, linktype, 0, 0, IDB.size)
+
+
+def _packet(interface, raw, timestamp, wirelen):
+    """Enhanced packet block, timestamp in microseconds (the default resolution)."""
+    micros = int(round(float(timestamp) * 1000000))
+    padding = -len(raw) % 4
+    length = EPB.size + len(raw) + padding + 4
+    return b''.join((EPB.pack(EPB_TYPE, length, interface, micros >> 32, micros & 0xFFFFFFFF,
+                              len(raw), wirelen), raw, b'\0' * padding, struct.pack('<I', length)))
+
+
+def pcap_stream(frames):
+    """Classic pcap file for ``(timestamp, linktype, raw, wirelen)`` frames.
+
+    A pcap file has a single link type: the first frame's. Frames of another
+    link type are left out (in practice every frame of a capture is Ethernet).
+    """
+    linktype = None
+    for timestamp, frame_linktype, raw, wirelen in frames:
+        if linktype is None:
+            linktype = frame_linktype
+            yield PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, PCAP_SNAPLEN, linktype)
+        if frame_linktype != linktype:
+            continue
+        micros = int(round(timestamp * 1000000))
+        yield PCAP_RECORD.pack(micros // 1000000, micros % 1000000, len(raw), wirelen) + raw
+    if linktype is None:
+        yield PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, PCAP_SNAPLEN, 1)
+
+
+class FrameArchive:
+    """Raw captured frames in rotating pcapng files.
+
+    append() builds the pcapng blocks and works out where they will land,
+    so a packet's ``{'file', 'offset'}`` reference is known right away; a
+    writer thread does the actual file I/O. A file is rotated once it holds
+    ``max_bytes`` or has been open for ``max_seconds``, and only the newest
+    ``max_files`` are kept. When ``max_queue`` blocks are waiting for the
+    writer, frames are dropped (and get no reference) instead of blocking
+    capture.
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, max_seconds=3600, max_files=10,
+                 max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        self.stats = {'archived': 0, 'dropped': 0, 'errors': 0, 'rotated': 0}
+        os.makedirs(path, exist_ok=True)
+        self._files = deque(sorted(name for name in os.listdir(path) if name.endswith(ARCHIVE_SUFFIX)))
+        self._linktypes = {}  # file -> linktype of each interface id, filled in when read
+        self._current = None  # file new frames go to, its size and its interface ids
+        self._size = 0
+        self._interfaces = {}
+        self._opened = 0.0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = threading.Thread(target=self._run, name='frame-archive', daemon=True)
+        self._writer.start()
+
+    def append(self, raw, timestamp, linktype=1, wirelen=None):
+        """Queue a frame; returns its ``{'file', 'offset'}`` reference or None if dropped."""
+        wirelen = max(wirelen or 0, len(raw))
+        with self._lock:
+            name, size, interfaces = self._current, self._size, self._interfaces
+            prefix = b''
+            if name is None or size >= self.max_bytes or time.monotonic() - self._opened >= self.max_seconds:
+                name = datetime.now().strftime('capture-%Y%m%d-%H%M%S-%f') + ARCHIVE_SUFFIX
+                size, interfaces = 0, {}
+                prefix = _section_header()
+            interface = interfaces.get(linktype)
+            if interface is None:
+                interface = len(interfaces)
+                prefix += _interface(linktype)
+            block = _packet(interface, raw, timestamp, wirelen)
+            try:
+                self._queue.put_nowait((name, prefix + block))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                return None
+            if name != self._current:
+                self._current, self._interfaces, self._opened = name, interfaces, time.monotonic()
+                self._linktypes[name] = []
+            if linktype not in interfaces:
+                interfaces[linktype] = interface
+                self._linktypes[name].append(linktype)
+            offset = size + len(prefix)
+            self._size = offset + len(block)
+            self.stats['archived'] += 1
+        return {'file': name, 'offset': offset}
+
+    def flush(self, timeout=None):
+        """Block until every frame queued so far is written."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _run(self):
+        current, f = None, None
+        while True:
+            item = self._queue.get()
+            try:
+                while True:
+                    if item is None:
+                        if f is not None:
+                            f.close()
+                        return
+                    if isinstance(item, threading.Event):
+                        if f is not None:
+                            f.flush()
+                        item.set()
+                    else:
+                        name, data = item
+                        if name != current:
+                            if f is not None:
+                                f.close()
+                            f = open(os.path.join(self.path, name), 'ab')
+                            current = name
+                            self._rotated(name)
+                        f.write(data)
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if f is not None:
+                    f.flush()
+            except OSError as e:
+                self.stats['errors'] += 1
+                logger.error(f"Frame archive failed to write {current}: {str(e)}")
+
+    def _rotated(self, name):
+        """Record a newly opened file and delete the oldest beyond max_files."""
+        self._files.append(name)
+        self.stats['rotated'] += 1
+        while len(self._files) > self.max_files:
+            oldest = self._files.popleft()
+            self._linktypes.pop(oldest, None)
+            try:
+                os.remove(os.path.join(self.path, oldest))
+            except FileNotFoundError:
+                pass
+
+    def _file_linktypes(self, name, f):
+        """Linktype per interface id of an archive file, read from its IDBs."""
+        linktypes = self._linktypes.get(name)
+        if linktypes is not None:
+            return linktypes
+        linktypes = []
+        offset = 0
+        while True:
+            f.seek(offset)
+            header = f.read(IDB.size)
+            if len(header) < BLOCK.size:
+                break
+            block_type, length = BLOCK.unpack_from(header)
+            if block_type == IDB_TYPE and len(header) == IDB.size:
+                linktypes.append(IDB.unpack(header)[2])
+            if length < BLOCK.size:
+                break
+            offset += length
+        self._linktypes[name] = linktypes
+        return linktypes
+
+    def frames(self, refs):
+        """``(timestamp, linktype, raw, wirelen)`` of each archived frame
+        reference, or None where the file has been rotated out."""
+        if any(ref and ref['file'] == self._current for ref in refs):
+            self.flush(timeout=5)
+        result = []
+        handles = {}
+        try:
+            for ref in refs:
+                result.append(self._read(ref, handles) if ref else None)
+        finally:
+            for f in handles.values():
+                f.close()
+        return result
+
+    def _read(self, ref, handles):
+        name = os.path.basename(ref['file'])
+        f = handles.get(name)
+        if f is None:
+            try:
+                f = handles[name] = open(os.path.join(self.path, name), 'rb')
+            except FileNotFoundError:
+                return None
+        f.seek(ref['offset'])
+        header = f.read(EPB.size)
+        if len(header) < EPB.size:
+            return None
+        block_type, _, interface, high, low, caplen, wirelen = EPB.unpack(header)
+        if block_type != EPB_TYPE:
+            return None
+        raw = f.read(caplen)
+        linktypes = self._file_linktypes(name, f)
+        linktype = linktypes[interface] if interface < len(linktypes) else 1
+        return ((high << 32 | low) / 1000000, linktype, raw, wirelen)
+
+    def status(self):
+        return dict(self.stats, path=self.path, current=self._current, files=len(self._files),
+                    max_files=self.max_files, queued=self._queue.qsize())
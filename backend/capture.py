@@ -1,26 +1,41 @@
-import threading
-from scapy.all import sniff, IP, TCP, UDP, ICMP, ARP, Raw, DNS, DHCP
-import time
+import re
+from scapy.all import Ether, IP, IPv6, TCP, UDP, ICMP, ARP, Raw, DNS, DHCP
+from scapy.packet import NoPayload
 from datetime import datetime
 import logging
 import socket
-import requests
-import json
 import ipaddress
 import hashlib
 import base64
+from collections import Counter
+from math import log2
+from enrichment import IpApiProvider
+from services import ServiceTable
+from metrics import Counter as MetricCounter, Histogram, FAST_BUCKETS
 
+try:
+    import numpy as np
+except ImportError:  # optional: entropy falls back to collections.Counter
+    np = None
 
-def make_json_serializable(obj):
-    """Recursively convert objects to JSON-serializable structures."""
-    if isinstance(obj, (str, int, float, bool)) or obj is None:
-        return obj
-    if isinstance(obj, dict):
-        return {k: make_json_serializable(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [make_json_serializable(v) for v in obj]
-    return str(obj)
+# Background enricher for hostnames/geolocation (see set_enricher)
+enricher = None
+# Geolocation backend used by get_ip_info (see set_geo_provider)
+geo_provider = IpApiProvider()
+# Port -> application protocol table (see set_service_table)
+service_table = ServiceTable.load()
+# Payload bytes used for entropy/readability/hash (see set_analysis_window)
+analysis_window = None
 
+
+PACKET_SECONDS = Histogram('osi_packet_to_dict_seconds',
+                           'Time to dissect and analyze one packet', FAST_BUCKETS)
+PACKET_ERRORS = MetricCounter('osi_packet_errors_total', 'Packets whose analysis raised an error')
+FUNCTION_SECONDS = Histogram('osi_function_seconds', 'Latency of blocking lookup calls',
+                             labelnames=('function',))
+
+
+@FUNCTION_SECONDS.labels('dns_lookup').time()
 def dns_lookup(ip_address):
     """Perform reverse DNS lookup for an IP address."""
     try:
@@ -29,25 +44,50 @@ def dns_lookup(ip_address):
     except (socket.herror, socket.gaierror):
         return None
 
+@FUNCTION_SECONDS.labels('get_ip_info').time()
 def get_ip_info(ip_address):
-    """Get geolocation and ISP information for an IP address."""
-    try:
-        # Using ip-api.com for geolocation (free tier)
-        response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=2)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('status') == 'success':
-                return {
-                    'country': data.get('country'),
-                    'region': data.get('regionName'),
-                    'city': data.get('city'),
-                    'isp': data.get('isp'),
-                    'org': data.get('org'),
-                    'timezone': data.get('timezone')
-                }
-    except (requests.RequestException, json.JSONDecodeError):
-        pass
-    return None
+    """Get geolocation and ISP information for an IP address (blocking)."""
+    # ip-api.com (free tier) unless an offline database was configured
+    return geo_provider.lookup(ip_address)
+
+def set_geo_provider(provider):
+    """Install the geolocation backend (any object with ``lookup(ip)``)."""
+    global geo_provider
+    geo_provider = provider
+
+def set_service_table(table):
+    """Install the ServiceTable used to classify application protocols."""
+    global service_table
+    service_table = table
+
+def set_analysis_window(size):
+    """Only analyze the first ``size`` payload bytes (None or 0: the whole payload)."""
+    global analysis_window
+    analysis_window = size or None
+
+def set_enricher(new_enricher):
+    """Install the Enricher used by packet_to_dict (None disables enrichment)."""
+    global enricher
+    enricher = new_enricher
+
+def enrichment_targets(packet_info):
+    """Return ``{side: ip}`` for the public addresses of a TCP packet dict."""
+    if packet_info.get('protocol') != 6:
+        return {}
+    targets = {}
+    for side in ('src', 'dst'):
+        ip = packet_info.get(f"{side}_ip")
+        if ip and not is_private_ip(ip):
+            targets[side] = ip
+    return targets
+
+def schedule_enrichment(packet_info):
+    """Queue hostname/geolocation lookups for a dissected packet."""
+    if enricher is None:
+        return
+    targets = enrichment_targets(packet_info)
+    if targets:
+        enricher.enrich(packet_info, targets)
 
 def is_private_ip(ip):
     """Check if IP is private/local."""
@@ -64,15 +104,16 @@ def analyze_tcp_flags(flags):
         'A': 'ACK', 'U': 'URG', 'E': 'ECE', 'C': 'CWR'
     }
     
+    flags = str(flags)
     flag_info = {
-        'raw': str(flags),
+        'raw': flags,
         'flags': [],
         'connection_state': 'unknown',
         'security_concern': False
     }
     
     for flag_char, flag_name in flag_map.items():
-        if flag_char in str(flags):
+        if flag_char in flags:
             flag_info['flags'].append(flag_name)
     
     # Determine connection state
@@ -90,6 +131,97 @@ def analyze_tcp_flags(flags):
     
     return flag_info
 
+class PacketView:
+    """Decoded view of a packet built in a single walk of its layer chain.
+
+    Holds a reference to the first instance of each layer the analyzers
+    care about plus their key fields, so no analyzer has to call
+    ``haslayer()``/``packet[Layer]`` (each of which walks the chain again).
+    """
+    __slots__ = ('packet', 'ether', 'ip', 'ipv6', 'arp', 'tcp', 'udp', 'icmp', 'raw',
+                 'transport', 'ip_fields', 'transport_fields', 'src_ip', 'dst_ip',
+                 'sport', 'dport', 'tcp_flags', 'payload', 'window', 'length', 'wire_length',
+                 'entropy')
+
+    # Layer class -> slot name; exact classes, like haslayer()
+    _LAYER_SLOTS = {Ether: 'ether', IP: 'ip', IPv6: 'ipv6', ARP: 'arp', TCP: 'tcp',
+                    UDP: 'udp', ICMP: 'icmp', Raw: 'raw'}
+
+    def __init__(self, packet):
+        if packet.raw_packet_cache is None:
+            # Crafted rather than captured: dissect the built bytes so that
+            # computed fields (ihl, len, chksum) are filled in
+            rebuilt = packet.__class__(bytes(packet))
+            rebuilt.time = packet.time
+            rebuilt.wirelen = packet.wirelen
+            packet = rebuilt
+        self.packet = packet
+        self.ether = self.ip = self.ipv6 = self.arp = None
+        self.tcp = self.udp = self.icmp = self.raw = None
+        slots = self._LAYER_SLOTS
+        layer = packet
+        while not isinstance(layer, NoPayload):
+            name = slots.get(layer.__class__)
+            if name is not None and getattr(self, name) is None:
+                setattr(self, name, layer)
+            layer = layer.payload
+
+        ip = self.ip
+        self.ip_fields = ip_fields = layer_fields(ip) if ip is not None else None
+        self.src_ip = ip_fields['src'] if ip is not None else None
+        self.dst_ip = ip_fields['dst'] if ip is not None else None
+        self.transport = transport = self.tcp if self.tcp is not None else self.udp
+        if transport is not None:
+            self.transport_fields = fields = layer_fields(transport)
+            self.sport = fields['sport']
+            self.dport = fields['dport']
+        else:
+            self.transport_fields = None
+            self.sport = self.dport = None
+        self.tcp_flags = str(self.transport_fields['flags']) if self.tcp is not None else None
+        self.payload = payload = self.raw.load if self.raw is not None else None
+        # What entropy/readability/hashing look at: bounded by the analysis window
+        window = analysis_window
+        self.window = payload[:window] if window and payload is not None and len(payload) > window else payload
+        # A dissected packet keeps the bytes it came from; len() would rebuild them
+        original = packet.original
+        self.length = len(original) if original is not None else len(packet)
+        # Frames cut by a snaplen (live or in the pcap) keep their on-the-wire length
+        wirelen = packet.wirelen
+        self.wire_length = wirelen if wirelen and wirelen > self.length else self.length
+        self.entropy = None
+
+    @property
+    def truncated(self):
+        return self.wire_length > self.length
+
+    def payload_entropy(self):
+        """Entropy of the analyzed payload bytes, computed at most once per packet."""
+        if self.entropy is None:
+            self.entropy = calculate_entropy(self.window)
+        return self.entropy
+
+
+def layer_fields(layer):
+    """Field values of one layer as a plain dict (no per-field __getattr__)."""
+    fields = layer.fields
+    if len(fields) < len(layer.fields_desc):
+        # Built by hand rather than dissected: fill in the defaults
+        fields = dict(layer.default_fields, **fields)
+    return fields
+
+def classify_service(view):
+    """Look up the application protocol of a PacketView in the service table."""
+    if view.tcp is not None:
+        return service_table.lookup('tcp', view.sport, view.dport)
+    if view.udp is not None:
+        return service_table.lookup('udp', view.sport, view.dport)
+    return None
+
+def as_view(packet):
+    """Return ``packet`` as a PacketView, decoding it if needed."""
+    return packet if isinstance(packet, PacketView) else PacketView(packet)
+
 def detect_protocol_details(packet):
     """Detect detailed protocol information and potential security issues."""
     details = {
@@ -101,74 +233,39 @@ def detect_protocol_details(packet):
         'network_behavior': []
     }
     
+    view = as_view(packet)
+    
     # Build protocol stack
-    if packet.haslayer('Ether'):
+    if view.ether is not None:
         details['protocol_stack'].append('Ethernet')
-    if packet.haslayer(IP):
-        details['protocol_stack'].append(f"IPv{packet[IP].version}")
-    if packet.haslayer(TCP):
+    if view.ip is not None:
+        details['protocol_stack'].append(f"IPv{view.ip_fields['version']}")
+    if view.tcp is not None:
         details['protocol_stack'].append('TCP')
-    elif packet.haslayer(UDP):
+    elif view.udp is not None:
         details['protocol_stack'].append('UDP')
-    elif packet.haslayer(ICMP):
+    elif view.icmp is not None:
         details['protocol_stack'].append('ICMP')
     
     # Analyze application layer
-    if packet.haslayer(TCP):
-        port = packet[TCP].dport
-        sport = packet[TCP].sport
-        
-        if port == 443 or sport == 443:
-            details['application_protocol'] = 'HTTPS'
-            details['encryption_status'] = 'encrypted'
-        elif port == 80 or sport == 80:
-            details['application_protocol'] = 'HTTP'
-            details['encryption_status'] = 'plaintext'
-            details['security_indicators'].append('unencrypted_web_traffic')
-        elif port == 22 or sport == 22:
-            details['application_protocol'] = 'SSH'
-            details['encryption_status'] = 'encrypted'
-        elif port == 21 or sport == 21:
-            details['application_protocol'] = 'FTP'
-            details['encryption_status'] = 'plaintext'
-            details['security_indicators'].append('insecure_file_transfer')
-        elif port == 23 or sport == 23:
-            details['application_protocol'] = 'Telnet'
-            details['encryption_status'] = 'plaintext'
-            details['security_indicators'].append('insecure_terminal_access')
-        elif port == 25 or sport == 25:
-            details['application_protocol'] = 'SMTP'
-            details['encryption_status'] = 'potentially_plaintext'
-        elif port == 53 or sport == 53:
-            details['application_protocol'] = 'DNS'
-        elif port in [993, 995] or sport in [993, 995]:
-            details['application_protocol'] = 'Secure Email'
-            details['encryption_status'] = 'encrypted'
-        elif port in [3389] or sport in [3389]:
-            details['application_protocol'] = 'RDP'
-            details['security_indicators'].append('remote_desktop_access')
-    
-    elif packet.haslayer(UDP):
-        port = packet[UDP].dport
-        sport = packet[UDP].sport
-        
-        if port == 53 or sport == 53:
-            details['application_protocol'] = 'DNS'
-        elif port in [67, 68] or sport in [67, 68]:
-            details['application_protocol'] = 'DHCP'
-        elif port == 123 or sport == 123:
-            details['application_protocol'] = 'NTP'
-        elif port == 161 or sport == 161:
-            details['application_protocol'] = 'SNMP'
+    service = classify_service(view)
+    if service is not None:
+        details['application_protocol'] = service.name
+        if service.encryption:
+            details['encryption_status'] = service.encryption
+        if service.indicator:
+            details['security_indicators'].append(service.indicator)
     
     # Analyze payload
-    if packet.haslayer(Raw):
-        payload = packet[Raw].load
+    if view.raw is not None:
+        payload = view.payload
         details['payload_info'] = {
             'size': len(payload),
-            'entropy': calculate_entropy(payload),
-            'contains_strings': has_readable_strings(payload)
+            'entropy': view.payload_entropy(),
+            'contains_strings': has_readable_strings(view.window)
         }
+        if len(view.window) < len(payload):
+            details['payload_info']['analyzed_bytes'] = len(view.window)
         
         # Check for suspicious patterns
         if details['payload_info']['entropy'] > 7.5:
@@ -177,63 +274,91 @@ def detect_protocol_details(packet):
     return details
 
 def calculate_entropy(data):
-    """Calculate Shannon entropy of data."""
+    """Calculate Shannon entropy of data in bits per byte (0.0 to 8.0)."""
     if not data:
-        return 0
+        return 0.0
+    
+    length = len(data)
+    if np is not None:
+        counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        p = counts[counts > 0] / length
+        return float((p * np.log2(1 / p)).sum())
+    
+    # Single pass byte histogram (Counter counts bytes in C)
+    return sum(c / length * log2(length / c) for c in Counter(data).values())
+
+def calculate_entropy_batch(payloads):
+    """Calculate Shannon entropy for a list of payloads in one call."""
+    if np is None or not payloads:
+        return [calculate_entropy(p) for p in payloads]
     
-    entropy = 0
-    for x in range(256):
-        p_x = float(data.count(bytes([x]))) / len(data)
-        if p_x > 0:
-            entropy += - p_x * (p_x.bit_length() - 1)
-    return entropy
+    lengths = np.fromiter((len(p) for p in payloads), dtype=np.int64, count=len(payloads))
+    data = np.frombuffer(b''.join(payloads), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(payloads), dtype=np.int64), lengths)
+    # One 2-D histogram for the whole batch: row * 256 + byte value
+    counts = np.bincount(rows * 256 + data, minlength=len(payloads) * 256).reshape(-1, 256)
+    p = counts / np.maximum(lengths, 1)[:, None]
+    terms = p * np.log2(1 / np.where(counts > 0, p, 1))
+    return terms.sum(axis=1).tolist()
+
+# Printable ASCII (what str.isprintable() accepts below 0x80)
+_PRINTABLE_ASCII = bytes(range(0x20, 0x7f))
+_ASCII_RUNS = re.compile('[\x00-\x7f]+')
 
 def has_readable_strings(data, min_length=4):
     """Check if payload contains readable strings."""
     try:
+        if data.isascii():
+            # Pure ASCII decodes 1:1, so count in C instead of per character
+            if not data:
+                return False
+            readable_chars = len(data) - len(data.translate(None, _PRINTABLE_ASCII))
+            return readable_chars / len(data) > 0.7
         text = data.decode('utf-8', errors='ignore')
-        readable_chars = sum(1 for c in text if c.isprintable())
-        return readable_chars / len(text) > 0.7 if text else False
+        if not text:
+            return False
+        # ASCII bytes survive the decode one to one, so only the (few)
+        # multi-byte characters are checked one at a time
+        readable_chars = len(data) - len(data.translate(None, _PRINTABLE_ASCII))
+        readable_chars += sum(1 for c in _ASCII_RUNS.sub('', text) if c.isprintable())
+        return readable_chars / len(text) > 0.7
     except:
         return False
 
-def analyze_network_behavior(packet, src_ip, dst_ip):
+def analyze_network_behavior(packet, src_ip=None, dst_ip=None):
     """Analyze network behavior patterns."""
     behaviors = []
+    view = as_view(packet)
     
-    if packet.haslayer(IP):
+    if view.ip is not None:
+        ip_fields = view.ip_fields
         # Check for suspicious TTL values
-        ttl = packet[IP].ttl
+        ttl = ip_fields['ttl']
         if ttl < 32:
             behaviors.append('low_ttl_detected')
         elif ttl > 128:
             behaviors.append('high_ttl_detected')
         
         # Check for fragmentation
-        if packet[IP].flags.MF or packet[IP].frag > 0:
+        if ip_fields['flags'].MF or ip_fields['frag'] > 0:
             behaviors.append('fragmented_packet')
     
-    if packet.haslayer(TCP):
-        # Check for port scanning indicators
-        flags = str(packet[TCP].flags)
-        if 'S' in flags and 'A' not in flags:
-            behaviors.append('syn_scan_attempt')
-        elif flags == 'F':
+    if view.tcp is not None:
+        # Flag combinations no real connection sends. SYN scans look like any
+        # connection opening one packet at a time; scans.ScanDetector finds
+        # them across packets.
+        flags = view.tcp_flags
+        if flags == 'F':
             behaviors.append('fin_scan_attempt')
-        elif flags == 'X':
+        elif flags == '':
+            behaviors.append('null_scan_attempt')
+        elif 'F' in flags and 'P' in flags and 'U' in flags and 'A' not in flags:
             behaviors.append('xmas_scan_attempt')
     
     return behaviors
 
 logger = logging.getLogger(__name__)
 
-# Single cache object (removed duplicate definition)
-packet_cache = {
-    'packets': [],
-    'last_update': None,
-    'lock': threading.Lock()
-}
-
 def analyze_osi_layers(packet):
     """Analyze packet and determine OSI layer information."""
     layers = {
@@ -246,64 +371,56 @@ def analyze_osi_layers(packet):
         'application': None           # Layer 7
     }
     
+    view = as_view(packet)
+    
     # Layer 2 - Data Link
-    if packet.haslayer('Ether'):
+    if view.ether is not None:
         layers['data_link'] = 'Ethernet'
-    elif packet.haslayer('ARP'):
+    elif view.arp is not None:
         layers['data_link'] = 'ARP'
     
     # Layer 3 - Network
-    if packet.haslayer(IP):
-        layers['network'] = f"IP (v{packet[IP].version})"
-    elif packet.haslayer('IPv6'):
+    if view.ip is not None:
+        layers['network'] = f"IP (v{view.ip_fields['version']})"
+    elif view.ipv6 is not None:
         layers['network'] = 'IPv6'
-    elif packet.haslayer(ARP):
+    elif view.arp is not None:
         layers['network'] = 'ARP'
     
     # Layer 4 - Transport
-    if packet.haslayer(TCP):
-        layers['transport'] = f"TCP (Port: {packet[TCP].dport})"
-    elif packet.haslayer(UDP):
-        layers['transport'] = f"UDP (Port: {packet[UDP].dport})"
-    elif packet.haslayer(ICMP):
+    if view.tcp is not None:
+        layers['transport'] = f"TCP (Port: {view.dport})"
+    elif view.udp is not None:
+        layers['transport'] = f"UDP (Port: {view.dport})"
+    elif view.icmp is not None:
         layers['transport'] = 'ICMP'
     
-    # Layer 7 - Application (simplified detection)
-    if packet.haslayer(TCP):
-        port = packet[TCP].dport
-        if port == 80 or packet[TCP].sport == 80:
-            layers['application'] = 'HTTP'
-        elif port == 443 or packet[TCP].sport == 443:
-            layers['application'] = 'HTTPS'
-        elif port == 21 or packet[TCP].sport == 21:
-            layers['application'] = 'FTP'
-        elif port == 22 or packet[TCP].sport == 22:
-            layers['application'] = 'SSH'
-        elif port == 25 or packet[TCP].sport == 25:
-            layers['application'] = 'SMTP'
-        elif port == 53 or packet[TCP].sport == 53:
-            layers['application'] = 'DNS'
-    elif packet.haslayer(UDP):
-        port = packet[UDP].dport
-        if port == 53 or packet[UDP].sport == 53:
-            layers['application'] = 'DNS'
-        elif port == 67 or port == 68:
-            layers['application'] = 'DHCP'
+    # Layer 7 - Application
+    service = classify_service(view)
+    if service is not None:
+        layers['application'] = service.name
     
     return layers
 
+@PACKET_SECONDS.time()
 def packet_to_dict(packet, packet_id):
-    """Convert packet to dictionary with comprehensive technical analysis."""
+    """Convert packet to dictionary with comprehensive technical analysis.
+
+    The result holds only JSON primitives (str, int, float, bool, None,
+    dicts and lists), so it can be encoded as is.
+    """
     try:
-        layers = analyze_osi_layers(packet)
-        protocol_details = detect_protocol_details(packet)
+        view = PacketView(packet)
+        layers = analyze_osi_layers(view)
+        protocol_details = detect_protocol_details(view)
         
         # Basic packet info with enhanced metadata
         packet_info = {
             "id": packet_id,
-            "timestamp": datetime.now().isoformat(),
-            "summary": packet.summary(),
-            "size": len(packet),
+            # Capture time (from the NIC or the pcap record), not analysis time
+            "timestamp": datetime.fromtimestamp(float(view.packet.time)).isoformat(),
+            "summary": view.packet.summary(),
+            "size": view.wire_length,
             "layers": layers,
             "protocol_analysis": protocol_details,
             "security_assessment": {
@@ -314,57 +431,63 @@ def packet_to_dict(packet, packet_id):
             "technical_details": {},
             "network_metrics": {}
         }
+        if view.truncated:
+            packet_info["truncated"] = {
+                "captured_length": view.length,
+                "wire_length": view.wire_length
+            }
         
         # Enhanced Network layer analysis
-        if packet.haslayer(IP):
-            ip_layer = packet[IP]
+        if view.ip is not None:
+            ip_fields = view.ip_fields
             packet_info.update({
-                "src_ip": ip_layer.src,
-                "dst_ip": ip_layer.dst,
-                "protocol": ip_layer.proto,
-                "ttl": ip_layer.ttl
+                "src_ip": view.src_ip,
+                "dst_ip": view.dst_ip,
+                "protocol": ip_fields['proto'],
+                "ttl": ip_fields['ttl']
             })
             
             # Detailed IP analysis
+            ip_flags = ip_fields['flags']
             packet_info["technical_details"]["ip"] = {
-                "version": ip_layer.version,
-                "header_length": ip_layer.ihl * 4,
-                "type_of_service": ip_layer.tos,
-                "total_length": ip_layer.len,
-                "identification": ip_layer.id,
+                "version": ip_fields['version'],
+                "header_length": ip_fields['ihl'] * 4,
+                "type_of_service": ip_fields['tos'],
+                "total_length": ip_fields['len'],
+                "identification": ip_fields['id'],
                 "flags": {
-                    "dont_fragment": bool(ip_layer.flags.DF),
-                    "more_fragments": bool(ip_layer.flags.MF)
+                    "dont_fragment": bool(ip_flags.DF),
+                    "more_fragments": bool(ip_flags.MF)
                 },
-                "fragment_offset": ip_layer.frag,
-                "checksum": ip_layer.chksum
+                "fragment_offset": ip_fields['frag'],
+                "checksum": ip_fields['chksum']
             }
             
             # Network behavior analysis
-            behaviors = analyze_network_behavior(packet, ip_layer.src, ip_layer.dst)
+            behaviors = analyze_network_behavior(view)
             if behaviors:
                 packet_info["security_assessment"]["network_behaviors"] = behaviors
-                if any(b in ['syn_scan_attempt', 'fin_scan_attempt'] for b in behaviors):
+                if any(b.endswith('_scan_attempt') for b in behaviors):
                     packet_info["security_assessment"]["risk_level"] = "medium"
         
         # Enhanced Transport layer analysis
-        if packet.haslayer(TCP):
-            tcp_layer = packet[TCP]
-            tcp_analysis = analyze_tcp_flags(tcp_layer.flags)
+        if view.tcp is not None:
+            tcp_fields = view.transport_fields
+            tcp_analysis = analyze_tcp_flags(view.tcp_flags)
             
             packet_info.update({
-                "src_port": int(tcp_layer.sport),
-                "dst_port": int(tcp_layer.dport),
-                "flags": str(tcp_layer.flags)
+                "src_port": int(view.sport),
+                "dst_port": int(view.dport),
+                "flags": view.tcp_flags
             })
             
             # Detailed TCP analysis
             packet_info["technical_details"]["tcp"] = {
-                "sequence_number": tcp_layer.seq,
-                "acknowledgment_number": tcp_layer.ack,
-                "window_size": tcp_layer.window,
-                "checksum": tcp_layer.chksum,
-                "urgent_pointer": tcp_layer.urgptr,
+                "sequence_number": tcp_fields['seq'],
+                "acknowledgment_number": tcp_fields['ack'],
+                "window_size": tcp_fields['window'],
+                "checksum": tcp_fields['chksum'],
+                "urgent_pointer": tcp_fields['urgptr'],
                 "flags_analysis": tcp_analysis,
                 "connection_state": tcp_analysis['connection_state']
             }
@@ -373,42 +496,21 @@ def packet_to_dict(packet, packet_id):
             if tcp_analysis['security_concern']:
                 packet_info["security_assessment"]["risk_level"] = "high"
             
-            # DNS lookup and geolocation for external IPs
-            if packet.haslayer(IP):
-                src_ip = packet[IP].src
-                dst_ip = packet[IP].dst
-                
-                if src_ip and not is_private_ip(src_ip):
-                    src_hostname = dns_lookup(src_ip)
-                    if src_hostname:
-                        packet_info["src_hostname"] = src_hostname
-                    src_geo = get_ip_info(src_ip)
-                    if src_geo:
-                        packet_info["src_geo"] = src_geo
-                
-                if dst_ip and not is_private_ip(dst_ip):
-                    dst_hostname = dns_lookup(dst_ip)
-                    if dst_hostname:
-                        packet_info["dst_hostname"] = dst_hostname
-                    dst_geo = get_ip_info(dst_ip)
-                    if dst_geo:
-                        packet_info["dst_geo"] = dst_geo
-                    
-        elif packet.haslayer(UDP):
-            udp_layer = packet[UDP]
+        elif view.udp is not None:
+            udp_fields = view.transport_fields
             packet_info.update({
-                "src_port": int(udp_layer.sport),
-                "dst_port": int(udp_layer.dport)
+                "src_port": int(view.sport),
+                "dst_port": int(view.dport)
             })
             
             # Detailed UDP analysis
             packet_info["technical_details"]["udp"] = {
-                "length": udp_layer.len,
-                "checksum": udp_layer.chksum
+                "length": udp_fields['len'],
+                "checksum": udp_fields['chksum']
             }
             
-        elif packet.haslayer(ICMP):
-            icmp_layer = packet[ICMP]
+        elif view.icmp is not None:
+            icmp_layer = view.icmp
             packet_info["technical_details"]["icmp"] = {
                 "type": icmp_layer.type,
                 "code": icmp_layer.code,
@@ -417,22 +519,27 @@ def packet_to_dict(packet, packet_id):
             }
         
         # ARP specific info
-        if packet.haslayer(ARP):
+        arp_layer = view.arp
+        if arp_layer is not None:
             packet_info.update({
-                "arp_op": str(packet[ARP].op),
-                "src_mac": str(packet[ARP].hwsrc),
-                "dst_mac": str(packet[ARP].hwdst)
+                "arp_op": str(arp_layer.op),
+                "src_mac": str(arp_layer.hwsrc),
+                "dst_mac": str(arp_layer.hwdst)
             })
         
-        # Payload analysis
-        if packet.haslayer(Raw):
-            payload = packet[Raw].load
+        # Payload analysis (reuses what detect_protocol_details computed)
+        payload = view.payload
+        if payload is not None:
+            payload_info = protocol_details['payload_info']
             packet_info["payload_analysis"] = {
                 "size": len(payload),
-                "entropy": calculate_entropy(payload),
-                "has_readable_content": has_readable_strings(payload),
-                "hash_md5": hashlib.md5(payload).hexdigest()[:16]  # First 16 chars
+                "entropy": payload_info['entropy'],
+                "has_readable_content": payload_info['contains_strings'],
+                "hash_md5": hashlib.md5(view.window).hexdigest()[:16]  # First 16 chars
             }
+            if 'analyzed_bytes' in payload_info:
+                # Entropy, readability and hash only cover the analysis window
+                packet_info["payload_analysis"]["analyzed_bytes"] = payload_info['analyzed_bytes']
             
             # Security assessment based on payload
             entropy = packet_info["payload_analysis"]["entropy"]
@@ -442,9 +549,10 @@ def packet_to_dict(packet, packet_id):
                     packet_info["security_assessment"]["risk_level"] = "medium"
         
         # Calculate network metrics
+        payload_size = len(payload) if payload is not None else 0
         packet_info["network_metrics"] = {
-            "overhead_bytes": len(packet) - (len(packet[Raw].load) if packet.haslayer(Raw) else 0),
-            "efficiency": (len(packet[Raw].load) / len(packet) * 100) if packet.haslayer(Raw) else 0,
+            "overhead_bytes": view.length - payload_size,
+            "efficiency": (payload_size / view.length * 100) if payload is not None else 0,
             "protocol_stack_depth": len(protocol_details['protocol_stack'])
         }
         
@@ -455,68 +563,17 @@ def packet_to_dict(packet, packet_id):
         elif risk_factors >= 1:
             packet_info["security_assessment"]["risk_level"] = "medium"
         
-        return make_json_serializable(packet_info)
+        # DNS lookup and geolocation for external IPs happen in the background
+        schedule_enrichment(packet_info)
+        return packet_info
         
     except Exception as e:
+        PACKET_ERRORS.inc()
         logger.error(f"Error processing packet {packet_id}: {str(e)}")
-        return make_json_serializable({
+        return {
             "id": packet_id,
             "timestamp": datetime.now().isoformat(),
             "summary": "Error processing packet",
             "size": len(packet) if packet else 0,
             "error": str(e)
-        })
-
-def capture_packets(count=10, timeout=10):
-    """Capture network packets with timeout."""
-    try:
-        logger.info(f"Starting packet capture (count: {count}, timeout: {timeout}s)")
-        packets = sniff(count=count, timeout=timeout)
-        
-        packet_list = []
-        for i, packet in enumerate(packets, 1):
-            packet_dict = packet_to_dict(packet, i)
-            packet_list.append(packet_dict)
-        
-        # Update cache
-        with packet_cache['lock']:
-            packet_cache['packets'] = packet_list
-            packet_cache['last_update'] = datetime.now()
-        
-        logger.info(f"Captured {len(packet_list)} packets")
-        return packet_list
-        
-    except Exception as e:
-        logger.error(f"Error capturing packets: {str(e)}")
-        return []
-
-def get_cached_packets(count=10, max_age_seconds=30):
-    """Get cached packets if they're recent enough, otherwise capture new ones."""
-    with packet_cache['lock']:
-        now = datetime.now()
-        
-        # Check if cache is valid
-        if (packet_cache['last_update'] and 
-            (now - packet_cache['last_update']).seconds < max_age_seconds and
-            packet_cache['packets']):
-            logger.info(f"Returning {len(packet_cache['packets'])} cached packets")
-            # Força serialização dos pacotes do cache (recursivo)
-            return [make_json_serializable(pkt) for pkt in packet_cache['packets'][:count]]
-    
-    # Cache is stale or empty, capture new packets
-    return capture_packets(count)
-
-def start_background_capture(interval=30, count=10):
-    """Start background packet capture to keep cache fresh."""
-    def capture_loop():
-        while True:
-            try:
-                capture_packets(count)
-                time.sleep(interval)
-            except Exception as e:
-                logger.error(f"Background capture error: {str(e)}")
-                time.sleep(5)  # Wait before retrying
-    
-    thread = threading.Thread(target=capture_loop, daemon=True)
-    thread.start()
-    logger.info("Background packet capture started")
\ No newline at end of file
+        }
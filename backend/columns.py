@@ -0,0 +1,471 @@
+import ipaddress
+import socket
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # optional: select() then filters with array.index and comprehensions
+    np = None
+
+RISK_LEVELS = ('low', 'medium', 'high')
+TCP_FLAGS = 'FSRPAUEC'  # bit i of the tcp_flags column is TCP_FLAGS[i]
+_IPV4_MAPPED = 0xFFFF << 32
+
+# Column name -> array typecode; 73 bytes per packet in total
+SCHEMA = (
+    ('seq', 'Q'),
+    ('timestamp', 'd'),
+    ('src_hi', 'Q'), ('src_lo', 'Q'),  # addresses as 128-bit ints, IPv4 mapped into ::ffff:0:0/96
+    ('dst_hi', 'Q'), ('dst_lo', 'Q'),
+    ('src_port', 'H'),
+    ('dst_port', 'H'),
+    ('size', 'I'),
+    ('payload_size', 'I'),
+    ('entropy', 'f'),
+    ('protocol', 'B'),
+    ('ttl', 'B'),
+    ('tcp_flags', 'B'),
+    ('risk', 'B'),
+    ('ip_version', 'B'),
+    ('application', 'H'),  # interned string ids, 0 = none
+    ('stack', 'H'),
+)
+ROW_BYTES = sum(array(code).itemsize for _, code in SCHEMA)
+# Rows per block of the timestamp zone map, and per bulk predicate evaluation
+SCAN_BLOCK = 4096
+
+
+def ip_to_int(ip):
+    """Address string -> 128-bit int (IPv4 mapped into ::ffff:0:0/96)."""
+    try:
+        return _IPV4_MAPPED | int.from_bytes(socket.inet_aton(ip), 'big')
+    except OSError:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+
+
+def int_to_ip(value):
+    if value >> 32 == 0xFFFF:
+        return socket.inet_ntoa((value & 0xFFFFFFFF).to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+
+
+def address_range(text):
+    """``(low, high)`` ints of an address or CIDR network, as ip_to_int stores them."""
+    try:
+        network = ipaddress.ip_network(str(text).strip(), strict=False)
+    except ValueError:
+        raise ValueError(f"Invalid address or network: {text!r}")
+    low, high = int(network.network_address), int(network.broadcast_address)
+    if network.version == 4:
+        return _IPV4_MAPPED | low, _IPV4_MAPPED | high
+    return low, high
+
+
+def encode_flags(flags):
+    bits = 0
+    for letter in flags or '':
+        index = TCP_FLAGS.find(letter)
+        if index >= 0:
+            bits |= 1 << index
+    return bits
+
+
+def decode_flags(bits):
+    return ''.join(letter for i, letter in enumerate(TCP_FLAGS) if bits >> i & 1)
+
+
+class Interner:
+    """Maps repeated strings (protocol names, stacks) to small ints; 0 is None."""
+
+    def __init__(self, limit=0xFFFF):
+        self.limit = limit
+        self._ids = {}
+        self._strings = [None]
+
+    def __len__(self):
+        return len(self._strings) - 1
+
+    def intern(self, value):
+        if value is None:
+            return 0
+        index = self._ids.get(value)
+        if index is None:
+            if len(self._strings) > self.limit:
+                return 0
+            index = self._ids[value] = len(self._strings)
+            self._strings.append(value)
+        return index
+
+    def lookup(self, index):
+        return self._strings[index]
+
+
+class ColumnStore:
+    """Compact history of dissected packets, one typed array per field.
+
+    Where the engine's ring keeps the full analysis of the newest packets,
+    the store keeps the fields needed to query and aggregate a long history
+    (addresses, ports, sizes, protocol, flags, risk...) at ROW_BYTES per
+    packet, so a million packets fit in about 70 MB. Columns grow as
+    packets arrive; once ``capacity`` rows are held, the oldest row is
+    overwritten. Nested per-packet dicts are only built by records().
+    """
+
+    def __init__(self, capacity=1000000):
+        if capacity < 1:
+            raise ValueError("Store capacity must be positive")
+        self.capacity = capacity
+        self.columns = {name: array(code) for name, code in SCHEMA}
+        self.applications = Interner()
+        self.stacks = Interner()
+        self._start = 0  # physical index of the oldest row once the store has wrapped
+        # Timestamp range of each SCAN_BLOCK of physical rows (capture time is not
+        # monotonic: ingested pcaps bring their own), so select() can skip blocks
+        self._block_min = array('d')
+        self._block_max = array('d')
+        self._lock = threading.Lock()
+        self.stats = {'packets': 0, 'overwritten': 0}
+
+    def __len__(self):
+        return len(self.columns['seq'])
+
+    @property
+    def nbytes(self):
+        return sum(len(column) * column.itemsize for column in self.columns.values())
+
+    def add_packet(self, packet_dict):
+        """Append a packet_to_dict result as one row."""
+        src_ip = packet_dict.get('src_ip')
+        dst_ip = packet_dict.get('dst_ip')
+        src = ip_to_int(src_ip) if src_ip else 0
+        dst = ip_to_int(dst_ip) if dst_ip else 0
+        payload = packet_dict.get('payload_analysis') or {}
+        analysis = packet_dict.get('protocol_analysis') or {}
+        risk = (packet_dict.get('security_assessment') or {}).get('risk_level')
+        row = (
+            packet_dict.get('id', 0),
+            datetime.fromisoformat(packet_dict['timestamp']).timestamp(),
+            src >> 64, src & 0xFFFFFFFFFFFFFFFF,
+            dst >> 64, dst & 0xFFFFFFFFFFFFFFFF,
+            packet_dict.get('src_port') or 0,
+            packet_dict.get('dst_port') or 0,
+            packet_dict.get('size') or 0,
+            payload.get('size') or 0,
+            payload.get('entropy') or 0.0,
+            packet_dict.get('protocol') or 0,
+            packet_dict.get('ttl') or 0,
+            encode_flags(packet_dict.get('flags')),
+            RISK_LEVELS.index(risk) if risk in RISK_LEVELS else 0,
+            (4 if src >> 32 == 0xFFFF else 6) if src_ip else 0,
+            self.applications.intern(analysis.get('application_protocol')),
+            self.stacks.intern('/'.join(analysis.get('protocol_stack') or ()) or None),
+        )
+        timestamp = row[1]
+        with self._lock:
+            columns = self.columns
+            block_min, block_max = self._block_min, self._block_max
+            replacing = len(columns['seq']) == self.capacity
+            if not replacing:
+                index = len(columns['seq'])
+                for (name, _), value in zip(SCHEMA, row):
+                    columns[name].append(value)
+                if index % SCAN_BLOCK == 0:
+                    block_min.append(timestamp)
+                    block_max.append(timestamp)
+            else:
+                index = self._start
+                for (name, _), value in zip(SCHEMA, row):
+                    columns[name][index] = value
+                self._start = (index + 1) % self.capacity
+                self.stats['overwritten'] += 1
+            block = index // SCAN_BLOCK
+            if timestamp < block_min[block]:
+                block_min[block] = timestamp
+            if timestamp > block_max[block]:
+                block_max[block] = timestamp
+            end = min((block + 1) * SCAN_BLOCK, self.capacity)
+            if replacing and index == end - 1:
+                # Every row of the block was replaced: drop the old rows' range
+                times = columns['timestamp'][block * SCAN_BLOCK:end]
+                block_min[block], block_max[block] = min(times), max(times)
+            self.stats['packets'] += 1
+
+    def _physical(self, position):
+        return (self._start + position) % self.capacity
+
+    @property
+    def first_seq(self):
+        return self.columns['seq'][self._start] if len(self) else 0
+
+    @property
+    def last_seq(self):
+        return self.columns['seq'][self._physical(len(self) - 1)] if len(self) else 0
+
+    def _positions(self, since=None, limit=None, latest=None):
+        """Logical positions (0 = oldest row) selected by sequence number."""
+        count = len(self)
+        start = 0
+        if since is not None:
+            # Sequence numbers grow with position, so binary-search the logical order
+            start = bisect_right(_Logical(self.columns['seq'], self._start, count), since)
+        if latest is not None:
+            start = max(start, count - latest)
+        end = count if limit is None else min(count, start + limit)
+        return range(start, end)
+
+    def records(self, since=None, limit=None, latest=None):
+        """Materialize rows as packet dicts, in packet_to_dict's key layout.
+
+        ``since`` selects rows with a greater sequence number, ``latest``
+        the newest N rows; ``limit`` caps the count from the oldest selected
+        row. Rows come oldest first.
+        """
+        with self._lock:
+            columns = self.columns
+            return [self._record(columns, self._physical(p))
+                    for p in self._positions(since, limit, latest)]
+
+    def record(self, seq):
+        """The row with sequence number ``seq`` as a packet dict, or None."""
+        with self._lock:
+            count = len(self)
+            position = bisect_left(_Logical(self.columns['seq'], self._start, count), seq)
+            if position < count:
+                i = self._physical(position)
+                if self.columns['seq'][i] == seq:
+                    return self._record(self.columns, i)
+        return None
+
+    def select(self, after=None, limit=100, since=None, until=None, ip=None, src_ip=None,
+               dst_ip=None, port=None, src_port=None, dst_port=None, protocol=None, risk=None):
+        """Sequence numbers of the rows matching every given predicate.
+
+        ``ip`` (either side), ``src_ip`` and ``dst_ip`` are address_range()
+        tuples, ``port`` matches either side, ``risk`` a set of RISK_LEVELS indexes and ``since``/``until``
+        epoch seconds (``[since, until)``). With ``after``, the first
+        ``limit`` matches with a greater sequence number are returned (found
+        by binary search, then scanned forward); otherwise the newest
+        ``limit``. Both come oldest first, with whether more rows match.
+
+        Only the bounds are read under the lock: the scan runs block by
+        block without it, so capture keeps appending meanwhile. Matches
+        overwritten during the scan are dropped at the end.
+        """
+        predicates = []  # (kind, column, value), cheapest and most selective first
+        if src_port is not None:
+            predicates.append(('eq', 'src_port', src_port))
+        if dst_port is not None:
+            predicates.append(('eq', 'dst_port', dst_port))
+        if port is not None:
+            predicates.append(('either', ('src_port', 'dst_port'), port))
+        if protocol is not None:
+            predicates.append(('eq', 'protocol', protocol))
+            if not protocol:  # non-IP rows also store 0
+                predicates.append(('in', 'ip_version', (4, 6)))
+        if risk is not None:
+            predicates.append(('in', 'risk', tuple(risk)))
+        for sides, bounds in (((('src_hi', 'src_lo'),), src_ip), ((('dst_hi', 'dst_lo'),), dst_ip),
+                              ((('src_hi', 'src_lo'), ('dst_hi', 'dst_lo')), ip)):
+            if bounds is not None:
+                predicates.append(('ip', sides, tuple(_split(bound) for bound in bounds)))
+
+        with self._lock:
+            start, count = self._start, len(self)
+            overwritten = self.stats['overwritten']
+            first = 0
+            if after is not None:
+                first = bisect_right(_Logical(self.columns['seq'], start, count), after)
+
+        seqs = self.columns['seq']
+        found = []  # (logical position, seq)
+        more = False
+        blocks = self._blocks(start, first, count)
+        for a, b in (blocks if after is not None else reversed(blocks)):
+            block = a // SCAN_BLOCK
+            low, high = self._block_min[block], self._block_max[block]
+            if (since is not None and high < since) or (until is not None and low >= until):
+                continue
+            checks = list(predicates)
+            if since is not None and low < since:
+                checks.append(('ge', 'timestamp', since))
+            if until is not None and high >= until:
+                checks.append(('lt', 'timestamp', until))
+            rows = self._match(a, b, checks)
+            if after is None:
+                rows.reverse()
+            for i in rows:
+                if len(found) == limit:
+                    more = True
+                    break
+                found.append(((i - start) % self.capacity, seqs[i]))
+            if more:
+                break
+
+        with self._lock:
+            replaced = self.stats['overwritten'] - overwritten
+        result = [seq for position, seq in found if position >= replaced]
+        if after is None:
+            result.reverse()
+        return result, more
+
+    def _blocks(self, start, first, count):
+        """Physical ``(a, b)`` row ranges for logical positions ``[first, count)``,
+        oldest first, split at SCAN_BLOCK boundaries."""
+        capacity = self.capacity
+        spans = []
+        a = (start + first) % capacity
+        remaining = count - first
+        while remaining > 0:
+            b = min(a + remaining, capacity, (a // SCAN_BLOCK + 1) * SCAN_BLOCK)
+            spans.append((a, b))
+            remaining -= b - a
+            a = b % capacity
+        return spans
+
+    def _match(self, a, b, checks):
+        """Physical indexes in ``[a, b)`` passing every check, ascending."""
+        c = self.columns
+        if not checks:
+            return list(range(a, b))
+        if np is not None:
+            mask = None
+            for kind, name, value in checks:
+                if kind == 'ip':
+                    test = None
+                    for hi, lo in name:
+                        side = _np_between(_np_slice(c[hi], a, b), _np_slice(c[lo], a, b), *value)
+                        test = side if test is None else test | side
+                elif kind == 'either':
+                    test = None
+                    for column in name:
+                        side = _np_slice(c[column], a, b) == value
+                        test = side if test is None else test | side
+                else:
+                    column = _np_slice(c[name], a, b)
+                    if kind == 'eq':
+                        test = column == value
+                    elif kind == 'in':
+                        test = np.isin(column, value)
+                    elif kind == 'ge':
+                        test = column >= value
+                    else:
+                        test = column < value
+                mask = test if mask is None else mask & test
+            return (np.flatnonzero(mask) + a).tolist()
+
+        # Without numpy: the first check selects candidates (array.index searches
+        # in C for equality), the others only look at those rows
+        kind, name, value = checks[0]
+        if kind in ('eq', 'in'):
+            rows = []
+            for wanted in (value,) if kind == 'eq' else value:
+                rows.extend(_find_all(c[name], wanted, a, b))
+            rows.sort()
+        elif kind == 'either':
+            rows = sorted(set().union(*(_find_all(c[column], value, a, b) for column in name)))
+        elif kind == 'ip':
+            (low, high), columns = value, [c[column][a:b] for side in name for column in side]
+            if len(name) == 1:
+                rows = [a + k for k, pair in enumerate(zip(*columns)) if low <= pair <= high]
+            else:
+                rows = [a + k for k, (sh, sl, dh, dl) in enumerate(zip(*columns))
+                        if low <= (sh, sl) <= high or low <= (dh, dl) <= high]
+        else:
+            rows = [a + k for k, t in enumerate(c[name][a:b]) if (t >= value if kind == 'ge' else t < value)]
+        for kind, name, value in checks[1:]:
+            if kind == 'ip':
+                low, high = value
+                rows = [i for i in rows if any(low <= (c[hi][i], c[lo][i]) <= high for hi, lo in name)]
+            elif kind == 'either':
+                rows = [i for i in rows if any(c[column][i] == value for column in name)]
+            else:
+                column = c[name]
+                if kind == 'eq':
+                    rows = [i for i in rows if column[i] == value]
+                elif kind == 'in':
+                    rows = [i for i in rows if column[i] in value]
+                elif kind == 'ge':
+                    rows = [i for i in rows if column[i] >= value]
+                else:
+                    rows = [i for i in rows if column[i] < value]
+        return rows
+
+    def _record(self, c, i):
+        application = self.applications.lookup(c['application'][i])
+        stack = self.stacks.lookup(c['stack'][i])
+        record = {
+            'id': c['seq'][i],
+            'timestamp': datetime.fromtimestamp(c['timestamp'][i]).isoformat(),
+            'size': c['size'][i],
+            'layers': {'application': application},
+            'protocol_analysis': {
+                'protocol_stack': stack.split('/') if stack else [],
+                'application_protocol': application
+            },
+            'security_assessment': {'risk_level': RISK_LEVELS[c['risk'][i]]}
+        }
+        if c['ip_version'][i]:
+            record['src_ip'] = int_to_ip(c['src_hi'][i] << 64 | c['src_lo'][i])
+            record['dst_ip'] = int_to_ip(c['dst_hi'][i] << 64 | c['dst_lo'][i])
+            record['protocol'] = c['protocol'][i]
+            record['ttl'] = c['ttl'][i]
+        if c['src_port'][i] or c['dst_port'][i]:
+            record['src_port'] = c['src_port'][i]
+            record['dst_port'] = c['dst_port'][i]
+        if c['tcp_flags'][i]:
+            record['flags'] = decode_flags(c['tcp_flags'][i])
+        if c['payload_size'][i]:
+            record['payload_analysis'] = {'size': c['payload_size'][i],
+                                          'entropy': round(c['entropy'][i], 4)}
+        return record
+
+    def status(self):
+        return dict(self.stats, stored=len(self), capacity=self.capacity, bytes=self.nbytes,
+                    first_seq=self.first_seq, last_seq=self.last_seq)
+
+
+def _split(value):
+    """128-bit address int -> ``(hi, lo)`` as stored in the *_hi/*_lo columns."""
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def _find_all(column, value, a, b):
+    """Indexes of ``value`` in ``column[a:b]``, searched by array.index in C."""
+    found = []
+    try:
+        while True:
+            a = column.index(value, a, b)
+            found.append(a)
+            a += 1
+    except ValueError:
+        return found
+
+
+def _np_slice(column, a, b):
+    # A copy: a view would stop add_packet from growing the array meanwhile
+    return np.frombuffer(column[a:b], dtype=column.typecode)
+
+
+def _np_between(hi, lo, low, high):
+    """Rows whose ``(hi, lo)`` pair lies in ``[low, high]``, compared as 128-bit ints."""
+    return (((hi > low[0]) | ((hi == low[0]) & (lo >= low[1])))
+            & ((hi < high[0]) | ((hi == high[0]) & (lo <= high[1]))))
+
+
+class _Logical:
+    """Sequence view of a wrapped column in logical (oldest-first) order."""
+    __slots__ = ('column', 'start', 'count')
+
+    def __init__(self, column, start, count):
+        self.column = column
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        return self.column[(self.start + position) % len(self.column)]
@@ -0,0 +1,388 @@
+import struct
+import socket
+import threading
+import logging
+from datetime import datetime
+from scapy.all import AsyncSniffer, conf
+import capture
+from capture import packet_to_dict, schedule_enrichment
+from filters import validate_bpf
+from serialize import dumps
+
+# Linux packet socket statistics (struct tpacket_stats)
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+
+logger = logging.getLogger(__name__)
+
+
+class PacketRing:
+    """Bounded ring buffer of dissected packets with monotonic sequence numbers.
+
+    Writers are serialized by CaptureEngine.process. Readers never take a
+    lock: every slot holds a ``(seq, packet)`` tuple and the head is only
+    advanced after the slot is written, so a reader that finds a slot whose
+    sequence number differs from the one it expects knows the entry was
+    overwritten and skips it.
+
+    Packets are JSON-encoded at most once: encoded() keeps the bytes of every
+    packet whose enrichment has settled in a parallel ``(seq, bytes)`` slot
+    array, validated the same way.
+    """
+
+    def __init__(self, capacity=4096, first_seq=1):
+        if capacity < 1:
+            raise ValueError("Ring capacity must be positive")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._encoded = [None] * capacity
+        self._first_seq = first_seq
+        self._next_seq = first_seq
+
+    @property
+    def next_seq(self):
+        """Sequence number the next appended entry will receive."""
+        return self._next_seq
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest entry (0 when empty)."""
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest entry still held."""
+        return max(self._first_seq, self._next_seq - self.capacity)
+
+    def __len__(self):
+        return min(self._next_seq - self._first_seq, self.capacity)
+
+    def append(self, item):
+        """Store an entry and return its sequence number (writers only)."""
+        seq = self._next_seq
+        self._slots[seq % self.capacity] = (seq, item)
+        self._next_seq = seq + 1
+        return seq
+
+    def latest(self, count):
+        """Return up to ``count`` newest entries, oldest first."""
+        head = self._next_seq
+        start = max(head - count, head - self.capacity, self._first_seq)
+        return self._read(start, head)
+
+    def get(self, seq):
+        """The entry with sequence number ``seq``, or None once overwritten."""
+        entry = self._slots[seq % self.capacity]
+        return entry[1] if entry is not None and entry[0] == seq else None
+
+    def since(self, seq, limit=None):
+        """Return entries with a sequence number greater than ``seq``."""
+        head = self._next_seq
+        start = max(seq + 1, head - self.capacity, self._first_seq)
+        end = head if limit is None else min(head, start + limit)
+        return self._read(start, end)
+
+    def encoded(self, packets):
+        """JSON bytes for packets read from this ring, one per packet.
+
+        Packets still waiting for enrichment are encoded on every call, as
+        their lookups fill them in; once settled, the encoding is cached
+        until the slot is reused.
+        """
+        cache = self._encoded
+        capacity = self.capacity
+        result = []
+        for packet in packets:
+            seq = packet['id']
+            entry = cache[seq % capacity]
+            if entry is not None and entry[0] == seq:
+                result.append(entry[1])
+                continue
+            # Checked before encoding: lookups write their fields first and
+            # mark the packet complete last
+            settled = packet.get('enrichment') != 'pending'
+            data = dumps(packet)
+            if settled:
+                cache[seq % capacity] = (seq, data)
+            result.append(data)
+        return result
+
+    def _read(self, start, end):
+        slots = self._slots
+        capacity = self.capacity
+        entries = []
+        for seq in range(start, end):
+            entry = slots[seq % capacity]
+            if entry is not None and entry[0] == seq:
+                entries.append(entry[1])
+        return entries
+
+
+class CaptureEngine:
+    """Long-lived AsyncSniffer that dissects packets into a PacketRing.
+
+    With ``workers`` > 0 dissection is sharded across a ParallelDissector
+    process pool; packets still reach the ring in sequence order. A BPF
+    ``bpf_filter`` is attached to the capture socket, so the kernel drops
+    unwanted frames before they are copied to userspace. With an
+    ``archive`` every raw frame is also written to a FrameArchive and its
+    packet dict carries the frame's ``archive`` reference. Sequence numbers
+    start at ``first_seq``, so a persistent store can carry them across
+    restarts.
+    """
+
+    def __init__(self, ring_size=4096, iface=None, workers=0, services_file=None,
+                 bpf_filter=None, snaplen=0, first_seq=1, archive=None):
+        self.ring = PacketRing(ring_size, first_seq)
+        self.iface = iface
+        self.snaplen = snaplen  # frames are cut to this many bytes before dissection (0: keep all)
+        self.filter = validate_bpf(bpf_filter, iface) if bpf_filter else None
+        self.filter_since = first_seq  # first sequence number captured under the current filter
+        self.filter_stats = {}  # filter expression ('' = none) -> kernel counters
+        self.workers = workers
+        self.archive = archive  # FrameArchive keeping the raw frames, if any
+        self._archived = {}  # parallel mode: seq -> archive reference until published
+        self.services_file = services_file
+        self.started_at = None
+        self.stats = {'captured': 0, 'errors': 0}
+        self._sniffer = None
+        self._socket = None
+        self._linktype = 1
+        self._dissector = None
+        self._consumers = []
+        self._next_seq = first_seq  # parallel mode: sequence handed to the next submitted frame
+        self._lock = threading.Lock()  # guards start/stop and dissector creation
+        # Serializes writers (sniffer thread, pcap ingestion); readers never take it
+        self._write_lock = threading.Lock()
+        self._appended = threading.Condition()  # wakes live stream readers
+        self._stats_lock = threading.Lock()  # kernel counters read from status() and stop()
+        self._filter_lock = threading.Lock()  # one set_filter() stop/swap/start at a time
+
+    @property
+    def running(self):
+        sniffer = self._sniffer
+        return bool(sniffer and sniffer.thread and sniffer.thread.is_alive())
+
+    def start(self):
+        """Start sniffing in the background (no-op if already running)."""
+        with self._lock:
+            if self.running:
+                return
+            logger.info(f"Starting capture engine (iface: {self.iface or 'default'}, "
+                        f"ring: {self.ring.capacity}, filter: {self.filter or 'none'})")
+            # Opened here rather than by the sniffer so its kernel counters can be read
+            self._socket = conf.L2listen(iface=self.iface, filter=self.filter)
+            # Have the socket hand over undissected frames: snaplen is applied and
+            # dissection happens (possibly in the worker pool) in process_raw
+            self._linktype = conf.l2types.layer2num.get(getattr(self._socket, 'LL', None), 1)
+            self._socket.LL = conf.raw_layer
+            self._sniffer = AsyncSniffer(opened_socket=self._socket, prn=self._on_packet,
+                                         store=False)
+            self._sniffer.start()
+            self.started_at = datetime.now()
+
+    def stop(self):
+        """Stop the background sniffer."""
+        with self._lock:
+            sniffer, self._sniffer = self._sniffer, None
+            if sniffer and sniffer.running:
+                try:
+                    sniffer.stop()
+                except Exception as e:
+                    logger.error(f"Error stopping capture engine: {str(e)}")
+            sock, self._socket = self._socket, None
+            if sock is not None:
+                self._read_kernel_stats(sock)
+                sock.close()
+            if self._dissector is not None:
+                self._dissector.flush()
+            logger.info("Capture engine stopped")
+
+    def set_filter(self, expression):
+        """Validate a BPF expression (None clears it) and restart capture with it.
+
+        Calls are serialized, so concurrent changes never interleave their
+        stop and start. Raises ValueError for an invalid expression.
+        """
+        expression = validate_bpf(expression, self.iface)
+        with self._filter_lock:
+            if expression == self.filter:
+                return expression
+            was_running = self.running
+            if was_running:
+                self.stop()
+            with self._write_lock:
+                self.filter = expression
+                self.filter_since = self._next_seq if self.workers > 0 else self.ring.next_seq
+            logger.info(f"Capture filter set to {expression or 'none'}")
+            if was_running:
+                self.start()
+        return expression
+
+    def kernel_stats(self):
+        """Kernel ``received``/``dropped`` totals by capture filter ('' for
+        none), including the open socket's latest counters."""
+        if self._socket is not None:
+            self._read_kernel_stats()
+        with self._stats_lock:
+            return {name: dict(stats) for name, stats in self.filter_stats.items()}
+
+    def _read_kernel_stats(self, sock=None):
+        """Fold the socket's kernel counters into filter_stats.
+
+        PACKET_STATISTICS resets on every read, so the totals live here.
+        Only Linux packet sockets report them.
+        """
+        sock = sock or self._socket
+        with self._stats_lock:
+            stats = self.filter_stats.setdefault(self.filter or '', {'received': 0, 'dropped': 0})
+            ins = getattr(sock, 'ins', None)
+            if ins is None or not hasattr(socket, 'AF_PACKET'):
+                return stats
+            try:
+                received, dropped = struct.unpack('II', ins.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+            except OSError:
+                return stats
+            # tp_packets counts every frame that passed the filter, dropped ones included
+            stats['received'] += received
+            stats['dropped'] += dropped
+            return stats
+
+    def close(self):
+        """Stop sniffing and shut down the dissector pool, if any."""
+        self.stop()
+        with self._lock:
+            dissector, self._dissector = self._dissector, None
+        if dissector is not None:
+            dissector.close()
+
+    def _get_dissector(self):
+        # Created on first use so importing the app never forks workers
+        with self._lock:
+            if self._dissector is None:
+                from parallel import ParallelDissector
+                self._dissector = ParallelDissector(self._publish, workers=self.workers,
+                                                    services_file=self.services_file,
+                                                    analysis_window=capture.analysis_window)
+            return self._dissector
+
+    def _on_packet(self, frame):
+        try:
+            self.process_raw(frame.load, frame.time, self._linktype)
+            self.stats['captured'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Capture engine dropped packet: {str(e)}")
+
+    def process(self, packet):
+        """Dissect a packet into the ring and return its dict.
+
+        In parallel mode the packet is handed to the worker pool and None is
+        returned; its dict shows up in the ring once dissected.
+        """
+        if self.workers > 0 or self.archive is not None or (self.snaplen and len(packet) > self.snaplen):
+            linktype = conf.l2types.layer2num.get(type(packet), 1)
+            return self.process_raw(packet.original or bytes(packet), packet.time, linktype,
+                                    packet.wirelen)
+        return self._dissect(packet)
+
+    def process_raw(self, raw, timestamp, linktype=1, wirelen=None):
+        """Dissect a raw frame given its capture timestamp and DLT link type.
+
+        ``wirelen`` is the frame's length on the wire when ``raw`` was already
+        cut short by an earlier snaplen (e.g. in a pcap file).
+        """
+        wirelen = max(wirelen or 0, len(raw))
+        if self.snaplen and len(raw) > self.snaplen:
+            raw = raw[:self.snaplen]
+        archived = self.archive.append(raw, timestamp, linktype, wirelen) if self.archive else None
+        if self.workers <= 0:
+            packet = conf.l2types.num2layer.get(linktype, conf.raw_layer)(raw)
+            packet.time = timestamp
+            packet.wirelen = wirelen
+            return self._dissect(packet, archived)
+        dissector = self._dissector or self._get_dissector()
+        with self._write_lock:
+            seq = self._next_seq
+            self._next_seq = seq + 1
+            if archived:
+                self._archived[seq] = archived
+            batch = dissector.add(seq, raw, timestamp, linktype, wirelen)
+        # Waiting for a free pool slot holds back this producer only, not the lock
+        if batch:
+            dissector.dispatch(batch)
+        return None
+
+    def _dissect(self, packet, archived=None):
+        ring = self.ring
+        with self._write_lock:
+            packet_dict = packet_to_dict(packet, ring.next_seq)
+            if archived:
+                packet_dict['archive'] = archived
+            ring.append(packet_dict)
+            self._feed(packet_dict)
+        self._notify()
+        return packet_dict
+
+    def _publish(self, packet_dict):
+        # Parallel mode: called in sequence order from the pool's result thread,
+        # the only ring writer, so ids and ring sequence numbers stay aligned
+        archived = self._archived.pop(packet_dict['id'], None)
+        if archived:
+            packet_dict['archive'] = archived
+        # Enrichment is scheduled first, as in packet_to_dict: later changes to a
+        # published packet then always come with an enrichment generation bump
+        schedule_enrichment(packet_dict)
+        self.ring.append(packet_dict)
+        self._feed(packet_dict)
+        self._notify()
+
+    def add_consumer(self, consumer):
+        """Call ``consumer(packet_dict)`` for every packet, in sequence order.
+
+        Consumers run on the writer thread, so they must be quick.
+        """
+        self._consumers.append(consumer)
+
+    def _feed(self, packet_dict):
+        for consumer in self._consumers:
+            try:
+                consumer(packet_dict)
+            except Exception as e:
+                logger.error(f"Packet consumer {getattr(consumer, '__qualname__', consumer)} "
+                             f"failed on packet {packet_dict.get('id')}: {str(e)}")
+
+    def _notify(self):
+        with self._appended:
+            self._appended.notify_all()
+
+    def wait_for(self, seq, timeout=None):
+        """Block until a packet newer than ``seq`` is in the ring.
+
+        Returns False if ``timeout`` seconds pass first.
+        """
+        ring = self.ring
+        with self._appended:
+            return self._appended.wait_for(lambda: ring.last_seq > seq, timeout)
+
+    def latest(self, count=10):
+        """Constant-time read of the newest ``count`` packets."""
+        return self.ring.latest(count)
+
+    def status(self):
+        filters = self.kernel_stats()
+        return {
+            'running': self.running,
+            'iface': self.iface,
+            'filter': self.filter,
+            'kernel': filters.get(self.filter or '', {'received': 0, 'dropped': 0}),
+            'filters': filters,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'dissect_workers': self.workers,
+            'snaplen': self.snaplen,
+            'ring_capacity': self.ring.capacity,
+            'buffered': len(self.ring),
+            'last_seq': self.ring.last_seq,
+            'captured': self.stats['captured'],
+            'errors': self.stats['errors']
+        }
@@ -0,0 +1,176 @@
+import threading
+import time
+import logging
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_SECONDS = Histogram('osi_enrichment_lookup_seconds', 'Background enrichment lookups',
+                           labelnames=('kind',))
+
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(hit, value)``; ``value`` may be None for negative entries."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class IpApiProvider:
+    """Geolocation through the ip-api.com JSON API or a compatible server."""
+
+    def __init__(self, base_url='http://ip-api.com/json', timeout=2):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def lookup(self, ip_address):
+        """Return geolocation/ISP info for ``ip_address`` or None."""
+        try:
+            response = requests.get(f"{self.base_url}/{ip_address}", timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('status') == 'success':
+                    return {
+                        'country': data.get('country'),
+                        'region': data.get('regionName'),
+                        'city': data.get('city'),
+                        'isp': data.get('isp'),
+                        'org': data.get('org'),
+                        'timezone': data.get('timezone')
+                    }
+        except (requests.RequestException, json.JSONDecodeError):
+            pass
+        return None
+
+
+class Enricher:
+    """Resolves hostnames and geolocation for packets on a worker pool.
+
+    Results are cached per IP (failures too, with a shorter TTL) and
+    concurrent requests for the same IP share a single in-flight lookup.
+    Packets are filled in place once their lookups finish.
+    """
+
+    def __init__(self, dns_resolver, geo_provider, workers=4, cache_size=4096,
+                 ttl=3600, negative_ttl=300):
+        self._resolvers = {
+            'hostname': dns_resolver,
+            'geo': geo_provider.lookup if geo_provider is not None else None
+        }
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.stats = {'hits': 0, 'misses': 0, 'lookups': 0, 'failures': 0}
+        self.generation = 0  # bumped whenever a lookup result reaches a packet
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrichment')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def enrich(self, packet, targets):
+        """Fill ``packet`` for each ``{side: ip}`` in ``targets``.
+
+        Cached results are applied immediately; the rest are scheduled and
+        the packet is marked ``enrichment: pending`` until they complete.
+        """
+        missing = []
+        for side, ip in targets.items():
+            for kind, resolver in self._resolvers.items():
+                if resolver is None:
+                    continue
+                hit, value = self.cache.get((kind, ip))
+                if hit:
+                    self.stats['hits'] += 1
+                    if value:
+                        packet[f"{side}_{kind}"] = value
+                else:
+                    self.stats['misses'] += 1
+                    missing.append((side, kind, ip))
+
+        if not missing:
+            packet['enrichment'] = 'complete'
+            return
+        packet['enrichment'] = 'pending'
+        remaining = [len(missing)]
+        for side, kind, ip in missing:
+            future = self._submit(kind, ip)
+            future.add_done_callback(
+                lambda f, side=side, kind=kind: self._fill(packet, side, kind, f, remaining))
+
+    def _submit(self, kind, ip):
+        key = (kind, ip)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._pool.submit(self._resolve, kind, ip)
+                self._inflight[key] = future
+            return future
+
+    def _resolve(self, kind, ip):
+        key = (kind, ip)
+        self.stats['lookups'] += 1
+        try:
+            with LOOKUP_SECONDS.labels(kind).time():
+                value = self._resolvers[kind](ip)
+        except Exception as e:
+            logger.debug(f"Enrichment lookup failed ({kind} {ip}): {str(e)}")
+            value = None
+        if value:
+            self.cache.set(key, value)
+        else:
+            self.stats['failures'] += 1
+            self.cache.set(key, None, ttl=self.negative_ttl)
+        with self._lock:
+            self._inflight.pop(key, None)
+        return value
+
+    def _fill(self, packet, side, kind, future, remaining):
+        value = None if future.cancelled() else future.result()
+        if value:
+            packet[f"{side}_{kind}"] = value
+        with self._lock:
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            packet['enrichment'] = 'complete'
+        with self._lock:
+            self.generation += 1
+
+    def status(self):
+        return dict(self.stats, cached=len(self.cache), inflight=len(self._inflight))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
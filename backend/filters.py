@@ -0,0 +1,185 @@
+import re
+import ipaddress
+from scapy.error import Scapy_Exception
+from columns import RISK_LEVELS, address_range
+from store import parse_time
+
+PROTOCOLS = ('tcp', 'udp', 'icmp', 'icmp6', 'arp', 'ip', 'ip6')
+DIRECTIONS = ('src', 'dst', 'any')
+PROTOCOL_NUMBERS = {'tcp': 6, 'udp': 17, 'icmp': 1, 'icmp6': 58}
+QUERY_ARGS = ('after_id', 'limit', 'fields', 'ip', 'src_ip', 'dst_ip', 'src_port', 'dst_port',
+              'protocol', 'risk', 'since', 'until', 'host', 'port', 'direction')
+MAX_QUERY_LIMIT = 10000
+MAX_FILTER_LENGTH = 1024
+
+_HOSTNAME = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9.-]{0,251}[A-Za-z0-9])?$')
+
+
+def _host_term(host):
+    """'host X' or 'net X/N' for an address, network or hostname."""
+    try:
+        return f"host {ipaddress.ip_address(host)}"
+    except ValueError:
+        pass
+    if '/' in host:
+        try:
+            return f"net {ipaddress.ip_network(host, strict=False)}"
+        except ValueError:
+            raise ValueError(f"Invalid network: {host!r}")
+    if not _HOSTNAME.match(host):
+        raise ValueError(f"Invalid host: {host!r}")
+    return f"host {host}"
+
+
+def _port(value):
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid port: {value!r}")
+    if not 0 <= port <= 65535:
+        raise ValueError(f"Invalid port: {port}")
+    return port
+
+
+def build_bpf(host=None, port=None, protocol=None, direction=None):
+    """Compile structured filter parameters into a BPF expression.
+
+    ``direction`` ('src', 'dst' or 'any') qualifies the host and port terms.
+    Every value is checked before it reaches the expression, so the result
+    can't carry extra BPF syntax. Returns None when no parameter is set.
+    """
+    if direction in (None, '', 'any'):
+        qualifier = ''
+    elif direction in DIRECTIONS:
+        qualifier = f"{direction} "
+    else:
+        raise ValueError(f"Invalid direction {direction!r}; expected one of {', '.join(DIRECTIONS)}")
+
+    terms = []
+    if protocol:
+        protocol = str(protocol).lower()
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Invalid protocol {protocol!r}; expected one of {', '.join(PROTOCOLS)}")
+        terms.append(protocol)
+    if host:
+        terms.append(qualifier + _host_term(str(host).strip()))
+    if port not in (None, ''):
+        terms.append(f"{qualifier}port {_port(port)}")
+    return ' and '.join(terms) or None
+
+
+def validate_bpf(expression, iface=None):
+    """Check that libpcap can compile ``expression``; returns it normalized.
+
+    Raises ValueError for an invalid expression and RuntimeError when
+    libpcap isn't available to compile filters at all (scapy would then
+    silently capture everything).
+    """
+    if expression is None:
+        return None
+    expression = ' '.join(expression.split())
+    if not expression:
+        return None
+    if len(expression) > MAX_FILTER_LENGTH:
+        raise ValueError(f"BPF filter longer than {MAX_FILTER_LENGTH} characters")
+
+    from scapy.arch.common import compile_filter
+    try:
+        compile_filter(expression, iface)
+    except ImportError as e:
+        raise RuntimeError(f"BPF filters need libpcap: {str(e)}")
+    except Scapy_Exception as e:
+        raise ValueError(f"Invalid BPF filter {expression!r}: {str(e)}")
+    return expression
+
+
+def filter_from_args(args):
+    """BPF expression from request arguments: ``filter`` and/or the
+    structured ``host``/``port``/``protocol``/``direction`` parameters.
+
+    Returns ``(present, expression)``; ``present`` is False when none of the
+    parameters were given at all.
+    """
+    names = ('filter', 'host', 'port', 'protocol', 'direction')
+    if not any(name in args for name in names):
+        return False, None
+    raw = str(args.get('filter') or '').strip() or None
+    structured = build_bpf(args.get('host'), args.get('port'), args.get('protocol'),
+                           args.get('direction'))
+    if raw and structured:
+        return True, f"({raw}) and ({structured})"
+    return True, raw or structured
+
+
+def _ip_protocol(value):
+    value = str(value).strip().lower()
+    if value in PROTOCOL_NUMBERS:
+        return PROTOCOL_NUMBERS[value]
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if not 0 <= number <= 255:
+        raise ValueError(f"Invalid IP protocol {value!r}; expected a number or one of "
+                         f"{', '.join(PROTOCOL_NUMBERS)}")
+    return number
+
+
+def query_from_args(args, default_limit=10):
+    """Packet query from request arguments, or None when none of QUERY_ARGS
+    were given.
+
+    Returns ``{'after_id', 'limit', 'fields', 'predicates'}``, where
+    ``predicates`` holds the ColumnStore.select() keyword arguments that
+    were set (``since``/``until`` included). ``fields`` is a tuple of
+    top-level packet keys, or None for whole packets. ``host`` and ``port``
+    read like the capture filter's: ``direction`` ('src', 'dst' or 'any')
+    picks the side they match.
+    """
+    if not any(name in args for name in QUERY_ARGS):
+        return None
+    after_id = args.get('after_id')
+    try:
+        after_id = int(after_id) if after_id not in (None, '') else None
+        limit = int(args.get('limit') or args.get('count') or default_limit)
+    except ValueError:
+        raise ValueError("after_id and limit must be integers")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    fields = None
+    if args.get('fields'):
+        fields = tuple(dict.fromkeys(['id'] + [name.strip() for name in args['fields'].split(',')
+                                               if name.strip()]))
+
+    predicates = {}
+    for name in ('ip', 'src_ip', 'dst_ip'):
+        if args.get(name):
+            predicates[name] = address_range(args[name])
+    for name in ('src_port', 'dst_port'):
+        if args.get(name) not in (None, ''):
+            predicates[name] = _port(args[name])
+    direction = args.get('direction') or 'any'
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Invalid direction {direction!r}; expected one of {', '.join(DIRECTIONS)}")
+    prefix = '' if direction == 'any' else f"{direction}_"
+    for name, key, parse in (('host', 'ip', address_range), ('port', 'port', _port)):
+        if args.get(name) not in (None, ''):
+            key = prefix + key
+            if key in predicates:
+                raise ValueError(f"{name} and {key} can't be given together")
+            predicates[key] = parse(args[name])
+    if args.get('protocol'):
+        predicates['protocol'] = _ip_protocol(args['protocol'])
+    if args.get('risk'):
+        levels = [level.strip().lower() for level in args['risk'].split(',') if level.strip()]
+        for level in levels:
+            if level not in RISK_LEVELS:
+                raise ValueError(f"Invalid risk level {level!r}; expected one of {', '.join(RISK_LEVELS)}")
+        predicates['risk'] = {RISK_LEVELS.index(level) for level in levels}
+    for name in ('since', 'until'):
+        value = parse_time(args.get(name))
+        if value is not None:
+            predicates[name] = value
+    return {'after_id': after_id, 'limit': min(limit, MAX_QUERY_LIMIT), 'fields': fields,
+            'predicates': predicates}
@@ -0,0 +1,222 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+PROTOCOL_NAMES = {1: 'ICMP', 6: 'TCP', 17: 'UDP'}
+
+
+def _history_letters(flags):
+    """Flow.history letters for one TCP segment, as in Zeek's conn history:
+    S syn, H syn-ack, A pure ack, D data (PSH), F fin, R reset."""
+    if 'S' in flags:
+        yield 'H' if 'A' in flags else 'S'
+    elif flags == 'A':
+        yield 'A'
+    if 'P' in flags:
+        yield 'D'
+    if 'F' in flags:
+        yield 'F'
+    if 'R' in flags:
+        yield 'R'
+
+
+class Flow:
+    """One conversation, oriented client (first sender) -> server."""
+    __slots__ = ('key', 'protocol', 'client_ip', 'client_port', 'server_ip', 'server_port',
+                 'first_seen', 'last_seen', 'packets', 'bytes', 'client_packets',
+                 'client_bytes', 'server_packets', 'server_bytes', 'state', 'history',
+                 'application', '_fins')
+
+    def __init__(self, key, protocol, src_ip, sport, dst_ip, dport, timestamp):
+        self.key = key
+        self.protocol = protocol
+        self.client_ip = src_ip
+        self.client_port = sport
+        self.server_ip = dst_ip
+        self.server_port = dport
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.packets = 0
+        self.bytes = 0
+        self.client_packets = 0
+        self.client_bytes = 0
+        self.server_packets = 0
+        self.server_bytes = 0
+        self.state = 'new' if protocol == 6 else 'active'
+        self.history = ''
+        self.application = None
+        self._fins = 0  # bit 1: client sent FIN, bit 2: server sent FIN
+
+    def update(self, from_client, size, timestamp, flags=None, application=None):
+        self.packets += 1
+        self.bytes += size
+        if from_client:
+            self.client_packets += 1
+            self.client_bytes += size
+        else:
+            self.server_packets += 1
+            self.server_bytes += size
+        if timestamp > self.last_seen:
+            self.last_seen = timestamp
+        if application and self.application is None:
+            self.application = application
+        if flags is not None:
+            self._tcp_transition(from_client, flags)
+
+    def _tcp_transition(self, from_client, flags):
+        """Advance the TCP state machine with one segment's flags."""
+        # Each letter is recorded once per direction: uppercase from the
+        # client, lowercase from the server
+        for letter in _history_letters(flags):
+            if not from_client:
+                letter = letter.lower()
+            if letter not in self.history:
+                self.history += letter
+
+        state = self.state
+        if 'R' in flags:
+            state = 'reset'
+        elif 'S' in flags:
+            if 'A' not in flags:
+                if state in ('new', 'closed', 'reset'):
+                    state = 'syn_sent'
+            elif state in ('new', 'syn_sent'):
+                state = 'syn_received'
+        elif 'F' in flags:
+            self._fins |= 1 if from_client else 2
+            state = 'closing' if self._fins == 3 else 'fin_wait'
+        elif state == 'closing' and 'A' in flags:
+            state = 'closed'
+        elif state in ('new', 'syn_received'):
+            # Handshake completed, or a connection already open when capture started
+            state = 'established'
+        self.state = state
+
+    @property
+    def duration(self):
+        return self.last_seen - self.first_seen
+
+    def as_dict(self):
+        return {
+            'protocol': PROTOCOL_NAMES.get(self.protocol, str(self.protocol)),
+            'client_ip': self.client_ip,
+            'client_port': self.client_port,
+            'server_ip': self.server_ip,
+            'server_port': self.server_port,
+            'application': self.application,
+            'state': self.state,
+            'history': self.history,
+            'first_seen': datetime.fromtimestamp(self.first_seen).isoformat(),
+            'last_seen': datetime.fromtimestamp(self.last_seen).isoformat(),
+            'duration': round(self.duration, 6),
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'client_packets': self.client_packets,
+            'client_bytes': self.client_bytes,
+            'server_packets': self.server_packets,
+            'server_bytes': self.server_bytes
+        }
+
+
+class FlowTable:
+    """Aggregates dissected packets into 5-tuple conversations.
+
+    Flows are keyed by the normalized 5-tuple, so both directions land in the
+    same record, and kept in least-recently-active order: flows idle for
+    ``idle_timeout`` seconds (measured in packet time, so pcap replays age out
+    the same way as live traffic) are evicted from the front, and once
+    ``max_flows`` are tracked the least recently active one makes room for
+    the next.
+    """
+
+    SORT_KEYS = {
+        'last_seen': lambda flow: flow.last_seen,
+        'first_seen': lambda flow: flow.first_seen,
+        'packets': lambda flow: flow.packets,
+        'bytes': lambda flow: flow.bytes,
+        'duration': lambda flow: flow.duration
+    }
+
+    def __init__(self, idle_timeout=300, max_flows=100000):
+        self.idle_timeout = idle_timeout
+        self.max_flows = max_flows
+        self._flows = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = 0.0  # newest packet timestamp seen
+        self.stats = {'packets': 0, 'flows': 0, 'evicted_idle': 0, 'evicted_capacity': 0}
+
+    def __len__(self):
+        return len(self._flows)
+
+    def add_packet(self, packet_dict):
+        """Account a packet_to_dict result (non-IP packets are ignored)."""
+        src_ip = packet_dict.get('src_ip')
+        protocol = packet_dict.get('protocol')
+        if src_ip is None or protocol is None:
+            return None
+        dst_ip = packet_dict['dst_ip']
+        sport = packet_dict.get('src_port', 0)
+        dport = packet_dict.get('dst_port', 0)
+        timestamp = datetime.fromisoformat(packet_dict['timestamp']).timestamp()
+        application = packet_dict.get('layers', {}).get('application')
+
+        src, dst = (src_ip, sport), (dst_ip, dport)
+        key = (protocol,) + (src + dst if src <= dst else dst + src)
+        with self._lock:
+            flows = self._flows
+            self.stats['packets'] += 1
+            if timestamp > self._clock:
+                self._clock = timestamp
+                self._expire(timestamp - self.idle_timeout)
+            flow = flows.get(key)
+            if flow is None:
+                if len(flows) >= self.max_flows:
+                    flows.popitem(last=False)
+                    self.stats['evicted_capacity'] += 1
+                flags = packet_dict.get('flags', '')
+                if protocol == 6 and 'S' in flags and 'A' in flags:
+                    # First segment seen is the SYN-ACK: the sender is the server
+                    flow = Flow(key, protocol, dst_ip, dport, src_ip, sport, timestamp)
+                else:
+                    flow = Flow(key, protocol, src_ip, sport, dst_ip, dport, timestamp)
+                flows[key] = flow
+                self.stats['flows'] += 1
+            else:
+                flows.move_to_end(key)
+            from_client = src_ip == flow.client_ip and sport == flow.client_port
+            flow.update(from_client, packet_dict.get('size', 0), timestamp,
+                        packet_dict.get('flags') if protocol == 6 else None, application)
+        return flow
+
+    def _expire(self, cutoff):
+        flows = self._flows
+        while flows:
+            flow = next(iter(flows.values()))
+            if flow.last_seen >= cutoff:
+                break
+            flows.popitem(last=False)
+            self.stats['evicted_idle'] += 1
+
+    def query(self, offset=0, limit=50, sort='last_seen', protocol=None, state=None, ip=None):
+        """Return ``(total, flows)`` for one page, newest/largest first."""
+        key = self.SORT_KEYS.get(sort)
+        if key is None:
+            raise ValueError(f"Unknown sort key {sort!r}; expected one of {', '.join(self.SORT_KEYS)}")
+        with self._lock:
+            flows = list(self._flows.values())
+        if protocol is not None:
+            protocol = str(protocol).upper()
+            flows = [f for f in flows if PROTOCOL_NAMES.get(f.protocol, str(f.protocol)) == protocol]
+        if state is not None:
+            flows = [f for f in flows if f.state == state]
+        if ip is not None:
+            flows = [f for f in flows if ip in (f.client_ip, f.server_ip)]
+        if sort == 'last_seen':
+            flows.reverse()  # already in activity order
+        else:
+            flows.sort(key=key, reverse=True)
+        return len(flows), [f.as_dict() for f in flows[offset:offset + limit]]
+
+    def status(self):
+        return dict(self.stats, active=len(self._flows), max_flows=self.max_flows,
+                    idle_timeout=self.idle_timeout)
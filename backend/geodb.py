@@ -0,0 +1,137 @@
+import os
+import sys
+import csv
+import json
+import mmap
+import struct
+import logging
+import ipaddress
+from array import array
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'OSIGEO1\0'
+# magic, entry count, byte order of the uint32 arrays (0 little, 1 big)
+INDEX_HEADER = struct.Struct('<8sII')
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+
+CSV_FIELDS = ('country', 'region', 'city', 'isp', 'org', 'timezone')
+
+
+def _ip_to_int(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.IPv4Address(value))
+
+
+def build_index(csv_path, index_path):
+    """Compile an IP-range CSV into the binary index used by OfflineGeoProvider.
+
+    The CSV needs ``start_ip`` and ``end_ip`` columns (dotted quads or
+    integers) plus any of country, region, city, isp, org and timezone.
+    The index holds three parallel uint32 arrays (range start, range end,
+    record offset) sorted by start, followed by the length-prefixed JSON
+    records. Identical records are stored once.
+    """
+    ranges = []
+    records = bytearray()
+    record_offsets = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                start = _ip_to_int(row['start_ip'])
+                end = _ip_to_int(row['end_ip'])
+            except (KeyError, ValueError):
+                continue  # IPv6 or malformed rows are not indexed
+            record = json.dumps({field: row.get(field) or None for field in CSV_FIELDS},
+                                separators=(',', ':')).encode('utf-8')
+            offset = record_offsets.get(record)
+            if offset is None:
+                offset = record_offsets[record] = len(records)
+                records += struct.pack('<H', len(record)) + record
+            ranges.append((start, end, offset))
+
+    ranges.sort()
+    starts = array('I', (r[0] for r in ranges))
+    ends = array('I', (r[1] for r in ranges))
+    offsets = array('I', (r[2] for r in ranges))
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(ranges), BYTE_ORDER))
+        starts.tofile(f)
+        ends.tofile(f)
+        offsets.tofile(f)
+        f.write(records)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Built geolocation index {index_path} ({len(ranges)} ranges)")
+    return len(ranges)
+
+
+class OfflineGeoProvider:
+    """Geolocation from a local IP-range database, no network needed.
+
+    The compiled index is memory-mapped and searched with bisect directly
+    over the mapped start array, so lookups take microseconds and the
+    database is shared between processes through the page cache. It is
+    rebuilt automatically when the CSV is newer than the index. Only IPv4
+    ranges are supported; other addresses return None.
+    """
+
+    def __init__(self, path, index_path=None):
+        if path.endswith('.idx'):
+            index_path = path
+        else:
+            index_path = index_path or path + '.idx'
+            if (not os.path.exists(index_path) or
+                    os.path.getmtime(index_path) < os.path.getmtime(path)):
+                build_index(path, index_path)
+        self.path = index_path
+        self._file = open(index_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, order = INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a geolocation index")
+        if order != BYTE_ORDER:
+            raise ValueError(f"{index_path} was built with a different byte order, rebuild it")
+        self.count = count
+        self._view = view = memoryview(self._mm)
+        base = INDEX_HEADER.size
+        width = 4 * count
+        self._starts = view[base:base + width].cast('I')
+        self._ends = view[base + width:base + 2 * width].cast('I')
+        self._offsets = view[base + 2 * width:base + 3 * width].cast('I')
+        self._records = base + 3 * width
+
+    def lookup(self, ip_address):
+        """Return the same shape as get_ip_info() or None."""
+        try:
+            ip = int(ipaddress.IPv4Address(ip_address))
+        except ValueError:
+            return None
+        i = bisect_right(self._starts, ip) - 1
+        if i < 0 or ip > self._ends[i]:
+            return None
+        offset = self._records + self._offsets[i]
+        length, = struct.unpack_from('<H', self._mm, offset)
+        return json.loads(self._mm[offset + 2:offset + 2 + length])
+
+    def close(self):
+        for view in (self._starts, self._ends, self._offsets, self._view):
+            view.release()
+        self._mm.close()
+        self._file.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile an IP-range CSV into a geolocation index')
+    parser.add_argument('csv_path')
+    parser.add_argument('index_path', nargs='?')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    build_index(args.csv_path, args.index_path or args.csv_path + '.idx')
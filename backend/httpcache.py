@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Every coding compress() knows, so tags from a server with brotli still match
+CODINGS = ('br', 'gzip')
+
+
+def make_etag(*parts):
+    """Strong ETag value for a response determined by ``parts``."""
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def encoded_etag(etag, encoding):
+    """ETag of the body tagged ``etag`` in content coding ``encoding`` (None
+    for identity): each coding is a different representation, with its own
+    strong tag."""
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+def matching_etag(etags, etag):
+    """The form of ``etag``, in any content coding, that ``etags`` (a parsed
+    If-None-Match) holds, or None."""
+    for encoding in (None,) + CODINGS:
+        tag = encoded_etag(etag, encoding)
+        if etags.contains(tag):
+            return tag
+    return None
+
+
+def negotiate(accept_encoding):
+    """Preferred content coding among ENCODINGS in an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best = None
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class CompressedCache:
+    """Compressed response bodies by ``(etag, encoding)``, least recently
+    used first out.
+
+    Polling clients keep asking for the same state; while its ETag holds,
+    every one of them after the first gets the body compressed earlier.
+    Bodies under ``min_size`` bytes are sent as they are.
+    """
+
+    def __init__(self, max_entries=32, level=6, min_size=1024):
+        self.max_entries = max_entries
+        self.level = level
+        self.min_size = min_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, etag, encoding, build):
+        """``(body, encoding)`` for ``etag``: the cached compressed body, or
+        ``build()``'s bytes compressed (or left alone when small)."""
+        key = (etag, encoding)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return body, encoding
+        data = build()
+        if len(data) < self.min_size:
+            return data, None
+        body = compress(data, encoding, self.level)
+        with self._lock:
+            self.stats['misses'] += 1
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, encoding
+
+    def status(self):
+        return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries,
+                    encodings=list(ENCODINGS))
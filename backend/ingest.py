@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import closing
+from itertools import count
+from scapy.utils import PcapReader, RawPcapReader
+from capture import packet_to_dict, set_analysis_window
+
+logger = logging.getLogger(__name__)
+
+
+class IngestStats:
+    """Progress of one pcap/pcapng ingestion run."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        self.packets = 0
+        self.bytes = 0
+        self.errors = 0
+        self.position = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def packets_per_second(self):
+        elapsed = self.elapsed
+        return self.packets / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def progress(self):
+        """Fraction of the file read so far (0.0 to 1.0)."""
+        if self.finished:
+            return 1.0
+        return self.position / self.file_size if self.file_size else 0.0
+
+    def as_dict(self):
+        return {
+            'file': os.path.basename(self.path),
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'progress': round(self.progress, 4),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'packets_per_second': round(self.packets_per_second, 1),
+            'done': self.finished is not None
+        }
+
+
+def iter_raw_frames(reader):
+    """Yield ``(raw, timestamp, linktype, wirelen)`` from a RawPcapReader or RawPcapNgReader."""
+    for raw, meta in reader:
+        if hasattr(meta, 'tsresol'):  # pcapng
+            yield (raw, ((meta.tshigh << 32) + meta.tslow) / meta.tsresol, meta.linktype,
+                   meta.wirelen)
+        else:
+            yield (raw, meta.sec + meta.usec * (1e-9 if reader.nano else 1e-6), reader.linktype,
+                   meta.wirelen)
+
+
+def ingest_pcap(path, process=None, progress=None, progress_interval=1.0, limit=None,
+                stats=None, process_raw=None):
+    """Stream a pcap/pcapng file through the dissection pipeline.
+
+    Packets are read one at a time with scapy's PcapReader (which detects
+    pcapng by itself), so memory use does not depend on the file size.
+    ``process(packet)`` receives each scapy packet and defaults to
+    ``packet_to_dict`` with the packet's position in the file as its id.
+    Passing ``process_raw(raw, timestamp, linktype, wirelen)`` instead skips scapy
+    dissection in this process entirely (see ParallelDissector).
+    ``stats.position`` is updated (and ``progress(stats)`` called) at most
+    every ``progress_interval`` seconds, and ``progress`` once more at the end. Returns the final IngestStats.
+    """
+    if process is None and process_raw is None:
+        ids = count(1)
+        process = lambda packet: packet_to_dict(packet, next(ids))
+
+    stats = stats or IngestStats(path)
+    next_report = stats.started + progress_interval
+    reader_class = PcapReader if process_raw is None else RawPcapReader
+    with closing(reader_class(path)) as reader:
+        if process_raw is None:
+            frames = ((packet, packet.original) for packet in reader)
+        else:
+            frames = ((frame, frame[0]) for frame in iter_raw_frames(reader))
+        for item, raw in frames:
+            try:
+                if process_raw is None:
+                    process(item)
+                else:
+                    process_raw(*item)
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"Error ingesting packet {stats.packets + 1} of {path}: {str(e)}")
+            stats.packets += 1
+            stats.bytes += len(raw) if raw else 0
+            if time.monotonic() >= next_report:
+                # Also read by IngestJob.as_dict(), with or without a callback
+                stats.position = reader.f.tell()
+                if progress is not None:
+                    progress(stats)
+                next_report = time.monotonic() + progress_interval
+            if limit is not None and stats.packets >= limit:
+                break
+    stats.finished = time.monotonic()
+    if progress is not None:
+        progress(stats)
+    return stats
+
+
+class IngestJob(threading.Thread):
+    """Background ingestion of an uploaded capture file."""
+
+    def __init__(self, path, process=None, delete=False, name=None, process_raw=None):
+        super().__init__(name=f"ingest-{os.path.basename(path)}", daemon=True)
+        self.path = path
+        self.filename = name or os.path.basename(path)
+        self.process = process
+        self.process_raw = process_raw
+        self.delete = delete
+        self.stats = IngestStats(path)
+        self.error = None
+
+    def run(self):
+        try:
+            ingest_pcap(self.path, process=self.process, stats=self.stats,
+                        process_raw=self.process_raw)
+            logger.info(f"Ingested {self.stats.packets} packets from {self.path} "
+                        f"({self.stats.packets_per_second:.0f} pkt/s)")
+        except Exception as e:
+            self.error = str(e)
+            self.stats.finished = time.monotonic()
+            logger.error(f"Error ingesting {self.path}: {str(e)}")
+        finally:
+            if self.delete:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+
+    def as_dict(self):
+        return dict(self.stats.as_dict(), file=self.filename, error=self.error)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Analyze a pcap/pcapng file offline and write one JSON packet per line')
+    parser.add_argument('pcap', help='pcap or pcapng file')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('-n', '--limit', type=int, help='stop after N packets')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress on stderr')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='dissect in N worker processes (default: in-process)')
+    parser.add_argument('--window', type=int, default=0,
+                        help='only analyze the first N payload bytes (default: all)')
+    args = parser.parse_args()
+    set_analysis_window(args.window)
+
+    logging.basicConfig(level=logging.WARNING)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    ids = count(1)
+
+    def write(packet_dict):
+        out.write(json.dumps(packet_dict))
+        out.write('\n')
+
+    def process(packet):
+        write(packet_to_dict(packet, next(ids)))
+
+    dissector = None
+    process_raw = None
+    if args.workers > 0:
+        from parallel import ParallelDissector
+        dissector = ParallelDissector(write, workers=args.workers, analysis_window=args.window)
+        process_raw = lambda raw, timestamp, linktype, wirelen: dissector.submit(
+            next(ids), raw, timestamp, linktype, wirelen)
+
+    def report(stats):
+        print(f"\r{stats.progress:6.1%}  {stats.packets:,} packets  "
+              f"{stats.packets_per_second:,.0f} pkt/s", end='', file=sys.stderr, flush=True)
+
+    try:
+        stats = ingest_pcap(args.pcap, process=process, progress=None if args.quiet else report,
+                            limit=args.limit, process_raw=process_raw)
+        if dissector is not None:
+            dissector.close()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{stats.packets:,} packets ({stats.bytes:,} bytes, {stats.errors} errors) in "
+          f"{stats.elapsed:.2f}s - {stats.packets_per_second:,.0f} pkt/s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
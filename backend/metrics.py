@@ -0,0 +1,251 @@
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+# Default latency buckets in seconds
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+SLOW_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Cells:
+    """Per-thread value cells.
+
+    Each thread only ever writes to its own list, so updates need no lock;
+    readers add up every cell. Cells of threads that have exited are folded
+    into a retired total on read, so short-lived request threads don't pile up.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._cells = []  # (thread, cell)
+        self._retired = [0] * size
+        self._lock = threading.Lock()  # only taken on a thread's first write and on read
+
+    def get(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self.size
+            with self._lock:
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def totals(self):
+        with self._lock:
+            alive = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    alive.append((thread, cell))
+                else:
+                    for i, value in enumerate(cell):
+                        self._retired[i] += value
+            self._cells = alive
+            totals = list(self._retired)
+            for _, cell in alive:
+                for i, value in enumerate(cell):
+                    totals[i] += value
+            return totals
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Child metric for one combination of label values."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """Yield ``(suffix, labels dict, value)`` for the exposition format."""
+        if not self.labelnames:
+            yield from self._child_samples(self._default(), {})
+            return
+        for values, child in list(self._children.items()):
+            yield from self._child_samples(child, dict(zip(self.labelnames, values)))
+
+    def _default(self):
+        return self.labels()
+
+
+class Counter(_Metric):
+    """Monotonic counter (name it ``*_total``); ``inc()`` is lock-free."""
+    kind = 'counter'
+
+    class _Child:
+        __slots__ = ('_cells',)
+
+        def __init__(self):
+            self._cells = _Cells(1)
+
+        def inc(self, amount=1):
+            self._cells.get()[0] += amount
+
+        @property
+        def value(self):
+            return self._cells.totals()[0]
+
+    def _new_child(self):
+        return self._Child()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _child_samples(self, child, labels):
+        yield '', labels, child.value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram; ``observe()`` is lock-free."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=SLOW_BUCKETS, labelnames=(), registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    class _Child:
+        __slots__ = ('_cells', '_buckets')
+
+        def __init__(self, buckets):
+            self._buckets = buckets
+            # one count per bucket, then +Inf, then the sum
+            self._cells = _Cells(len(buckets) + 2)
+
+        def observe(self, value):
+            cell = self._cells.get()
+            cell[bisect_left(self._buckets, value)] += 1
+            cell[-1] += value
+
+        def time(self):
+            return _Timer(self)
+
+    def _new_child(self):
+        return self._Child(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        """Context manager/decorator that observes the elapsed seconds."""
+        return _Timer(self._default())
+
+    def _child_samples(self, child, labels):
+        totals = child._cells.totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), totals[:-1]):
+            cumulative += count
+            yield '_bucket', dict(labels, le=_format_value(bound)), cumulative
+        yield '_sum', labels, totals[-1]
+        yield '_count', labels, cumulative
+
+
+class _Timer:
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+    def __call__(self, func):
+        child = self._child
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+
+
+class Gauge(_Metric):
+    """Value read from ``func()`` at scrape time.
+
+    ``func`` returns a number, or a ``{label values tuple: number}`` dict
+    when the gauge has labels; None skips the sample. With
+    ``kind='counter'`` it exposes a counter kept elsewhere (e.g. a stats dict).
+    """
+
+    def __init__(self, name, help, func, labelnames=(), kind='gauge', registry=None):
+        self.func = func
+        self.kind = kind
+        super().__init__(name, help, labelnames, registry)
+
+    def samples(self):
+        try:
+            value = self.func()
+        except Exception:
+            return
+        if value is None:
+            return
+        if not self.labelnames:
+            yield '', {}, value
+            return
+        for values, item in value.items():
+            yield '', dict(zip(self.labelnames, values)), item
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                name = metric.name + suffix
+                if labels:
+                    rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    name = f"{name}{{{rendered}}}"
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
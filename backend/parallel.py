@@ -0,0 +1,166 @@
+import sys
+import types
+import threading
+import logging
+import multiprocessing
+import multiprocessing.context
+from datetime import datetime
+from scapy.config import conf
+import capture
+from services import ServiceTable
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(services_file, analysis_window):
+    """Pool initializer: workers only dissect, enrichment stays in the parent."""
+    capture.set_enricher(None)
+    capture.set_analysis_window(analysis_window)
+    if services_file:
+        capture.set_service_table(ServiceTable.load(services_file))
+
+
+def _dissect_batch(batch):
+    """Rebuild and analyze a batch of ``(seq, raw, timestamp, linktype, wirelen)`` frames."""
+    results = []
+    for seq, raw, timestamp, linktype, wirelen in batch:
+        layer = conf.l2types.num2layer.get(linktype, conf.raw_layer)
+        try:
+            packet = layer(raw)
+            packet.time = timestamp
+            packet.wirelen = wirelen
+            results.append(capture.packet_to_dict(packet, seq))
+        except Exception as e:
+            results.append(_error_dict(seq, timestamp, raw, e))
+    return results
+
+
+def _error_dict(seq, timestamp, raw, error):
+    return {
+        "id": seq,
+        "timestamp": datetime.fromtimestamp(float(timestamp)).isoformat(),
+        "summary": "Error processing packet",
+        "size": len(raw),
+        "error": str(error)
+    }
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    """A spawned pool worker that doesn't re-run the parent's main script.
+
+    Spawned children normally execute ``__main__`` again; under the dev
+    server that is app.py, which would build a second capture stack (store,
+    archive, history) in every worker. The workers only need this module.
+    """
+
+    def start(self):
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            super().start()
+        finally:
+            sys.modules['__main__'] = main
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+class ParallelDissector:
+    """Shards raw frames across a multiprocessing pool.
+
+    Frames are grouped into batches (``batch_size`` frames or
+    ``flush_interval`` seconds, whichever comes first) to amortize IPC. Each
+    worker rebuilds the scapy packet from its bytes and runs packet_to_dict;
+    batches complete out of order, so results go through a re-order buffer
+    keyed by sequence number and ``emit(packet_dict)`` always sees them in
+    sequence order. At most ``max_pending`` batches are in flight; beyond
+    that dispatching a batch blocks the producer.
+
+    Workers are spawned, never forked: by the time the pool starts, the
+    process runs the sniffer, the store writer and the server threads, and a
+    forked child could inherit one of their locks held.
+    """
+
+    def __init__(self, emit, workers=None, batch_size=64, flush_interval=0.05,
+                 max_pending=None, services_file=None, analysis_window=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._emit = emit
+        self._pool = _WorkerContext().Pool(self.workers, initializer=_init_worker,
+                                           initargs=(services_file, analysis_window))
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._batch = []
+        self._batch_lock = threading.Lock()
+        self._reorder = {}  # first seq of a batch -> its results
+        self._reorder_lock = threading.Lock()
+        self._next_emit = None
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='dissector-flush',
+                                         daemon=True)
+        self._flusher.start()
+        logger.info(f"Parallel dissection with {self.workers} worker processes")
+
+    def submit(self, seq, raw, timestamp, linktype, wirelen=None):
+        """Queue one frame; ``seq`` values must be consecutive."""
+        batch = self.add(seq, raw, timestamp, linktype, wirelen)
+        if batch:
+            self.dispatch(batch)
+
+    def add(self, seq, raw, timestamp, linktype, wirelen=None):
+        """Queue one frame without blocking; returns the batch it completed,
+        for the caller to ``dispatch`` once it holds no locks of its own."""
+        with self._batch_lock:
+            if self._next_emit is None:
+                self._next_emit = seq
+            self._batch.append((seq, raw, float(timestamp), linktype, wirelen or len(raw)))
+            if len(self._batch) < self.batch_size:
+                return None
+            batch, self._batch = self._batch, []
+        return batch
+
+    def flush(self):
+        with self._batch_lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self.dispatch(batch)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def dispatch(self, batch):
+        """Send a batch to the pool; blocks while ``max_pending`` are in flight."""
+        self._slots.acquire()
+        self._pool.apply_async(
+            _dissect_batch, (batch,),
+            callback=lambda results, first=batch[0][0]: self._collect(first, results),
+            error_callback=lambda e, batch=batch: self._collect(
+                batch[0][0], [_error_dict(seq, ts, raw, e) for seq, raw, ts, _, _ in batch]))
+
+    def _collect(self, first_seq, results):
+        """Runs on the pool's result thread; releases batches in order."""
+        self._slots.release()
+        with self._reorder_lock:
+            self._reorder[first_seq] = results
+            while self._next_emit in self._reorder:
+                ready = self._reorder.pop(self._next_emit)
+                self._next_emit += len(ready)
+                for packet_dict in ready:
+                    try:
+                        self._emit(packet_dict)
+                    except Exception as e:
+                        logger.error(f"Error publishing packet {packet_dict.get('id')}: {str(e)}")
+
+    @property
+    def pending(self):
+        """Batches waiting in the re-order buffer."""
+        return len(self._reorder)
+
+    def close(self):
+        """Dissect whatever is queued, then stop the workers."""
+        self._closed.set()
+        self.flush()
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,211 @@
+import math
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+BITMAP_BITS = 1024  # per linear-counting bitmap; counts stay accurate well past 1000 distinct values
+ALERT_TYPES = ('port_scan', 'host_sweep', 'syn_scan')
+_MASK64 = (1 << 64) - 1
+
+
+def _bit(value):
+    """Bitmap position of a port or address.
+
+    hash() goes through the splitmix64 finalizer first: linear counting
+    needs random-looking bits, and hashes of consecutive ports aren't.
+    """
+    x = hash(value) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return 1 << ((x ^ (x >> 31)) & (BITMAP_BITS - 1))
+
+
+def distinct(bitmap):
+    """Linear-counting estimate of how many distinct values set ``bitmap``."""
+    zeros = BITMAP_BITS - bitmap.bit_count()
+    if zeros == 0:
+        return round(BITMAP_BITS * math.log(BITMAP_BITS))
+    return round(-BITMAP_BITS * math.log(zeros / BITMAP_BITS))
+
+
+class _Source:
+    """Probe counters of one source address over two half-window generations."""
+    __slots__ = ('ip', 'generation', 'ports', 'hosts', 'syn', 'syn_ack', 'previous',
+                 'first_seen', 'last_seen', 'alerts')
+
+    def __init__(self, ip, generation, timestamp):
+        self.ip = ip
+        self.generation = generation
+        self.ports = self.hosts = 0
+        self.syn = self.syn_ack = 0
+        self.previous = (0, 0, 0, 0)  # ports, hosts, syn, syn_ack of the last generation
+        self.first_seen = self.last_seen = timestamp
+        self.alerts = {}  # type -> alert dict, raised once while the source stays active
+
+    def advance(self, generation):
+        if generation == self.generation:
+            return
+        if generation == self.generation + 1:
+            self.previous = (self.ports, self.hosts, self.syn, self.syn_ack)
+        elif generation > self.generation:
+            self.previous = (0, 0, 0, 0)
+        else:
+            return  # late packet: count it in the current generation
+        self.generation = generation
+        self.ports = self.hosts = 0
+        self.syn = self.syn_ack = 0
+
+    def totals(self):
+        ports, hosts, syn, syn_ack = self.previous
+        return (distinct(self.ports | ports), distinct(self.hosts | hosts),
+                self.syn + syn, self.syn_ack + syn_ack)
+
+
+def _is_probe(packet_dict):
+    """Whether a packet opens (or probes) something rather than answering.
+
+    TCP segments without ACK (SYN, FIN, NULL and Xmas probes), UDP not sent
+    from a well-known service port, and ICMP echo requests.
+    """
+    protocol = packet_dict.get('protocol')
+    if protocol == 6:
+        return 'A' not in packet_dict.get('flags', '')
+    if protocol == 17:
+        return packet_dict.get('src_port', 0) >= 1024
+    if protocol == 1:
+        icmp = (packet_dict.get('technical_details') or {}).get('icmp') or {}
+        return icmp.get('type') == 8
+    return False
+
+
+class ScanDetector:
+    """Stateful scan detection keyed by source address.
+
+    For each source, distinct destination ports and hosts of its probes are
+    kept in linear-counting bitmaps (BITMAP_BITS bits each), along with the
+    SYNs it sent and the SYN-ACKs it got back. Counters cover the current
+    and previous half of ``window`` seconds of packet time, so they slide
+    with the traffic. An alert is raised when a source crosses a threshold:
+    ``port_threshold`` distinct ports (port_scan), ``host_threshold``
+    distinct hosts (host_sweep), or at least ``min_syns`` SYNs of which no
+    more than ``syn_ack_ratio`` were answered (syn_scan). Sources idle for
+    two windows are forgotten, and at most ``max_sources`` are tracked.
+    """
+
+    def __init__(self, window=60, port_threshold=100, host_threshold=100, min_syns=50,
+                 syn_ack_ratio=0.2, max_sources=10000, max_alerts=1000):
+        self.window = window
+        self.port_threshold = port_threshold
+        self.host_threshold = host_threshold
+        self.min_syns = min_syns
+        self.syn_ack_ratio = syn_ack_ratio
+        self.max_sources = max_sources
+        self._half = window / 2
+        self._sources = OrderedDict()  # least recently active first
+        self._alerts = deque(maxlen=max_alerts)
+        self._lock = threading.Lock()
+        self._clock = 0.0
+        self.stats = {'packets': 0, 'probes': 0, 'evicted': 0,
+                      'alerts': dict.fromkeys(ALERT_TYPES, 0)}
+
+    def __len__(self):
+        return len(self._sources)
+
+    def add_packet(self, packet_dict):
+        """Account a packet_to_dict result; returns the alerts it raised."""
+        src_ip = packet_dict.get('src_ip')
+        dst_ip = packet_dict.get('dst_ip')
+        if src_ip is None or dst_ip is None:
+            return []
+        timestamp = datetime.fromisoformat(packet_dict['timestamp']).timestamp()
+        generation = int(timestamp // self._half)
+        flags = packet_dict.get('flags', '') if packet_dict.get('protocol') == 6 else ''
+        probe = _is_probe(packet_dict)
+
+        with self._lock:
+            self.stats['packets'] += 1
+            sources = self._sources
+            if timestamp > self._clock:
+                self._clock = timestamp
+                self._expire(timestamp - 2 * self.window)
+
+            if 'S' in flags and 'A' in flags:
+                # Handshake answered: credit the source the SYN-ACK goes to
+                target = sources.get(dst_ip)
+                if target is not None:
+                    target.advance(generation)
+                    target.syn_ack += 1
+            if not probe:
+                return []
+
+            self.stats['probes'] += 1
+            source = sources.get(src_ip)
+            if source is None:
+                if len(sources) >= self.max_sources:
+                    sources.popitem(last=False)
+                    self.stats['evicted'] += 1
+                source = sources[src_ip] = _Source(src_ip, generation, timestamp)
+            else:
+                sources.move_to_end(src_ip)
+                source.advance(generation)
+            source.last_seen = max(source.last_seen, timestamp)
+            source.hosts |= _bit(dst_ip)
+            dst_port = packet_dict.get('dst_port')
+            if dst_port is not None:
+                source.ports |= _bit(dst_port)
+            if 'S' in flags and 'A' not in flags:
+                source.syn += 1
+            return self._check(source, packet_dict.get('id'))
+
+    def _check(self, source, packet_id):
+        ports, hosts, syn, syn_ack = source.totals()
+        crossed = []
+        if ports >= self.port_threshold:
+            crossed.append('port_scan')
+        if hosts >= self.host_threshold:
+            crossed.append('host_sweep')
+        if syn >= self.min_syns and syn_ack <= syn * self.syn_ack_ratio:
+            crossed.append('syn_scan')
+
+        raised = []
+        last_seen = datetime.fromtimestamp(source.last_seen).isoformat()
+        for kind in crossed:
+            alert = source.alerts.get(kind)
+            if alert is None:
+                alert = source.alerts[kind] = {
+                    'type': kind,
+                    'source': source.ip,
+                    'first_seen': datetime.fromtimestamp(source.first_seen).isoformat(),
+                    'detected_at': last_seen,
+                    'packet_id': packet_id
+                }
+                self._alerts.append(alert)
+                self.stats['alerts'][kind] += 1
+                raised.append(alert)
+            # Ongoing scans keep their alert up to date
+            alert.update(last_seen=last_seen, distinct_ports=ports, distinct_hosts=hosts,
+                         syn=syn, syn_ack=syn_ack)
+        return raised
+
+    def _expire(self, cutoff):
+        sources = self._sources
+        while sources:
+            source = next(iter(sources.values()))
+            if source.last_seen >= cutoff:
+                break
+            sources.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def alerts(self, limit=100, kind=None, source=None):
+        """Newest alerts first."""
+        if kind is not None and kind not in ALERT_TYPES:
+            raise ValueError(f"Unknown alert type {kind!r}; expected one of {', '.join(ALERT_TYPES)}")
+        with self._lock:
+            selected = [dict(alert) for alert in reversed(self._alerts)
+                        if (kind is None or alert['type'] == kind)
+                        and (source is None or alert['source'] == source)]
+        return selected[:limit]
+
+    def status(self):
+        return dict(self.stats, alerts=dict(self.stats['alerts']), sources=len(self._sources),
+                    max_sources=self.max_sources, window=self.window)
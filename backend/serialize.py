@@ -0,0 +1,48 @@
+import json
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder produces the same JSON, only slower
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Compact JSON as UTF-8 bytes; unknown types are encoded with str()."""
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(default=str, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(obj):
+        """Compact JSON as UTF-8 bytes; unknown types are encoded with str()."""
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+def packet_list(encoded, fields):
+    """JSON object bytes with the pre-encoded packets under ``packets``,
+    followed by ``fields``. Packets are spliced in as they are, never
+    re-encoded."""
+    tail = dumps(fields)
+    body = b'{"packets":[' + b','.join(encoded)
+    return body + (b'],' + tail[1:] if len(tail) > 2 else b']}')
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps()/loads() (orjson when installed)."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
@@ -0,0 +1,67 @@
+import os
+import signal
+import socket
+import logging
+import threading
+from waitress import wasyncore
+from waitress.server import create_server
+
+logger = logging.getLogger(__name__)
+
+
+def serve(host='127.0.0.1', port=5000, threads=16, shutdown_timeout=10.0):
+    """Capture and serve the whole API from this process until SIGINT or SIGTERM.
+
+    The app runs under waitress with ``threads`` request threads sharing the
+    one capture engine; each live stream or pcap export holds a thread while
+    it lasts. Startup: the port is bound before the app is imported, so a
+    port in use fails right away, and the sniffer starts before the first
+    request is accepted. Shutdown: the listener closes, requests in flight
+    get up to ``shutdown_timeout`` seconds, then the sniffer stops and app's
+    atexit hooks flush the persistent store and the frame archive. Returns
+    the exit status.
+    """
+    listener = socket.create_server((host, port), backlog=128)
+    import app as backend
+
+    server = create_server(backend.app, sockets=[listener], threads=threads, ident='osi-visualizer')
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: stopping.set())
+
+    def shutdown():
+        stopping.wait()
+        # Runs in the server's loop thread: with every socket closed, run() returns
+        server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map))
+
+    threading.Thread(target=shutdown, name='serve-stop', daemon=True).start()
+    backend.engine.start()
+    logger.info(f"Process {os.getpid()} capturing and serving on {host}:{port} "
+                f"with {threads} threads")
+    try:
+        server.run()
+    finally:
+        server.task_dispatcher.shutdown(timeout=shutdown_timeout)
+        backend.engine.stop()
+    logger.info("Stopped")
+    return 0
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Capture and serve the API under a multi-threaded WSGI server')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('-t', '--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 16)),
+                        help='request threads')
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    raise SystemExit(serve(args.host, args.port, args.threads,
+                           shutdown_timeout=float(os.environ.get('SERVE_SHUTDOWN_TIMEOUT', 10))))
+
+
+if __name__ == '__main__':
+    main()
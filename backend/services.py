@@ -0,0 +1,62 @@
+import os
+import json
+from collections import namedtuple
+
+DEFAULT_SERVICES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services.json')
+
+# priority is the entry's position in the file: when both ports of a packet
+# are known services, the one listed first wins
+Service = namedtuple('Service', 'priority name encryption indicator')
+
+
+def _expand_ports(ports):
+    """Yield ports from a list of numbers and "start-end" range strings."""
+    for port in ports:
+        if isinstance(port, str) and '-' in port:
+            start, end = port.split('-', 1)
+            yield from range(int(start), int(end) + 1)
+        else:
+            yield int(port)
+
+
+class ServiceTable:
+    """Port to application protocol lookup shared by all analyzers.
+
+    Each transport gets a precomputed 65536-entry list, so classifying a
+    packet is two list indexes regardless of how many services are defined.
+    """
+
+    TRANSPORTS = ('tcp', 'udp')
+
+    def __init__(self, definitions):
+        self.tables = {}
+        for transport in self.TRANSPORTS:
+            table = [None] * 65536
+            for priority, entry in enumerate(definitions.get(transport, [])):
+                service = Service(priority, entry['name'], entry.get('encryption'),
+                                  entry.get('indicator'))
+                for port in _expand_ports(entry['ports']):
+                    if not 0 <= port <= 65535:
+                        raise ValueError(f"Invalid {transport} port {port} for {entry['name']}")
+                    current = table[port]
+                    if current is None or current.priority > priority:
+                        table[port] = service
+            self.tables[transport] = table
+
+    @classmethod
+    def load(cls, path=DEFAULT_SERVICES_FILE):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def lookup(self, transport, sport, dport):
+        """Return the Service for a port pair, or None if neither port is known."""
+        table = self.tables.get(transport)
+        if table is None or sport is None or dport is None:
+            return None
+        by_dport = table[dport]
+        by_sport = table[sport]
+        if by_dport is None:
+            return by_sport
+        if by_sport is None or by_dport.priority <= by_sport.priority:
+            return by_dport
+        return by_sport
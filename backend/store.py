@@ -0,0 +1,453 @@
+import os
+import queue
+import struct
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from serialize import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('<IQd')  # payload length, sequence number, packet time
+INDEX_ENTRY = struct.Struct('<QQdd')  # block: first seq, file offset, min and max packet time
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+
+def parse_time(value):
+    """Epoch seconds from ``1700000000``, ``'1700000000.5'`` or an ISO
+    datetime; None stays None."""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r}")
+
+
+class _Segment:
+    """One segment file and its sparse block index.
+
+    Every ``block_records`` records start a block; the index keeps the
+    block's first sequence number and file offset, and the range of packet
+    times inside it (pcap uploads can interleave old packets with live ones,
+    so time is not assumed to be monotonic).
+    """
+    __slots__ = ('path', 'first_seq', 'last_seq', 'count', 'size', 'min_ts', 'max_ts',
+                 'created', 'modified', 'seqs', 'offsets', 'mins', 'maxs')
+
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = first_seq - 1
+        self.count = 0
+        self.size = 0
+        self.min_ts = float('inf')
+        self.max_ts = float('-inf')
+        self.created = self.modified = time.time()
+        self.seqs = array('Q')
+        self.offsets = array('Q')
+        self.mins = array('d')
+        self.maxs = array('d')
+
+    def note(self, seq, timestamp, offset, block_records):
+        """Index a record written at ``offset``."""
+        if self.count % block_records == 0:
+            self.seqs.append(seq)
+            self.offsets.append(offset)
+            self.mins.append(timestamp)
+            self.maxs.append(timestamp)
+        else:
+            if timestamp < self.mins[-1]:
+                self.mins[-1] = timestamp
+            if timestamp > self.maxs[-1]:
+                self.maxs[-1] = timestamp
+        self.count += 1
+        self.last_seq = seq
+        self.min_ts = min(self.min_ts, timestamp)
+        self.max_ts = max(self.max_ts, timestamp)
+
+    def blocks(self):
+        """``(first seq, start offset, end offset, min time, max time)`` per block."""
+        ends = list(self.offsets[1:]) + [self.size]
+        return list(zip(self.seqs, self.offsets, ends, self.mins, self.maxs))
+
+    def save_index(self):
+        """Write the sidecar index of a sealed segment (header entry first)."""
+        path = self.path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        entries = [INDEX_ENTRY.pack(self.last_seq, self.count, self.min_ts, self.max_ts)]
+        entries += [INDEX_ENTRY.pack(*entry)
+                    for entry in zip(self.seqs, self.offsets, self.mins, self.maxs)]
+        with open(path + '.tmp', 'wb') as f:
+            f.write(b''.join(entries))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load_index(cls, path, first_seq):
+        """Segment rebuilt from its sidecar index, or None if there is none."""
+        index = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        try:
+            with open(index, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if not data or len(data) % INDEX_ENTRY.size:
+            return None
+        segment = cls(path, first_seq)
+        segment.last_seq, segment.count, segment.min_ts, segment.max_ts = INDEX_ENTRY.unpack_from(data)
+        for seq, offset, low, high in INDEX_ENTRY.iter_unpack(data[INDEX_ENTRY.size:]):
+            segment.seqs.append(seq)
+            segment.offsets.append(offset)
+            segment.mins.append(low)
+            segment.maxs.append(high)
+        segment.size = os.path.getsize(path)
+        segment.modified = os.path.getmtime(path)
+        return segment
+
+
+class PacketStore:
+    """Append-only on-disk packet history.
+
+    Packets are kept as JSON in segment files of length-prefixed records
+    (RECORD_HEADER, then the payload), named after their first sequence
+    number. A segment is sealed once it reaches ``segment_bytes`` or is
+    ``segment_seconds`` old; sealed segments get a sidecar
+    sparse index and are never modified again, only deleted whole when they
+    fall out of the retention (``retention_seconds`` since their last write,
+    or ``retention_bytes`` for the whole store). The open segment's index is
+    rebuilt from its record headers on startup, and a record torn by a crash
+    is cut off.
+
+    add_packet() only queues the packet: a background thread encodes and
+    appends batches of up to ``batch_size`` packets every ``flush_interval``
+    seconds, which also gives enrichment lookups time to settle. When the
+    queue holds ``max_queue`` packets new ones are dropped rather than
+    blocking capture.
+    """
+
+    def __init__(self, path, segment_bytes=64 * 1024 * 1024, segment_seconds=3600,
+                 retention_seconds=None, retention_bytes=None, block_records=256,
+                 batch_size=1000, flush_interval=1.0, max_queue=100000):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+        self.block_records = block_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {'written': 0, 'dropped': 0, 'errors': 0, 'expired_segments': 0}
+        self._segments = []  # oldest first; the last one is open for writing
+        self._file = None
+        self._lock = threading.Lock()  # guards _segments and their indexes
+        self._queue = queue.Queue(maxsize=max_queue)
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        self._writer = threading.Thread(target=self._run, name='packet-store', daemon=True)
+        self._writer.start()
+
+    @property
+    def last_seq(self):
+        return self._segments[-1].last_seq if self._segments else 0
+
+    @property
+    def first_seq(self):
+        return self._segments[0].first_seq if self._segments else 0
+
+    @property
+    def nbytes(self):
+        return sum(segment.size for segment in self._segments)
+
+    def __len__(self):
+        return sum(segment.count for segment in self._segments)
+
+    # Startup
+
+    def _load(self):
+        names = sorted(name for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX))
+        for i, name in enumerate(names):
+            path = os.path.join(self.path, name)
+            first_seq = int(name[:-len(SEGMENT_SUFFIX)])
+            segment = None
+            if i < len(names) - 1:
+                segment = _Segment.load_index(path, first_seq)
+            if segment is None:
+                segment = self._scan(path, first_seq)
+                if i < len(names) - 1:
+                    segment.save_index()
+            self._segments.append(segment)
+        if self._segments:
+            self._file = open(self._segments[-1].path, 'ab')
+        logger.info(f"Packet store at {self.path}: {len(self._segments)} segments, "
+                    f"last seq {self.last_seq}")
+
+    def _scan(self, path, first_seq):
+        """Index a segment from its record headers, cutting off a torn tail."""
+        segment = _Segment(path, first_seq)
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, seq, timestamp = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + length
+            if end > len(data):
+                break
+            segment.note(seq, timestamp, offset, self.block_records)
+            offset = end
+        if offset < len(data):
+            logger.warning(f"Truncating {len(data) - offset} bytes of a partial record in {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        segment.size = offset
+        segment.modified = os.path.getmtime(path)
+        return segment
+
+    # Writing
+
+    def add_packet(self, packet_dict):
+        """Queue a packet_to_dict result for the writer thread."""
+        try:
+            self._queue.put_nowait(packet_dict)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is on disk."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write what is queued, stop the writer and close the open segment."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self._expire()
+            except Exception as e:
+                self.stats['errors'] += len(batch)
+                logger.error(f"Packet store failed to write {len(batch)} packets: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write(self, batch):
+        chunks, notes = [], []
+        segment = self._segments[-1] if self._segments else None
+        size = segment.size if segment else 0
+        last_seq = self.last_seq
+        for packet in batch:
+            try:
+                seq = packet['id']
+                if seq <= last_seq:
+                    raise ValueError(f"sequence {seq} is not after {last_seq}")
+                timestamp = datetime.fromisoformat(packet['timestamp']).timestamp()
+                payload = dumps(packet)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Packet store skipped packet {packet.get('id')}: {str(e)}")
+                continue
+            if (segment is None or size >= self.segment_bytes
+                    or time.time() - segment.created >= self.segment_seconds):
+                self._commit(chunks, notes, size)
+                chunks, notes = [], []
+                segment = self._roll(seq)
+                size = 0
+            chunks.append(RECORD_HEADER.pack(len(payload), seq, timestamp))
+            chunks.append(payload)
+            notes.append((seq, timestamp, size))
+            size += RECORD_HEADER.size + len(payload)
+            last_seq = seq
+        self._commit(chunks, notes, size)
+
+    def _commit(self, chunks, notes, size):
+        if not notes:
+            return
+        self._file.write(b''.join(chunks))
+        self._file.flush()
+        segment = self._segments[-1]
+        with self._lock:
+            for seq, timestamp, offset in notes:
+                segment.note(seq, timestamp, offset, self.block_records)
+            segment.size = size
+            segment.modified = time.time()
+        self.stats['written'] += len(notes)
+
+    def _roll(self, first_seq):
+        """Seal the open segment and start one at ``first_seq``."""
+        if self._file is not None:
+            self._file.close()
+            current = self._segments[-1]
+            if current.count:
+                current.save_index()
+            else:  # never written to: replace it
+                with self._lock:
+                    self._segments.pop()
+                os.remove(current.path)
+        segment = _Segment(os.path.join(self.path, f"{first_seq:020d}{SEGMENT_SUFFIX}"), first_seq)
+        self._file = open(segment.path, 'ab')
+        with self._lock:
+            self._segments.append(segment)
+        return segment
+
+    def _expire(self):
+        """Delete sealed segments that fall out of the retention."""
+        cutoff = time.time() - self.retention_seconds if self.retention_seconds else None
+        expired = []
+        with self._lock:
+            total = sum(segment.size for segment in self._segments)
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                if not ((cutoff is not None and oldest.modified < cutoff)
+                        or (self.retention_bytes and total > self.retention_bytes)):
+                    break
+                expired.append(self._segments.pop(0))
+                total -= oldest.size
+        for segment in expired:
+            for path in (segment.path, segment.path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.stats['expired_segments'] += 1
+        if expired:
+            logger.info(f"Packet store expired {len(expired)} segments")
+
+    # Reading
+
+    def read(self, after=None, since=None, until=None, limit=1000):
+        """Stored records as ``(seq, timestamp, payload bytes)``, oldest first.
+
+        ``after`` selects sequence numbers greater than it, ``since`` and
+        ``until`` packet times (epoch seconds) in ``[since, until)``. The
+        indexes pick the segments and blocks to read, so a range costs
+        about what it returns, however long the history.
+        """
+        plan = []
+        with self._lock:
+            for segment in self._segments:
+                if not segment.count or (after is not None and segment.last_seq <= after):
+                    continue
+                if since is not None and segment.max_ts < since:
+                    continue
+                if until is not None and segment.min_ts >= until:
+                    continue
+                plan.append((segment.path, segment.blocks()))
+
+        records = []
+        for path, blocks in plan:
+            if after is not None:
+                blocks = blocks[max(bisect_right([b[0] for b in blocks], after) - 1, 0):]
+            ranges = []  # coalesced (start, end) file ranges of the selected blocks
+            for _, start, end, low, high in blocks:
+                if (since is not None and high < since) or (until is not None and low >= until):
+                    continue
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1][1] = end
+                else:
+                    ranges.append([start, end])
+            try:
+                with open(path, 'rb') as f:
+                    for start, end in ranges:
+                        f.seek(start)
+                        if self._parse(f.read(end - start), records, after, since, until, limit):
+                            return records
+            except FileNotFoundError:
+                continue  # expired while we were reading
+        return records
+
+    def get(self, seqs):
+        """``{seq: payload bytes}`` for the given sequence numbers still stored.
+
+        Each is located through the segment and block indexes, and every
+        block involved is read once.
+        """
+        with self._lock:
+            segments = [(segment.first_seq, segment.path, segment.blocks())
+                        for segment in self._segments if segment.count]
+        firsts = [first for first, _, _ in segments]
+        wanted = {}  # (path, start, end) -> sequence numbers in that block
+        for seq in set(seqs):
+            i = bisect_right(firsts, seq) - 1
+            if i < 0:
+                continue
+            _, path, blocks = segments[i]
+            j = bisect_right(blocks, (seq, float('inf'))) - 1
+            if j >= 0:
+                _, start, end, _, _ = blocks[j]
+                wanted.setdefault((path, start, end), set()).add(seq)
+
+        found = {}
+        for (path, start, end), block_seqs in sorted(wanted.items()):
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    data = f.read(end - start)
+            except FileNotFoundError:
+                continue
+            records = []
+            self._parse(data, records, None, None, None, len(data))
+            found.update((seq, payload) for seq, _, payload in records if seq in block_seqs)
+        return found
+
+    @staticmethod
+    def _parse(data, records, after, since, until, limit):
+        """Append matching records from ``data``; True once ``limit`` is reached."""
+        offset = 0
+        header = RECORD_HEADER.size
+        while offset + header <= len(data):
+            length, seq, timestamp = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + header
+            offset = start + length
+            if after is not None and seq <= after:
+                continue
+            if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                continue
+            records.append((seq, timestamp, data[start:offset]))
+            if len(records) >= limit:
+                return True
+        return False
+
+    def records(self, after=None, since=None, until=None, limit=1000):
+        """Like read(), decoded into packet dicts."""
+        return [loads(payload) for _, _, payload in self.read(after, since, until, limit)]
+
+    def status(self):
+        with self._lock:
+            segments = len(self._segments)
+        return dict(self.stats, path=self.path, segments=segments, bytes=self.nbytes,
+                    first_seq=self.first_seq, last_seq=self.last_seq, queued=self._queue.qsize(),
+                    retention_seconds=self.retention_seconds, retention_bytes=self.retention_bytes)
@@ -0,0 +1,83 @@
+import time
+import logging
+from serialize import dumps, packet_list
+
+logger = logging.getLogger(__name__)
+
+
+class PacketStream:
+    """Live feed of one client over a CaptureEngine's ring.
+
+    Packets are grouped into batches of up to ``batch_size`` packets, or
+    whatever arrived within ``batch_interval`` seconds of the first one. The
+    ring is the only buffer: a client whose backlog grows past
+    ``max_backlog`` packets (or falls off the end of the ring) skips the
+    oldest ones, and the batch reports how many were dropped. Starting from
+    ``since`` replays everything newer that is still in the ring, which is
+    how reconnecting clients resume.
+    """
+
+    def __init__(self, engine, since=None, batch_size=50, batch_interval=0.25,
+                 max_backlog=1000, heartbeat=15.0):
+        self.engine = engine
+        self.ring = engine.ring
+        self.cursor = self.ring.last_seq if since is None else max(0, since)
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self.max_backlog = max(self.batch_size, max_backlog)
+        self.heartbeat = heartbeat
+        self.sent = 0
+        self.dropped = 0
+
+    def next_batch(self, timeout=None):
+        """Wait for the next batch and return ``(packets, dropped)``.
+
+        Returns None if nothing arrives within ``timeout`` seconds.
+        """
+        engine = self.engine
+        ring = self.ring
+        if not engine.wait_for(self.cursor, timeout):
+            return None
+
+        # Give the batch up to batch_interval to fill
+        deadline = time.monotonic() + self.batch_interval
+        while ring.last_seq - self.cursor < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not engine.wait_for(self.cursor + self.batch_size - 1, remaining):
+                break
+
+        backlog = ring.last_seq - self.cursor
+        if backlog > self.max_backlog:
+            self.cursor = ring.last_seq - self.max_backlog
+        packets = ring.since(self.cursor, limit=self.batch_size)
+        if not packets:
+            return None
+        # Packet ids are ring sequence numbers, so gaps are packets we skipped
+        # or that were overwritten before this client read them
+        dropped = max(0, backlog - self.max_backlog) + packets[-1]['id'] - self.cursor - len(packets)
+        self.cursor = packets[-1]['id']
+        self.sent += len(packets)
+        self.dropped += dropped
+        return packets, dropped
+
+    def events(self):
+        """Yield Server-Sent Events: one ``packets`` event per batch.
+
+        The event id is the last sequence number in the batch, so a browser
+        EventSource resumes from it automatically through Last-Event-ID.
+        A comment line is sent after ``heartbeat`` idle seconds to keep
+        proxies from closing the connection.
+        """
+        yield f"retry: 2000\nevent: hello\ndata: {dumps({'last_seq': self.ring.last_seq}).decode()}\n\n"
+        while True:
+            batch = self.next_batch(self.heartbeat)
+            if batch is None:
+                yield ": keepalive\n\n"
+                continue
+            packets, dropped = batch
+            data = packet_list(self.ring.encoded(packets), {
+                'count': len(packets),
+                'dropped': dropped,
+                'last_seq': self.cursor
+            }).decode('utf-8')
+            yield f"id: {self.cursor}\nevent: packets\ndata: {data}\n\n"
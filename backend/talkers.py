@@ -0,0 +1,213 @@
+import threading
+from datetime import datetime
+from heapq import heappush, heappop, heapreplace
+
+DIMENSIONS = ('src_ip', 'dst_ip', 'pair', 'dst_port', 'application')
+METRICS = ('packets', 'bytes')
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary (Metwally et al.) of at most
+    ``capacity`` keys.
+
+    A key that isn't tracked replaces the one with the smallest count and
+    inherits that count as its error, so every estimate is an upper bound
+    off by at most ``errors[key]``, and any key above total/capacity is
+    guaranteed to be tracked. The smallest count is found through a heap
+    whose entries are refreshed lazily: counts only grow, so a stale entry
+    is always too small and just gets pushed back down.
+    """
+    __slots__ = ('capacity', 'counts', 'errors', 'total', '_heap')
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []  # (count when pushed, key), one entry per tracked key
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, weight=1):
+        self.total += weight
+        counts = self.counts
+        count = counts.get(key)
+        if count is not None:
+            counts[key] = count + weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0
+            heappush(self._heap, (weight, key))
+        else:
+            floor, victim = self._pop_min()
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = floor + weight
+            self.errors[key] = floor
+            heappush(self._heap, (floor + weight, key))
+
+    def _settle(self):
+        """Refresh heap entries until the top one is current."""
+        heap = self._heap
+        counts = self.counts
+        while True:
+            pushed, key = heap[0]
+            current = counts[key]
+            if current == pushed:
+                return pushed, key
+            heapreplace(heap, (current, key))
+
+    def _pop_min(self):
+        entry = self._settle()
+        heappop(self._heap)
+        return entry
+
+    @property
+    def floor(self):
+        """Upper bound on the count of any key that isn't tracked."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return self._settle()[0]
+
+
+def _keys(packet_dict):
+    src_ip = packet_dict.get('src_ip')
+    dst_ip = packet_dict.get('dst_ip')
+    pair = None
+    if src_ip and dst_ip:
+        pair = (src_ip, dst_ip) if src_ip <= dst_ip else (dst_ip, src_ip)
+    return (
+        ('src_ip', src_ip),
+        ('dst_ip', dst_ip),
+        ('pair', pair),
+        ('dst_port', packet_dict.get('dst_port')),
+        ('application', (packet_dict.get('layers') or {}).get('application')),
+    )
+
+
+class TopTalkers:
+    """Streaming top-K hosts, conversations, ports and application protocols.
+
+    Each ``interval`` seconds of packet time get their own SpaceSaving
+    summaries, by packet count and by bytes, for every dimension; the last
+    ``intervals`` are kept and merged at query time, so memory is bounded by
+    ``intervals * capacity`` keys per summary no matter how many distinct
+    addresses are seen.
+    """
+
+    def __init__(self, capacity=200, interval=60, intervals=60):
+        self.capacity = capacity
+        self.interval = interval
+        self.intervals = intervals
+        self._slots = [None] * intervals  # (stamp, {(dimension, metric): SpaceSaving})
+        self._newest = None
+        self._lock = threading.Lock()
+        self.stats = {'packets': 0, 'late': 0, 'resets': 0}
+
+    @property
+    def span(self):
+        return self.interval * self.intervals
+
+    def add_packet(self, packet_dict):
+        """Account a packet_to_dict result."""
+        timestamp = datetime.fromisoformat(packet_dict['timestamp']).timestamp()
+        size = packet_dict.get('size', 0)
+        keys = _keys(packet_dict)
+        stamp = int(timestamp // self.interval)
+        with self._lock:
+            self.stats['packets'] += 1
+            if self._newest is not None and stamp <= self._newest - self.intervals:
+                self.stats['late'] += 1
+                return
+            index = stamp % self.intervals
+            slot = self._slots[index]
+            if slot is None or slot[0] < stamp:
+                slot = self._slots[index] = (stamp, {
+                    (dimension, metric): SpaceSaving(self.capacity)
+                    for dimension in DIMENSIONS for metric in METRICS})
+            if self._newest is None or stamp > self._newest:
+                self._newest = stamp
+            sketches = slot[1]
+            for dimension, key in keys:
+                if key is None:
+                    continue
+                sketches[(dimension, 'packets')].add(key)
+                sketches[(dimension, 'bytes')].add(key, size)
+
+    def query(self, k=10, window=None, by='bytes', dimensions=DIMENSIONS):
+        """Top ``k`` keys per dimension over the last ``window`` seconds
+        (default: everything kept), ranked by ``by`` ('packets' or 'bytes').
+
+        Each entry has the estimated ``count``, its maximum overestimate
+        ``error`` and the ``share`` of the window's total.
+        """
+        if by not in METRICS:
+            raise ValueError(f"Unknown metric {by!r}; expected one of {', '.join(METRICS)}")
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension {dimension!r}; expected one of {', '.join(DIMENSIONS)}")
+        window = self.span if window is None else int(window)
+        if not 1 <= window <= self.span:
+            raise ValueError(f"window must be between 1 and {self.span} seconds")
+        count = -(-window // self.interval)
+
+        with self._lock:
+            newest = self._newest
+            slots = []
+            if newest is not None:
+                for stamp in range(newest - count + 1, newest + 1):
+                    slot = self._slots[stamp % self.intervals]
+                    if slot is not None and slot[0] == stamp:
+                        slots.append(slot[1])
+            result = {dimension: self._merge([s[(dimension, by)] for s in slots], k)
+                      for dimension in dimensions}
+
+        start = (newest - count + 1) * self.interval if newest is not None else None
+        return {'by': by, 'k': k, 'window': count * self.interval, 'start': start, 'top': result}
+
+    @staticmethod
+    def _merge(sketches, k):
+        """Combine per-interval summaries: a key missing from a full summary
+        may still have up to that summary's floor, which goes into its error."""
+        total = sum(sketch.total for sketch in sketches)
+        floors = 0
+        estimates = {}  # key -> [count, error, floors of the summaries holding it]
+        for sketch in sketches:
+            floor = sketch.floor
+            floors += floor
+            errors = sketch.errors
+            for key, value in sketch.counts.items():
+                entry = estimates.get(key)
+                if entry is None:
+                    estimates[key] = [value, errors[key], floor]
+                else:
+                    entry[0] += value
+                    entry[1] += errors[key]
+                    entry[2] += floor
+        for entry in estimates.values():
+            missing = floors - entry[2]
+            entry[0] += missing
+            entry[1] += missing
+        top = sorted(estimates.items(), key=lambda item: item[1][0], reverse=True)[:k]
+        return {
+            'total': total,
+            'entries': [{'key': list(key) if isinstance(key, tuple) else key,
+                         'count': value, 'error': error,
+                         'share': round(value / total, 4) if total else 0.0}
+                        for key, (value, error, _) in top]
+        }
+
+    def reset(self):
+        """Forget everything counted so far."""
+        with self._lock:
+            self._slots = [None] * self.intervals
+            self._newest = None
+            self.stats['resets'] += 1
+
+    def status(self):
+        with self._lock:
+            tracked = sum(len(sketch) for slot in self._slots if slot is not None
+                          for sketch in slot[1].values())
+        return dict(self.stats, capacity=self.capacity, interval=self.interval,
+                    intervals=self.intervals, tracked_keys=tracked)
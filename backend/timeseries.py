@@ -0,0 +1,182 @@
+import threading
+from datetime import datetime
+from flows import PROTOCOL_NAMES
+
+DIMENSIONS = ('protocol', 'layer', 'risk', 'application')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value):
+    """Seconds from ``300``, ``'300'``, ``'5m'``, ``'1h'``...; None stays None."""
+    if value in (None, ''):
+        return None
+    text = str(value).strip().lower()
+    unit = _UNITS.get(text[-1:])
+    try:
+        seconds = int(text[:-1]) * unit if unit else int(text)
+    except ValueError:
+        raise ValueError(f"Invalid duration: {value!r}")
+    if seconds < 1:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return seconds
+
+
+def _keys(packet_dict):
+    """Group keys of one packet for each dimension (a packet counts once
+    for every OSI layer it carries)."""
+    layers = packet_dict.get('layers') or {}
+    protocol = packet_dict.get('protocol')
+    if protocol is not None:
+        protocol = PROTOCOL_NAMES.get(protocol, str(protocol))
+    else:
+        protocol = layers.get('network') or 'other'
+    risk = (packet_dict.get('security_assessment') or {}).get('risk_level') or 'unknown'
+    application = layers.get('application')
+    return (
+        ('protocol', (protocol,)),
+        ('layer', tuple(name for name, value in layers.items() if value)),
+        ('risk', (risk,)),
+        ('application', (application,) if application else ()),
+    )
+
+
+class _Ring:
+    """Fixed ring of ``count`` buckets, ``width`` seconds each.
+
+    A bucket is ``[stamp, packets, bytes, {dimension: {key: [packets, bytes]}}]``
+    where ``stamp`` is the bucket's start time divided by ``width``.
+    """
+
+    def __init__(self, width, count):
+        self.width = width
+        self.count = count
+        self.slots = [None] * count
+        self.newest = None
+
+    @property
+    def span(self):
+        return self.width * self.count
+
+    def add(self, timestamp, size, keys):
+        stamp = int(timestamp // self.width)
+        if self.newest is not None and stamp <= self.newest - self.count:
+            return False  # older than anything the ring still holds
+        index = stamp % self.count
+        bucket = self.slots[index]
+        if bucket is None or bucket[0] < stamp:
+            bucket = self.slots[index] = [stamp, 0, 0, {dimension: {} for dimension in DIMENSIONS}]
+        if self.newest is None or stamp > self.newest:
+            self.newest = stamp
+        bucket[1] += 1
+        bucket[2] += size
+        groups = bucket[3]
+        for dimension, values in keys:
+            counts = groups[dimension]
+            for value in values:
+                entry = counts.get(value)
+                if entry is None:
+                    counts[value] = [1, size]
+                else:
+                    entry[0] += 1
+                    entry[1] += size
+        return True
+
+    def get(self, stamp):
+        bucket = self.slots[stamp % self.count]
+        return bucket if bucket is not None and bucket[0] == stamp else None
+
+
+class TrafficSeries:
+    """Packets and bytes over time, pre-aggregated at ingest.
+
+    Every packet is added to a per-second bucket and to a per-minute bucket,
+    each broken down by protocol, OSI layer, risk level and application
+    protocol. Per-second buckets cover the last ``seconds`` seconds, per-minute
+    buckets the last ``minutes`` minutes. Time is packet time, as in the flow
+    table, so pcap replays chart the same way as live traffic. Queries only
+    touch the buckets in their window.
+    """
+
+    def __init__(self, seconds=3600, minutes=1440):
+        self._rings = (_Ring(1, seconds), _Ring(60, minutes))
+        self._lock = threading.Lock()
+        self.stats = {'packets': 0, 'late': 0}
+
+    def add_packet(self, packet_dict):
+        """Account a packet_to_dict result."""
+        timestamp = datetime.fromisoformat(packet_dict['timestamp']).timestamp()
+        size = packet_dict.get('size', 0)
+        keys = _keys(packet_dict)
+        with self._lock:
+            self.stats['packets'] += 1
+            added = [ring.add(timestamp, size, keys) for ring in self._rings]
+            if not any(added):
+                self.stats['late'] += 1
+
+    def query(self, window=300, resolution=None, group_by='protocol', end=None):
+        """Series of packets and bytes per ``resolution``-second bucket.
+
+        ``window`` seconds are returned, ending at ``end`` (default: the
+        newest packet). The finest ring that covers the window is used
+        unless ``resolution`` asks for minute buckets; ``resolution`` must be
+        a multiple of that ring's bucket width. ``group_by`` is one of
+        DIMENSIONS, or None for the totals only.
+        """
+        if group_by is not None and group_by not in DIMENSIONS:
+            raise ValueError(f"Unknown group_by {group_by!r}; expected one of {', '.join(DIMENSIONS)}")
+        window = int(window)
+        if window < 1:
+            raise ValueError("window must be at least 1 second")
+        seconds, minutes = self._rings
+        ring = seconds if window <= seconds.span and (resolution or 1) % 60 else minutes
+        if ring is minutes and window > minutes.span:
+            raise ValueError(f"window larger than the {minutes.span} seconds kept")
+        resolution = int(resolution or ring.width)
+        if resolution < ring.width or resolution % ring.width:
+            raise ValueError(f"resolution must be a multiple of {ring.width} seconds for this window")
+        per_point = resolution // ring.width
+        points = -(-window // resolution)
+
+        with self._lock:
+            if end is None:
+                last = ring.newest
+            else:
+                last = int(end // ring.width)
+            if last is None:
+                last = int(datetime.now().timestamp() // ring.width)
+            # Align the points to the resolution so consecutive polls line up
+            last_point = last // per_point
+            first_stamp = (last_point - points + 1) * per_point
+            totals = {'packets': [0] * points, 'bytes': [0] * points}
+            series = {}
+            for offset in range(points * per_point):
+                bucket = ring.get(first_stamp + offset)
+                if bucket is None:
+                    continue
+                point = offset // per_point
+                totals['packets'][point] += bucket[1]
+                totals['bytes'][point] += bucket[2]
+                if group_by is None:
+                    continue
+                for key, (packets, size) in bucket[3][group_by].items():
+                    entry = series.get(key)
+                    if entry is None:
+                        entry = series[key] = {'packets': [0] * points, 'bytes': [0] * points}
+                    entry['packets'][point] += packets
+                    entry['bytes'][point] += size
+
+        start = first_stamp * ring.width
+        return {
+            'group_by': group_by,
+            'resolution': resolution,
+            'window': points * resolution,
+            'start': start,
+            'end': start + points * resolution,
+            'timestamps': [start + i * resolution for i in range(points)],
+            'total': totals,
+            'series': series
+        }
+
+    def status(self):
+        seconds, minutes = self._rings
+        return dict(self.stats, seconds=seconds.count, minutes=minutes.count)
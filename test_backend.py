@@ -8,7 +8,9 @@ import sys
 import os
 import time
 import json
+import shutil
 import subprocess
+import tempfile
 import urllib.request
 import urllib.error
 from pathlib import Path
@@ -127,10 +129,12 @@ def test_api_endpoints():
         # Inicia servidor temporário
         backend_dir = Path(__file__).parent / 'backend'
         os.chdir(backend_dir)
+        store_dir = tempfile.mkdtemp(prefix='osi-store-')
         
         process = subprocess.Popen([
             sys.executable, 'app.py'
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+           env=dict(os.environ, STORE_DIR=store_dir, ARCHIVE_DIR=os.path.join(store_dir, 'archive')))
         
         time.sleep(3)
         
@@ -138,7 +142,17 @@ def test_api_endpoints():
             ('/api/health', 'Health check'),
             ('/api/packets', 'Pacotes'),
             ('/api/packets?cache=false', 'Pacotes sem cache'),
-            ('/api/packets?count=5', 'Pacotes com limit')
+            ('/api/packets?count=5', 'Pacotes com limit'),
+            ('/api/history?count=5', 'Histórico colunar'),
+            ('/api/stats/timeseries?window=1m', 'Séries temporais'),
+            ('/api/top?k=5', 'Top talkers'),
+            ('/api/alerts', 'Alertas de varredura'),
+            ('/api/packets?since=0', 'Pacotes armazenados'),
+            ('/api/packets?limit=5&fields=src_ip,dst_ip,size', 'Pacotes com projeção'),
+            ('/api/packets?ip=10.0.0.0/8&risk=low,medium&after_id=0', 'Pacotes filtrados'),
+            ('/api/packets?host=10.0.0.1&port=443&protocol=tcp&direction=src', 'Pacotes por host e porta'),
+            ('/api/archive?count=5', 'Quadros arquivados (pcap)'),
+            ('/metrics', 'Métricas Prometheus')
         ]
         
         success_count = 0
@@ -154,16 +168,124 @@ def test_api_endpoints():
             except Exception as e:
                 print_colored(f"❌ {description}: {e}", 'red')
         
+        # Leituras não trocam o filtro de captura: isso é só com PUT /api/capture/filter
+        filter_ok = False
+        try:
+            urllib.request.urlopen('http://127.0.0.1:5000/api/packets?filter=tcp', timeout=10)
+        except urllib.error.HTTPError as e:
+            with urllib.request.urlopen('http://127.0.0.1:5000/api/capture/filter', timeout=10) as response:
+                filter_ok = e.code == 400 and json.loads(response.read())['filter'] is None
+        except Exception as e:
+            print_colored(f"❌ Filtro via GET: {e}", 'red')
+        print_colored(f"{'✅' if filter_ok else '❌'} GET não altera o filtro de captura", 'green' if filter_ok else 'red')
+        
+        # GET condicional: o mesmo estado devolve 304 para o ETag já recebido
+        conditional_ok = False
+        try:
+            url = 'http://127.0.0.1:5000/api/history?count=5'
+            with urllib.request.urlopen(urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'}),
+                                        timeout=10) as response:
+                etag = response.headers['ETag']
+                assert 'Accept-Encoding' in response.headers['Vary']
+                assert (response.headers.get('Content-Encoding') == 'gzip') == etag.endswith('-gzip"')
+            try:
+                urllib.request.urlopen(urllib.request.Request(url, headers={'If-None-Match': etag}), timeout=10)
+            except urllib.error.HTTPError as e:
+                conditional_ok = e.code == 304
+            print_colored(f"{'✅' if conditional_ok else '❌'} GET condicional com ETag", 'green' if conditional_ok else 'red')
+        except Exception as e:
+            print_colored(f"❌ GET condicional: {e}", 'red')
+        
         process.terminate()
         process.wait(timeout=5)
+        shutil.rmtree(store_dir, ignore_errors=True)
         
         print_colored(f"Endpoints: {success_count}/{len(endpoints_to_test)}", 'cyan')
-        return success_count == len(endpoints_to_test)
+        return success_count == len(endpoints_to_test) and conditional_ok and filter_ok
         
     except Exception as e:
         print_colored(f"❌ Erro ao testar endpoints: {e}", 'red')
         return False
 
+def test_production_server():
+    """Testa o modo de produção: captura e API num processo sob o waitress"""
+    print_colored("🏭 Testando servidor de produção...", 'blue')
+    
+    import gzip
+    
+    process = None
+    try:
+        backend_dir = Path(__file__).parent / 'backend'
+        process = subprocess.Popen([sys.executable, 'serve.py', '--port', '5002', '--threads', '8'],
+                                   cwd=backend_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = 'http://127.0.0.1:5002'
+        health = None
+        deadline = time.time() + 30
+        while time.time() < deadline and health is None:
+            try:
+                with urllib.request.urlopen(f'{base}/api/health', timeout=5) as response:
+                    health = json.loads(response.read().decode())
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.5)
+        assert health is not None, "servidor não respondeu"
+        assert health['status'] == 'healthy'
+        
+        # ETag e 304 ao GET condicional
+        url = f'{base}/api/packets?count=5'
+        with urllib.request.urlopen(urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'}),
+                                    timeout=10) as response:
+            etag = response.headers['ETag']
+            body = response.read()
+            if response.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            assert etag and 'packets' in json.loads(body)
+        try:
+            urllib.request.urlopen(urllib.request.Request(url, headers={'If-None-Match': etag}), timeout=10)
+            raise AssertionError("esperava 304")
+        except urllib.error.HTTPError as e:
+            assert e.code == 304
+        
+        # Uploads com Content-Length ou chunked
+        from scapy.all import IP, TCP, Ether, wrpcap
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'upload.pcap')
+            wrpcap(path, [Ether()/IP(dst='10.0.0.1')/TCP(dport=80)/(b'x' * 1200) for _ in range(100)])
+            with open(path, 'rb') as f:
+                capture = f.read()
+        boundary = 'osi-visualizer-test'
+        multipart = [f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                     f'filename="upload.pcap"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode(),
+                     capture, f'\r\n--{boundary}--\r\n'.encode()]
+        for data in (b''.join(multipart), iter(multipart)):
+            request = urllib.request.Request(f'{base}/api/pcap', data=data, method='POST', headers={
+                'Content-Type': f'multipart/form-data; boundary={boundary}'})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                assert response.status == 202
+                status_url = base + json.loads(response.read())['status_url']
+            job = {}
+            deadline = time.time() + 30
+            while time.time() < deadline and not job.get('done'):
+                time.sleep(0.2)
+                with urllib.request.urlopen(status_url, timeout=10) as response:
+                    job = json.loads(response.read())
+            assert job.get('packets') == 100, f"upload incompleto: {job}"
+        
+        # SIGTERM: para de aceitar, termina as requisições, para a captura e grava
+        process.terminate()
+        status = process.wait(timeout=30)
+        assert os.name == 'nt' or status == 0, f"saiu com status {status}"
+        process = None
+        print_colored("✅ waitress com threads, ETag, uploads e desligamento ordenado", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no servidor de produção: {e}", 'red')
+        return False
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+
 def test_packet_analysis():
     """Testa análise de pacotes"""
     print_colored("📊 Testando análise de pacotes...", 'blue')
@@ -187,12 +309,1150 @@ def test_packet_analysis():
         packet_dict = packet_to_dict(packet, 1)
         print_colored(f"✅ Conversão para dict: {len(packet_dict)} campos", 'green')
         
+        # Sem numpy (dependência opcional) a entropia usa collections.Counter
+        import capture
+        from scapy.all import Raw
+        with_payload = Ether(bytes(packet/Raw(b'GET / HTTP/1.1\r\n\r\n' + bytes(range(200)))))
+        previous, capture.np = capture.np, None
+        try:
+            packet_dict = packet_to_dict(with_payload, 2)
+        finally:
+            capture.np = previous
+        assert 'error' not in packet_dict, packet_dict.get('error')
+        assert packet_dict['payload_analysis']['entropy'] > 0
+        print_colored("✅ Conversão sem numpy", 'green')
+        
         return True
         
     except Exception as e:
         print_colored(f"❌ Erro na análise de pacotes: {e}", 'red')
         return False
 
+def test_service_table():
+    """Testa a tabela de portas compartilhada pelos analisadores"""
+    print_colored("📇 Testando tabela de serviços...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from capture import analyze_osi_layers, detect_protocol_details
+        from services import ServiceTable
+        from scapy.all import IP, TCP, UDP, Ether
+        
+        cases = [
+            (Ether()/IP()/UDP(sport=68, dport=67), 'DHCP'),
+            (Ether()/IP()/UDP(sport=67, dport=68), 'DHCP'),
+            (Ether()/IP()/UDP(sport=40000, dport=123), 'NTP'),
+            (Ether()/IP()/TCP(sport=50000, dport=3389), 'RDP'),
+            (Ether()/IP()/TCP(sport=443, dport=80), 'HTTPS'),
+        ]
+        for packet, expected in cases:
+            details = detect_protocol_details(packet)
+            layers = analyze_osi_layers(packet)
+            assert details['application_protocol'] == expected, (packet.summary(), details)
+            assert layers['application'] == expected, (packet.summary(), layers)
+        
+        table = ServiceTable({'tcp': [{'name': 'Custom', 'ports': ['8000-8002'], 'encryption': 'encrypted'}]})
+        service = table.lookup('tcp', 50000, 8001)
+        assert service.name == 'Custom' and service.encryption == 'encrypted'
+        assert table.lookup('tcp', 50000, 8003) is None
+        assert table.lookup('udp', 50000, 8001) is None
+        
+        print_colored("✅ Analisadores concordam sobre o protocolo de aplicação", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na tabela de serviços: {e}", 'red')
+        return False
+
+def test_entropy():
+    """Testa o cálculo de entropia de Shannon"""
+    print_colored("🎲 Testando entropia...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import capture
+        from capture import calculate_entropy, calculate_entropy_batch
+        
+        payloads = [b'', b'aaaa', b'abab', bytes(range(256)), os.urandom(4096)]
+        expected = [0.0, 0.0, 1.0, 8.0]
+        single = [calculate_entropy(p) for p in payloads]
+        batch = calculate_entropy_batch(payloads)
+        
+        # Implementação em Python puro (sem numpy) sobre os mesmos payloads
+        previous, capture.np = capture.np, None
+        try:
+            fallback = [calculate_entropy(p) for p in payloads]
+            fallback_batch = calculate_entropy_batch(payloads)
+        finally:
+            capture.np = previous
+        
+        for value, exp in zip(single, expected):
+            assert abs(value - exp) < 1e-9, single
+        assert 7.9 < single[-1] <= 8.0, single[-1]
+        assert all(abs(a - b) < 1e-9 for a, b in zip(single, batch)), batch
+        assert all(abs(a - b) < 1e-9 for a, b in zip(single, fallback)), fallback
+        assert all(abs(a - b) < 1e-9 for a, b in zip(single, fallback_batch)), fallback_batch
+        print_colored(f"✅ Entropia em bits por byte: {[round(e, 2) for e in single]}", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no cálculo de entropia: {e}", 'red')
+        return False
+
+def test_packet_stream():
+    """Testa o fluxo ao vivo (SSE) sobre o buffer circular"""
+    print_colored("📡 Testando fluxo ao vivo...", 'blue')
+    
+    import threading
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import capture
+        from engine import CaptureEngine
+        from stream import PacketStream
+        from scapy.all import IP, UDP, Ether
+        
+        previous = capture.enricher
+        capture.set_enricher(None)
+        try:
+            engine = CaptureEngine(ring_size=64)
+            packet = Ether(bytes(Ether()/IP(src="192.168.1.1", dst="192.168.1.2")/UDP(dport=53)))
+            for _ in range(20):
+                engine.process(packet)
+            
+            # Cliente atrasado: só os 8 mais recentes são mantidos
+            stream = PacketStream(engine, since=0, batch_size=5, batch_interval=0.05, max_backlog=8)
+            packets, dropped = stream.next_batch(timeout=1)
+            assert dropped == 12 and [p['id'] for p in packets] == [13, 14, 15, 16, 17], packets
+            packets, dropped = stream.next_batch(timeout=1)
+            assert dropped == 0 and [p['id'] for p in packets] == [18, 19, 20]
+            assert stream.next_batch(timeout=0.05) is None
+            
+            # Um pacote novo acorda o cliente que está esperando
+            threading.Timer(0.05, engine.process, (packet,)).start()
+            packets, dropped = stream.next_batch(timeout=2)
+            assert [p['id'] for p in packets] == [21]
+            
+            # Reconexão a partir de um número de sequência
+            events = PacketStream(engine, since=19, batch_interval=0).events()
+            assert next(events).startswith('retry:')
+            event = next(events)
+            assert event.startswith('id: 21\nevent: packets\n'), event
+            assert json.loads(event.split('data: ', 1)[1])['count'] == 2
+            
+            # Contadores do kernel: sem socket aberto, nada a somar
+            assert engine.kernel_stats() == {} and engine.status()['kernel'] == {'received': 0, 'dropped': 0}
+        finally:
+            capture.set_enricher(previous)
+        
+        print_colored("✅ Lotes, descarte dos mais antigos e retomada funcionando", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no fluxo ao vivo: {e}", 'red')
+        return False
+
+def test_flow_table():
+    """Testa a agregação de pacotes em conversas"""
+    print_colored("🔗 Testando tabela de conversas...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import capture
+        from flows import FlowTable
+        from scapy.all import IP, TCP, UDP, Ether
+        
+        client, server = "192.168.1.10", "192.168.1.20"
+        segments = [(client, server, 'S'), (server, client, 'SA'), (client, server, 'A'),
+                    (client, server, 'PA'), (server, client, 'PA'), (client, server, 'FA'),
+                    (server, client, 'FA'), (client, server, 'A')]
+        packets = []
+        for i, (src, dst, flags) in enumerate(segments):
+            sport, dport = (40000, 80) if src == client else (80, 40000)
+            packet = Ether(bytes(Ether()/IP(src=src, dst=dst)/TCP(sport=sport, dport=dport, flags=flags)))
+            packet.time = 1700000000 + i
+            packets.append(packet)
+        for i in range(3):
+            packet = Ether(bytes(Ether()/IP(src=client, dst="192.168.1.53")/UDP(sport=5000 + i, dport=53)))
+            packet.time = 1700000100 + i
+            packets.append(packet)
+        
+        previous = capture.enricher
+        capture.set_enricher(None)
+        try:
+            dicts = [capture.packet_to_dict(p, i) for i, p in enumerate(packets, 1)]
+        finally:
+            capture.set_enricher(previous)
+        
+        table = FlowTable(idle_timeout=60, max_flows=3)
+        states = []
+        for packet_dict in dicts[:len(segments)]:
+            states.append(table.add_packet(packet_dict).state)
+        assert states == ['syn_sent', 'syn_received', 'established', 'established',
+                          'established', 'fin_wait', 'closing', 'closed'], states
+        
+        total, flows = table.query(protocol='tcp')
+        flow = flows[0]
+        assert total == 1 and flow['client_ip'] == client and flow['server_port'] == 80, flow
+        assert flow['packets'] == 8 and flow['client_packets'] == 5 and flow['history'] == 'ShADdFf', flow
+        assert flow['application'] == 'HTTP' and flow['duration'] == 7, flow
+        
+        # Após 60s sem tráfego a conversa TCP expira; o limite de 3 descarta a mais antiga
+        for packet_dict in dicts[len(segments):]:
+            table.add_packet(packet_dict)
+        assert len(table) == 3 and table.stats['evicted_idle'] == 1, table.status()
+        table.add_packet(dict(dicts[-1], src_port=6000))
+        assert len(table) == 3 and table.stats['evicted_capacity'] == 1, table.status()
+        total, flows = table.query(limit=2)
+        assert total == 3 and [f['client_port'] for f in flows] == [6000, 5002], flows
+        
+        print_colored("✅ Estados TCP, contadores e expiração de conversas", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na tabela de conversas: {e}", 'red')
+        return False
+
+def test_capture_filters():
+    """Testa os filtros BPF da captura"""
+    print_colored("🧹 Testando filtros BPF...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from filters import build_bpf, filter_from_args, validate_bpf
+        
+        assert build_bpf() is None
+        assert build_bpf(host="10.0.0.1", port="443", protocol="TCP", direction="src") == \
+            "tcp and src host 10.0.0.1 and src port 443"
+        assert build_bpf(host="10.0.0.0/8", direction="dst") == "dst net 10.0.0.0/8"
+        assert filter_from_args({'count': '5'}) == (False, None)
+        assert filter_from_args({'filter': 'icmp', 'port': '53'}) == (True, "(icmp) and (port 53)")
+        
+        # Parâmetros estruturados não podem injetar sintaxe BPF
+        for bad in ({'host': '1.2.3.4 or port 22'}, {'port': '99999'}, {'protocol': 'tcp or udp'},
+                    {'direction': 'both'}):
+            try:
+                build_bpf(**bad)
+                raise AssertionError(f"accepted {bad}")
+            except ValueError:
+                pass
+        
+        assert validate_bpf("   ") is None
+        try:
+            validate_bpf("tcp port 80")
+            try:
+                validate_bpf("tcp prot 80")
+                raise AssertionError("accepted an invalid expression")
+            except ValueError:
+                pass
+            print_colored("✅ Expressões validadas pela libpcap", 'green')
+        except RuntimeError:
+            print_colored("⚠️  libpcap indisponível: validação completa não testada", 'yellow')
+        
+        print_colored("✅ Parâmetros estruturados compilados para BPF", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro nos filtros BPF: {e}", 'red')
+        return False
+
+def test_snaplen_window():
+    """Testa o snaplen e a janela de análise do payload"""
+    print_colored("✂️  Testando snaplen e janela de análise...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import capture
+        from engine import CaptureEngine
+        from scapy.all import IP, TCP, Ether, Raw
+        
+        packet = Ether(bytes(Ether()/IP(src="192.168.1.1", dst="192.168.1.2")/
+                             TCP(sport=40000, dport=80)/Raw(b"A" * 3000)))
+        previous = capture.enricher
+        capture.set_enricher(None)
+        try:
+            capture.set_analysis_window(128)
+            full = capture.packet_to_dict(packet, 1)
+            assert 'truncated' not in full and full['size'] == 3054, full.get('truncated')
+            assert full['payload_analysis']['size'] == 3000
+            assert full['payload_analysis']['analyzed_bytes'] == 128
+            assert full['payload_analysis']['hash_md5'] == capture.hashlib.md5(b"A" * 128).hexdigest()[:16]
+            
+            engine = CaptureEngine(ring_size=8, snaplen=200)
+            cut = engine.process(packet)
+            assert cut['truncated'] == {'captured_length': 200, 'wire_length': 3054}, cut.get('truncated')
+            assert cut['size'] == 3054 and cut['payload_analysis']['size'] == 146
+            assert cut['payload_analysis']['analyzed_bytes'] == 128
+        finally:
+            capture.set_analysis_window(None)
+            capture.set_enricher(previous)
+        
+        print_colored("✅ Quadros cortados e payload analisado só na janela", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no snaplen/janela: {e}", 'red')
+        return False
+
+def test_benchmark_harness():
+    """Testa o harness de benchmark (medição e comparação com baseline)"""
+    print_colored("⏱️  Testando harness de benchmark...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent))
+        import bench_backend
+        
+        metrics = bench_backend.measure(bench_backend.capture.calculate_entropy,
+                                        [b"abc" * 100, bytes(range(256))], 50, repeat=2)
+        assert set(metrics) == {'per_second', 'p50_us', 'p99_us', 'peak_kib'}, metrics
+        assert metrics['per_second'] > 0 and metrics['p99_us'] >= metrics['p50_us']
+        
+        baseline = {'x': {'per_second': 1000.0, 'peak_kib': 10.0}}
+        assert bench_backend.compare({'x': {'per_second': 900.0, 'peak_kib': 10.0}}, baseline) == []
+        assert len(bench_backend.compare({'x': {'per_second': 500.0, 'peak_kib': 20.0}}, baseline)) == 2
+        
+        scenarios = bench_backend.scenario_packets()
+        assert len(scenarios['ip_fragment']) > 1 and scenarios['large_entropy'][0].haslayer('Raw')
+        print_colored("✅ Métricas p50/p99/memória e detecção de regressões", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no harness de benchmark: {e}", 'red')
+        return False
+
+def test_packet_view():
+    """Testa se a análise via PacketView dá o mesmo resultado que os acessores do Scapy"""
+    print_colored("🔬 Testando PacketView...", 'blue')
+    
+    import hashlib
+    
+    try:
+        sys.path.append(str(Path(__file__).parent))
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import bench_backend
+        import capture
+        from scapy.all import IP, TCP, UDP, ICMP, ARP, Raw, Ether
+        
+        packets = bench_backend.synthetic_packets()
+        packets.append(Ether()/IP(dst="10.0.0.1")/TCP(dport=22, flags='S'))  # montado, não dissecado
+        packets.append(Ether(bytes(Ether()/IP(dst="10.0.0.1")/TCP(dport=23, flags='R'))))
+        
+        previous = capture.enricher
+        capture.set_enricher(None)
+        try:
+            for packet in packets:
+                d = capture.packet_to_dict(packet, 1)
+                packet = Ether(bytes(packet))
+                assert 'error' not in d, d.get('error')
+                # O que o código anterior lia com haslayer()/packet[Layer]
+                assert d['size'] == len(packet) and d['summary'] == packet.summary()
+                if packet.haslayer(IP):
+                    ip = packet[IP]
+                    assert (d['src_ip'], d['dst_ip'], d['protocol'], d['ttl']) == (ip.src, ip.dst, ip.proto, ip.ttl)
+                    assert d['technical_details']['ip'] == {
+                        'version': ip.version, 'header_length': ip.ihl * 4, 'type_of_service': ip.tos,
+                        'total_length': ip.len, 'identification': ip.id,
+                        'flags': {'dont_fragment': bool(ip.flags.DF), 'more_fragments': bool(ip.flags.MF)},
+                        'fragment_offset': ip.frag, 'checksum': ip.chksum}
+                if packet.haslayer(TCP):
+                    tcp = packet[TCP]
+                    assert (d['src_port'], d['dst_port'], d['flags']) == (tcp.sport, tcp.dport, str(tcp.flags))
+                    assert d['technical_details']['tcp']['flags_analysis'] == capture.analyze_tcp_flags(tcp.flags)
+                    assert d['technical_details']['tcp']['sequence_number'] == tcp.seq
+                elif packet.haslayer(UDP):
+                    udp = packet[UDP]
+                    assert d['technical_details']['udp'] == {'length': udp.len, 'checksum': udp.chksum}
+                elif packet.haslayer(ICMP):
+                    assert d['technical_details']['icmp']['type'] == packet[ICMP].type
+                if packet.haslayer(ARP):
+                    assert (d['arp_op'], d['src_mac']) == (str(packet[ARP].op), str(packet[ARP].hwsrc))
+                if packet.haslayer(Raw):
+                    load = packet[Raw].load
+                    assert d['payload_analysis'] == {
+                        'size': len(load), 'entropy': capture.calculate_entropy(load),
+                        'has_readable_content': capture.has_readable_strings(load),
+                        'hash_md5': hashlib.md5(load).hexdigest()[:16]}
+                    assert d['network_metrics']['overhead_bytes'] == len(packet) - len(load)
+                else:
+                    assert 'payload_analysis' not in d
+        finally:
+            capture.set_enricher(previous)
+        
+        # Legibilidade: mesma resposta que a contagem caractere a caractere
+        def readable(data):
+            text = data.decode('utf-8', errors='ignore')
+            return sum(1 for c in text if c.isprintable()) / len(text) > 0.7 if text else False
+        
+        samples = [os.urandom(n) for n in (1, 7, 64, 1400)]
+        samples += ['héllo wörld ✓ '.encode() * 20, 'тест\x00'.encode() * 10, b'\xc3' + b'abcd' * 5]
+        assert all(capture.has_readable_strings(p) == readable(p) for p in samples)
+        print_colored(f"✅ {len(packets)} pacotes com os mesmos campos que os acessores do Scapy", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no PacketView: {e!r}", 'red')
+        return False
+
+def test_metrics():
+    """Testa as métricas no formato Prometheus"""
+    print_colored("📈 Testando métricas...", 'blue')
+    
+    import threading
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from metrics import Registry, Counter, Histogram, Gauge
+        from capture import packet_to_dict, PACKET_SECONDS
+        from scapy.all import IP, TCP, Ether
+        
+        registry = Registry()
+        requests = Counter('test_requests_total', 'Requisições', labelnames=('status',), registry=registry)
+        latency = Histogram('test_seconds', 'Latência', buckets=(0.1, 1.0), registry=registry)
+        Gauge('test_buffered', 'Pacotes no buffer', lambda: 7, registry=registry)
+        
+        def work():
+            for _ in range(1000):
+                requests.labels('200').inc()
+                latency.observe(0.5)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # As células de threads encerradas continuam somadas
+        assert requests.labels('200').value == 4000, requests.labels('200').value
+        
+        text = registry.render()
+        assert '# TYPE test_requests_total counter' in text
+        assert 'test_requests_total{status="200"} 4000' in text
+        assert 'test_seconds_bucket{le="0.1"} 0' in text
+        assert 'test_seconds_bucket{le="1.0"} 4000' in text
+        assert 'test_seconds_bucket{le="+Inf"} 4000' in text
+        assert 'test_seconds_count 4000' in text and 'test_buffered 7' in text
+        
+        def observed():
+            return sum(PACKET_SECONDS.labels()._cells.totals()[:-1])
+        before = observed()
+        packet_to_dict(Ether(bytes(Ether()/IP(src="10.0.0.1", dst="10.0.0.2")/TCP())), 1)
+        assert observed() == before + 1
+        print_colored("✅ Contadores por thread, histogramas e formato de exposição", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro nas métricas: {e}", 'red')
+        return False
+
+def test_json_encoding():
+    """Testa a codificação JSON rápida e o cache de pacotes já codificados"""
+    print_colored("🧾 Testando codificação JSON...", 'blue')
+    
+    import json
+    import importlib
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import serialize
+        from engine import PacketRing
+        
+        data = {'id': 1, 'summary': 'Ether / IP / TCP', 'ratio': 0.5, 'ok': True, 'none': None,
+                'layers': {'network': 'IPv4'}, 'list': [1, 'dois'], 'nome': 'ação'}
+        assert json.loads(serialize.dumps(data)) == data
+        assert json.loads(serialize.dumps({'obj': Path('x')})) == {'obj': 'x'}
+        body = serialize.packet_list([serialize.dumps(data)], {'count': 1})
+        assert json.loads(body) == {'packets': [data], 'count': 1}
+        assert json.loads(serialize.packet_list([], {})) == {'packets': []}
+        
+        # Sem orjson o resultado é o mesmo
+        saved = sys.modules.get('orjson')
+        sys.modules['orjson'] = None
+        try:
+            fallback = importlib.reload(serialize)
+            assert fallback.BACKEND == 'json'
+            assert json.loads(fallback.dumps(data)) == data
+        finally:
+            if saved is not None:
+                sys.modules['orjson'] = saved
+            else:
+                sys.modules.pop('orjson', None)
+            importlib.reload(serialize)
+        
+        ring = PacketRing(4)
+        pending = {'summary': 'a', 'enrichment': 'pending'}
+        settled = {'summary': 'b', 'enrichment': 'complete'}
+        pending['id'] = ring.append(pending)
+        settled['id'] = ring.append(settled)
+        first = ring.encoded(ring.latest(2))
+        settled['summary'] = 'mudou'
+        pending['src_hostname'] = 'host.example'
+        pending['enrichment'] = 'complete'
+        second = ring.encoded(ring.latest(2))
+        # O pacote já resolvido sai do cache; o pendente é recodificado
+        assert second[1] is first[1]
+        assert json.loads(second[0])['src_hostname'] == 'host.example'
+        print_colored(f"✅ JSON via {serialize.BACKEND} e cache de pacotes codificados", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na codificação JSON: {e}", 'red')
+        return False
+
+def test_column_store():
+    """Testa o histórico colunar de pacotes"""
+    print_colored("🗃️  Testando histórico colunar...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from columns import ColumnStore, ROW_BYTES, ip_to_int, int_to_ip
+        from capture import packet_to_dict
+        from scapy.all import IP, IPv6, TCP, UDP, ARP, Ether, Raw
+        
+        packets = [
+            Ether()/IP(src="192.168.1.10", dst="8.8.8.8", ttl=64)/TCP(sport=40000, dport=443, flags='PA')/Raw(b'x' * 40),
+            Ether()/IPv6(src="2001:db8::1", dst="2001:db8::2")/UDP(sport=5353, dport=53),
+            Ether()/ARP(psrc="192.168.1.10", pdst="192.168.1.1")
+        ]
+        dicts = [packet_to_dict(Ether(bytes(p)), i) for i, p in enumerate(packets, 1)]
+        
+        store = ColumnStore(capacity=4)
+        for d in dicts:
+            store.add_packet(d)
+        tcp, udp6, arp = store.records()
+        assert tcp['src_ip'] == "192.168.1.10" and tcp['dst_port'] == 443 and tcp['flags'] == 'PA'
+        assert tcp['ttl'] == 64 and tcp['size'] == dicts[0]['size'] and tcp['timestamp'] == dicts[0]['timestamp']
+        assert tcp['payload_analysis']['size'] == 40
+        assert tcp['security_assessment']['risk_level'] == dicts[0]['security_assessment']['risk_level']
+        assert udp6['dst_port'] == 53 and 'flags' not in udp6
+        assert int_to_ip(ip_to_int("2001:db8::2")) == "2001:db8::2" and int_to_ip(ip_to_int("10.0.0.1")) == "10.0.0.1"
+        assert 'src_ip' not in arp and arp['protocol_analysis']['protocol_stack'] == dicts[2]['protocol_analysis']['protocol_stack']
+        
+        # Cheio, o registro mais antigo é sobrescrito
+        for seq in range(4, 7):
+            store.add_packet(dict(dicts[0], id=seq))
+        assert len(store) == 4 and store.first_seq == 3 and store.last_seq == 6
+        assert [r['id'] for r in store.records(since=4)] == [5, 6]
+        assert [r['id'] for r in store.records(latest=2)] == [5, 6]
+        assert store.nbytes == 4 * ROW_BYTES
+        print_colored(f"✅ {ROW_BYTES} bytes por pacote, IPv4/IPv6/ARP e sobrescrita", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no histórico colunar: {e}", 'red')
+        return False
+
+def test_packet_query():
+    """Testa a seleção por colunas, paginação por cursor e projeção"""
+    print_colored("🔎 Testando consultas de pacotes...", 'blue')
+    
+    from datetime import datetime
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from columns import ColumnStore
+        from filters import query_from_args
+        from engine import PacketRing
+        
+        base = 1700000000.0
+        store = ColumnStore(capacity=1000)
+        for seq in range(1, 201):
+            store.add_packet({
+                'id': seq, 'timestamp': datetime.fromtimestamp(base + seq).isoformat(),
+                'src_ip': f"10.0.{seq % 4}.{seq % 250 + 1}", 'dst_ip': "2001:db8::1" if seq % 10 == 0 else "8.8.8.8",
+                'protocol': 6 if seq % 2 else 17, 'src_port': 40000, 'dst_port': 443 if seq % 2 else 53,
+                'size': 60, 'security_assessment': {'risk_level': 'high' if seq % 50 == 0 else 'low'}
+            })
+        
+        def select(**args):
+            query = query_from_args(args)
+            return store.select(query['after_id'], query['limit'], **query['predicates'])
+        
+        assert select(risk='high', limit='10') == ([50, 100, 150, 200], False)
+        assert select(ip='2001:db8::/32', protocol='udp', limit='3') == ([170, 180, 190, 200][-3:], True)
+        # host/port/direction como na captura, mas só na leitura
+        assert select(host='2001:db8::1', direction='dst', limit='2') == ([190, 200], True)
+        assert select(port='53', protocol='udp', after_id='0', limit='2') == ([2, 4], True)
+        assert select(port='40000', direction='src', limit='1') == ([200], True)
+        assert select(port='40000', direction='dst') == ([], False)
+        # Cursor: os próximos após after_id, do mais antigo para o mais novo
+        page, more = select(src_ip='10.0.1.0/24', dst_port='443', after_id='100', limit='5')
+        assert page == [101, 105, 109, 113, 117] and more
+        assert select(since=str(base + 195), until=str(base + 198)) == ([195, 196, 197], False)
+        assert store.record(42)['id'] == 42 and store.record(999) is None
+        
+        query = query_from_args({'fields': 'src_ip, size,src_ip'})
+        assert query['fields'] == ('id', 'src_ip', 'size') and query['predicates'] == {}
+        assert query_from_args({'count': '5'}) is None
+        for bad in ({'ip': '10.0.0.300'}, {'risk': 'extreme'}, {'protocol': 'sctp'}, {'limit': '0'},
+                    {'direction': 'both'}, {'host': '10.0.0.1', 'src_ip': '10.0.0.2', 'direction': 'src'}):
+            try:
+                query_from_args(bad)
+                raise AssertionError(f"aceitou {bad}")
+            except ValueError:
+                pass
+        
+        # Histórico circular com horários fora de ordem (pcap antigo no meio da captura):
+        # blocos descartados pelo mapa de horários e o mesmo resultado com e sem numpy
+        import columns
+        wrapped = ColumnStore(capacity=9000)
+        for seq in range(1, 20001):
+            t = base - 86400 if seq % 7 == 0 else base + seq
+            wrapped.add_packet({'id': seq, 'timestamp': datetime.fromtimestamp(t).isoformat(),
+                                'src_ip': f"10.0.0.{seq % 200 + 1}", 'dst_ip': "8.8.8.8", 'protocol': 6,
+                                'src_port': seq % 3, 'dst_port': 443 if seq % 5 else 22, 'size': 60})
+        old = [seq for seq in range(11001, 20001) if seq % 7 == 0]
+        queries = [({'until': str(base - 3600), 'limit': '10000'}, (old, False)),
+                   ({'dst_port': '22', 'src_port': '1', 'after_id': '19000', 'limit': '3'}, None),
+                   ({'ip': '10.0.0.7', 'since': str(base + 15000)}, None),
+                   ({'dst_port': '9999'}, ([], False)),
+                   ({'port': '22', 'since': str(base + 15000), 'limit': '50'}, None)]
+        previous = columns.np
+        try:
+            for args, expected in queries:
+                query = query_from_args(args)
+                results = []
+                for np in (previous, None):
+                    columns.np = np
+                    results.append(wrapped.select(query['after_id'], query['limit'], **query['predicates']))
+                assert results[0] == results[1], (args, results)
+                assert expected is None or results[0] == expected, (args, results[0])
+        finally:
+            columns.np = previous
+        
+        ring = PacketRing(4)
+        for seq in range(1, 7):
+            ring.append({'id': seq})
+        assert ring.get(6) == {'id': 6} and ring.get(2) is None
+        print_colored("✅ Predicados por IP/CIDR, porta, protocolo, risco e tempo; cursor e projeção", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro nas consultas de pacotes: {e}", 'red')
+        return False
+
+def test_http_cache():
+    """Testa ETags, negociação de codificação e o cache de corpos comprimidos"""
+    print_colored("🗜️ Testando cache HTTP...", 'blue')
+    
+    import gzip
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from httpcache import CompressedCache, encoded_etag, make_etag, matching_etag, negotiate
+        from werkzeug.http import parse_etags
+        
+        assert make_etag('/api/packets', 10) == make_etag('/api/packets', 10)
+        assert make_etag('/api/packets', 10) != make_etag('/api/packets', 11)
+        # Cada codificação tem seu próprio ETag, e qualquer uma revalida o estado
+        tag = make_etag('/api/packets', 10)
+        assert encoded_etag(tag, 'gzip') == f'{tag}-gzip' and encoded_etag(tag, None) == tag
+        assert matching_etag(parse_etags(f'"x", "{tag}-gzip"'), tag) == f'{tag}-gzip'
+        assert matching_etag(parse_etags(f'"{tag}"'), tag) == tag
+        assert matching_etag(parse_etags(f'"{tag}-gzip"'), make_etag('/api/packets', 11)) is None
+        assert negotiate('gzip, deflate') == 'gzip'
+        assert negotiate('gzip;q=0, identity') is None and negotiate(None) is None
+        assert negotiate('*') in ('br', 'gzip')
+        
+        cache = CompressedCache(max_entries=2, min_size=100)
+        builds = []
+        
+        def build():
+            builds.append(1)
+            return b'{"packets": [' + b'{"id": 1}, ' * 50 + b']}'
+        
+        body, encoding = cache.get('a', 'gzip', build)
+        assert encoding == 'gzip' and gzip.decompress(body) == build()
+        assert cache.get('a', 'gzip', build) == (body, 'gzip') and len(builds) == 2
+        cache.get('b', 'gzip', build)
+        cache.get('c', 'gzip', build)
+        assert len(cache) == 2 and cache.stats == {'hits': 1, 'misses': 3}
+        # Corpos pequenos seguem sem compressão e não ocupam o cache
+        assert cache.get('d', 'gzip', lambda: b'[]') == (b'[]', None) and len(cache) == 2
+        print_colored("✅ ETags estáveis, Accept-Encoding com q-values e cache LRU comprimido", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no cache HTTP: {e}", 'red')
+        return False
+
+def test_traffic_series():
+    """Testa a agregação de tráfego por segundo e por minuto"""
+    print_colored("📊 Testando séries temporais...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from timeseries import TrafficSeries, parse_duration
+        from capture import packet_to_dict
+        from scapy.all import IP, TCP, UDP, ARP, Ether
+        
+        base = 1700000040.0  # início de um minuto
+        frames = [(Ether()/IP(src="192.168.1.10", dst="8.8.8.8")/TCP(sport=40000, dport=80), 0.5),
+                  (Ether()/IP(src="192.168.1.10", dst="8.8.8.8")/UDP(sport=5353, dport=53), 1.2),
+                  (Ether()/ARP(psrc="192.168.1.10", pdst="192.168.1.1"), 1.7),
+                  (Ether()/IP(src="192.168.1.10", dst="8.8.8.8")/TCP(sport=40000, dport=80), 70.0)]
+        series = TrafficSeries(seconds=120, minutes=10)
+        sizes = []
+        for i, (frame, offset) in enumerate(frames, 1):
+            packet = Ether(bytes(frame))
+            packet.time = base + offset
+            packet_dict = packet_to_dict(packet, i)
+            sizes.append(packet_dict['size'])
+            series.add_packet(packet_dict)
+        
+        result = series.query(window=120, group_by='protocol', end=base + 71)
+        assert result['resolution'] == 1 and len(result['timestamps']) == 120
+        assert sum(result['total']['packets']) == 4 and sum(result['total']['bytes']) == sum(sizes)
+        assert sum(result['series']['TCP']['packets']) == 2 and sum(result['series']['ARP']['packets']) == 1
+        second = result['timestamps'].index(int(base) + 1)
+        assert result['total']['packets'][second] == 2
+        
+        # Pontos de 5 s somam os buckets de 1 s
+        coarse = series.query(window=120, resolution=5, group_by=None, end=base + 71)
+        assert coarse['series'] == {} and coarse['total']['packets'][coarse['timestamps'].index(int(base))] == 3
+        
+        minutes = series.query(window=600, group_by='layer', end=base + 71)
+        assert minutes['resolution'] == 60
+        assert minutes['total']['packets'][-2:] == [3, 1]
+        assert sum(minutes['series']['transport']['packets']) == 3
+        
+        assert parse_duration('5m') == 300 and parse_duration('90') == 90 and parse_duration(None) is None
+        for bad in ({'group_by': 'porta'}, {'window': 7200}, {'window': 600, 'resolution': 30}):
+            try:
+                series.query(**bad)
+                assert False, bad
+            except ValueError:
+                pass
+        print_colored("✅ Buckets por segundo/minuto, resoluções e agrupamentos", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro nas séries temporais: {e}", 'red')
+        return False
+
+def test_top_talkers():
+    """Testa o top-N com resumos Space-Saving"""
+    print_colored("🏆 Testando top talkers...", 'blue')
+    
+    import random
+    from datetime import datetime
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from talkers import SpaceSaving, TopTalkers
+        
+        # Memória fixa e os mais frequentes encontrados com muitas chaves distintas
+        random.seed(7)
+        keys = [f"10.0.{i // 256}.{i % 256}" for i in range(20000)]
+        stream = random.choices(keys, [1 / (i + 1) for i in range(len(keys))], k=50000)
+        sketch = SpaceSaving(100)
+        exact = {}
+        for key in stream:
+            sketch.add(key)
+            exact[key] = exact.get(key, 0) + 1
+        assert len(sketch) == 100 and sketch.total == len(stream)
+        for key, count in sorted(exact.items(), key=lambda item: -item[1])[:5]:
+            assert sketch.counts[key] - sketch.errors[key] <= count <= sketch.counts[key], key
+        
+        def packet(src, dst, port, size, ts):
+            return {'timestamp': datetime.fromtimestamp(ts).isoformat(), 'size': size,
+                    'src_ip': src, 'dst_ip': dst, 'dst_port': port, 'layers': {'application': 'HTTPS'}}
+        
+        talkers = TopTalkers(capacity=10, interval=60, intervals=5)
+        base = 1700000040.0
+        for i in range(100):
+            talkers.add_packet(packet("192.168.1.10", "8.8.8.8", 443, 1000, base + i * 0.1))
+        for i in range(30):
+            talkers.add_packet(packet("192.168.1.20", "8.8.8.8", 53, 100, base + 61))
+        
+        result = talkers.query(k=2, by='bytes')
+        src = result['top']['src_ip']['entries']
+        assert src[0]['key'] == "192.168.1.10" and src[0]['count'] == 100000 and src[0]['error'] == 0
+        assert result['top']['pair']['entries'][0]['key'] == ["192.168.1.10", "8.8.8.8"]
+        assert result['top']['dst_ip']['entries'][0]['share'] == 1.0
+        # Só o último intervalo
+        recent = talkers.query(k=5, window=60, by='packets', dimensions=('dst_port',))
+        assert recent['top']['dst_port']['entries'] == [{'key': 53, 'count': 30, 'error': 0, 'share': 1.0}]
+        
+        talkers.reset()
+        assert talkers.query()['top']['src_ip']['entries'] == []
+        print_colored("✅ Space-Saving com memória fixa, janelas e reset", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no top talkers: {e}", 'red')
+        return False
+
+def test_scan_detection():
+    """Testa a detecção de varreduras com estado por origem"""
+    print_colored("🛰️  Testando detecção de varreduras...", 'blue')
+    
+    from datetime import datetime
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from scans import ScanDetector, distinct, _bit
+        from capture import packet_to_dict
+        from scapy.all import IP, TCP, Ether
+        
+        # Um SYN isolado não é mais suspeito
+        syn = packet_to_dict(Ether(bytes(Ether()/IP(src="192.168.1.10", dst="8.8.8.8")/TCP(dport=443, flags='S'))), 1)
+        assert syn['security_assessment']['risk_level'] == 'low', syn['security_assessment']
+        
+        bitmap = 0
+        for port in range(1, 301):
+            bitmap |= _bit(port)
+        assert 270 <= distinct(bitmap) <= 330, distinct(bitmap)
+        
+        base = 1700000000.0
+        def tcp(src, dst, dport, flags, offset, sport=40000):
+            return {'id': 1, 'timestamp': datetime.fromtimestamp(base + offset).isoformat(),
+                    'src_ip': src, 'dst_ip': dst, 'protocol': 6, 'src_port': sport,
+                    'dst_port': dport, 'flags': flags}
+        
+        detector = ScanDetector(window=60, port_threshold=100, host_threshold=100, min_syns=50,
+                                max_sources=100)
+        # Cliente normal: 80 conexões respondidas em 30 hosts
+        for i in range(80):
+            host = f"93.184.{i % 30}.1"
+            detector.add_packet(tcp("192.168.1.10", host, 443, 'S', i * 0.1, sport=40000 + i))
+            detector.add_packet(tcp(host, "192.168.1.10", 40000 + i, 'SA', i * 0.1, sport=443))
+        assert detector.alerts() == []
+        
+        # Varredura vertical: 200 portas, respondidas com RST
+        for port in range(1, 201):
+            detector.add_packet(tcp("10.0.0.66", "192.168.1.20", port, 'S', 10 + port * 0.01))
+            detector.add_packet(tcp("192.168.1.20", "10.0.0.66", 40000, 'RA', 10 + port * 0.01, sport=port))
+        kinds = {alert['type'] for alert in detector.alerts(source="10.0.0.66")}
+        assert kinds == {'port_scan', 'syn_scan'}, kinds
+        alert = detector.alerts(kind='port_scan')[0]
+        assert alert['distinct_ports'] >= 100 and alert['syn'] == 200 and alert['syn_ack'] == 0
+        assert detector.status()['alerts']['port_scan'] == 1
+        
+        # Origens inativas por duas janelas são descartadas
+        detector.add_packet(tcp("10.9.9.9", "192.168.1.20", 22, 'S', 500))
+        assert len(detector) == 1
+        print_colored("✅ Sem falso positivo para clientes; port_scan e syn_scan detectados", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na detecção de varreduras: {e}", 'red')
+        return False
+
+def test_packet_store():
+    """Testa o armazenamento persistente segmentado"""
+    print_colored("💾 Testando armazenamento persistente...", 'blue')
+    
+    import tempfile
+    from datetime import datetime
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from store import PacketStore, parse_time
+        
+        base = 1700000000.0
+        def packet(seq, offset):
+            return {'id': seq, 'timestamp': datetime.fromtimestamp(base + offset).isoformat(),
+                    'src_ip': "192.168.1.10", 'dst_ip': "8.8.8.8", 'size': 60, 'summary': 'x' * 100}
+        
+        with tempfile.TemporaryDirectory() as path:
+            store = PacketStore(path, segment_bytes=4096, block_records=4, flush_interval=0.01)
+            for seq in range(1, 101):
+                store.add_packet(packet(seq, seq))
+            store.add_packet(packet(50, 200))  # fora de ordem: descartado
+            assert store.flush(timeout=5)
+            status = store.status()
+            assert status['written'] == 100 and status['errors'] == 1 and status['segments'] > 1, status
+            
+            assert [r['id'] for r in store.records(since=base + 40, until=base + 45)] == [40, 41, 42, 43, 44]
+            assert [seq for seq, _, _ in store.read(after=97)] == [98, 99, 100]
+            assert [seq for seq, _, _ in store.read(after=10, limit=2)] == [11, 12]
+            found = store.get([5, 77, 100, 5000])
+            assert sorted(found) == [5, 77, 100] and json.loads(found[77])['id'] == 77
+            assert parse_time(datetime.fromtimestamp(base).isoformat()) == base
+            store.close()
+            
+            # Reabertura: índices esparsos carregados e registro parcial descartado
+            last = sorted(os.listdir(path))[-1]
+            with open(os.path.join(path, last), 'ab') as f:
+                f.write(b'\x10\x00\x00')
+            store = PacketStore(path, segment_bytes=4096, block_records=4, flush_interval=0.01,
+                                retention_bytes=8192)
+            assert store.last_seq == 100 and len(store) == 100
+            store.add_packet(packet(101, 101))
+            assert store.flush(timeout=5)
+            assert [r['id'] for r in store.records(after=99)] == [100, 101]
+            
+            # Retenção por tamanho: os segmentos mais antigos são apagados
+            assert store.stats['expired_segments'] > 0 and store.nbytes <= 8192 + 4096
+            assert store.first_seq > 1 and store.records(until=base + store.first_seq - 1) == []
+            store.close()
+        print_colored("✅ Segmentos, índice por tempo/sequência, recuperação e retenção", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no armazenamento persistente: {e}", 'red')
+        return False
+
+def test_frame_archive():
+    """Testa o arquivamento dos quadros originais em pcapng"""
+    print_colored("🗄️  Testando arquivamento pcapng...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from archive import FrameArchive, pcap_stream
+        from engine import CaptureEngine
+        from scapy.all import IP, TCP, Ether, Raw, PcapReader, PcapNgReader
+        import io
+        
+        with tempfile.TemporaryDirectory() as path:
+            archive = FrameArchive(path, max_bytes=400, max_files=3)
+            engine = CaptureEngine(ring_size=64, archive=archive)
+            frames = []
+            for i in range(12):
+                frames.append(bytes(Ether()/IP(src="192.168.1.10", dst="8.8.8.8")/TCP(sport=40000 + i, dport=443)/Raw(b'x' * 100)))
+                packet = Ether(frames[-1])
+                packet.time = 1700000000.25 + i
+                engine.process(packet)
+            packets = engine.latest(12)
+            refs = [p['archive'] for p in packets]
+            assert all(refs) and len({ref['file'] for ref in refs}) > 3
+            assert archive.flush(timeout=5)
+            
+            # Arquivos antigos saem pela rotação; os restantes são pcapng válidos
+            files = sorted(os.listdir(path))
+            assert len(files) == 3 and refs[-1]['file'] == files[-1]
+            with PcapNgReader(os.path.join(path, files[-1])) as reader:
+                assert bytes(list(reader)[-1]) == frames[-1]
+            
+            read = archive.frames(refs)
+            assert read[0] is None and read[-1][2] == frames[-1] and read[-1][1] == 1
+            assert abs(read[-1][0] - (1700000000.25 + 11)) < 1e-6
+            
+            pcap = b''.join(pcap_stream([f for f in read if f]))
+            exported = list(PcapReader(io.BytesIO(pcap)))
+            assert [bytes(p) for p in exported] == [f[2] for f in read if f]
+            
+            # Após reiniciar, as interfaces são lidas do próprio arquivo
+            archive.close()
+            reopened = FrameArchive(path, max_files=3)
+            assert reopened.frames([refs[-1]])[0][1:3] == (1, frames[-1])
+            reopened.close()
+        print_colored("✅ Referência (arquivo, offset), rotação e exportação pcap", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no arquivamento pcapng: {e}", 'red')
+        return False
+
+def test_pcap_ingest():
+    """Testa a análise de arquivos pcap/pcapng"""
+    print_colored("📼 Testando ingestão de pcap...", 'blue')
+    
+    import tempfile
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from ingest import IngestStats, ingest_pcap
+        from capture import packet_to_dict
+        from scapy.all import IP, TCP, UDP, Ether, wrpcap, wrpcapng
+        
+        packets = [Ether()/IP(src="192.168.1.1", dst="192.168.1.2")/TCP(sport=1000 + i, dport=80)
+                   for i in range(20)]
+        packets += [Ether()/IP(src="192.168.1.1", dst="192.168.1.53")/UDP(sport=5353, dport=53)]
+        for i, packet in enumerate(packets):
+            packet.time = 1700000000 + i
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, writer in (('test.pcap', wrpcap), ('test.pcapng', wrpcapng)):
+                path = os.path.join(tmp, name)
+                writer(path, packets)
+                results = []
+                stats = ingest_pcap(path, process=results.append)
+                assert stats.packets == len(packets) and stats.errors == 0, stats.as_dict()
+                assert stats.as_dict()['done'] and stats.progress == 1.0
+                
+                dicts = [packet_to_dict(p, i) for i, p in enumerate(results, 1)]
+                assert dicts[-1]['layers']['application'] == 'DNS', dicts[-1]['layers']
+                assert dicts[0]['timestamp'].startswith('2023-11-1'), dicts[0]['timestamp']
+                
+                # Sem callback (como o IngestJob), o progresso avança durante a leitura
+                stats = IngestStats(path)
+                partway = []
+                ingest_pcap(path, process=lambda p: partway.append(stats.progress), stats=stats,
+                            progress_interval=0)
+                assert 0 < partway[len(packets) // 2] < 1.0, partway
+        
+        print_colored("✅ pcap e pcapng analisados em streaming", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na ingestão de pcap: {e}", 'red')
+        return False
+
+def test_parallel_dissection():
+    """Testa a dissecação paralela em processos"""
+    print_colored("⚙️  Testando dissecação paralela...", 'blue')
+    
+    import tempfile
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        import capture
+        from engine import CaptureEngine
+        from ingest import ingest_pcap
+        from scapy.all import IP, TCP, Ether, wrpcapng
+        
+        packets = [Ether()/IP(src="192.168.1.1", dst="192.168.1.2")/TCP(sport=1000 + i, dport=80)
+                   for i in range(150)]
+        for i, packet in enumerate(packets):
+            packet.time = 1700000000 + i
+        
+        previous = capture.enricher
+        capture.set_enricher(None)
+        engine = CaptureEngine(ring_size=256, workers=2)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'test.pcapng')
+                wrpcapng(path, packets)
+                stats = ingest_pcap(path, process_raw=engine.process_raw)
+            # Workers são criados por spawn e não executam de novo o script principal
+            assert engine._dissector._pool.apply(
+                eval, ("getattr(__import__('sys').modules['__main__'], '__file__', None)",)) is None
+            engine.close()
+        finally:
+            capture.set_enricher(previous)
+        
+        results = engine.latest(200)
+        assert stats.packets == len(packets) and len(results) == len(packets), len(results)
+        assert [p['id'] for p in results] == list(range(1, len(packets) + 1))
+        assert [p['src_port'] for p in results] == [1000 + i for i in range(150)]
+        assert results[0]['timestamp'].startswith('2023-11-1'), results[0]['timestamp']
+        print_colored("✅ Pacotes dissecados em 2 processos e entregues em ordem", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na dissecação paralela: {e}", 'red')
+        return False
+
+def test_packet_ring():
+    """Testa o buffer circular do motor de captura"""
+    print_colored("🔁 Testando buffer circular...", 'blue')
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from engine import PacketRing
+        
+        ring = PacketRing(capacity=4)
+        for i in range(10):
+            ring.append({'id': ring.next_seq, 'value': i})
+        
+        latest = ring.latest(3)
+        assert [p['id'] for p in latest] == [8, 9, 10], latest
+        assert [p['id'] for p in ring.latest(100)] == [7, 8, 9, 10]
+        assert [p['id'] for p in ring.since(8)] == [9, 10]
+        assert ring.since(10) == []
+        assert ring.first_seq == 7 and ring.last_seq == 10
+        print_colored("✅ Buffer circular mantém os pacotes mais recentes em ordem", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no buffer circular: {e}", 'red')
+        return False
+
+def test_enrichment():
+    """Testa o enriquecimento assíncrono com um servidor de geolocalização local"""
+    print_colored("🌍 Testando enriquecimento assíncrono...", 'blue')
+    
+    import threading
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    
+    hits = []
+    
+    class FakeGeoHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            time.sleep(0.2)
+            body = json.dumps({'status': 'success', 'country': 'Testland', 'city': 'Localhost'})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(('127.0.0.1', 0), FakeGeoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from enrichment import Enricher, IpApiProvider
+        
+        provider = IpApiProvider(f'http://127.0.0.1:{server.server_port}/json')
+        enricher = Enricher(dns_resolver=lambda ip: None, geo_provider=provider)
+        
+        first = {'dst_ip': '8.8.8.8'}
+        second = {'dst_ip': '8.8.8.8'}
+        enricher.enrich(first, {'dst': '8.8.8.8'})
+        enricher.enrich(second, {'dst': '8.8.8.8'})
+        assert first['enrichment'] == 'pending', first
+        
+        deadline = time.time() + 5
+        while time.time() < deadline and second.get('enrichment') != 'complete':
+            time.sleep(0.05)
+        
+        assert first['dst_geo']['country'] == 'Testland', first
+        assert second['dst_geo']['city'] == 'Localhost', second
+        assert len(hits) == 1, hits  # lookups em andamento são compartilhadas
+        
+        third = {'dst_ip': '8.8.8.8'}
+        enricher.enrich(third, {'dst': '8.8.8.8'})
+        assert third['enrichment'] == 'complete' and len(hits) == 1
+        assert 'dst_hostname' not in third  # falha de DNS fica em cache negativo
+        
+        enricher.shutdown()
+        print_colored("✅ Enriquecimento em segundo plano com cache e deduplicação", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro no enriquecimento: {e}", 'red')
+        return False
+    finally:
+        server.shutdown()
+
+def test_offline_geodb():
+    """Testa o banco de geolocalização offline"""
+    print_colored("🗺️  Testando geolocalização offline...", 'blue')
+    
+    import tempfile
+    
+    try:
+        sys.path.append(str(Path(__file__).parent / 'backend'))
+        from geodb import OfflineGeoProvider
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'ranges.csv')
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("start_ip,end_ip,country,region,city,isp,org,timezone\n")
+                f.write("8.8.8.0,8.8.8.255,United States,California,Mountain View,Google LLC,Google,America/Los_Angeles\n")
+                f.write("16843008,16843263,Australia,Queensland,Brisbane,Cloudflare,APNIC,Australia/Brisbane\n")
+            
+            provider = OfflineGeoProvider(csv_path)
+            try:
+                google = provider.lookup('8.8.8.8')
+                assert google['country'] == 'United States' and google['isp'] == 'Google LLC', google
+                assert set(google) == {'country', 'region', 'city', 'isp', 'org', 'timezone'}
+                assert provider.lookup('1.1.1.1')['city'] == 'Brisbane'
+                assert provider.lookup('9.9.9.9') is None
+                assert provider.lookup('2001:4860:4860::8888') is None
+            finally:
+                provider.close()
+        
+        print_colored("✅ Consultas offline por faixa de IP", 'green')
+        return True
+        
+    except Exception as e:
+        print_colored(f"❌ Erro na geolocalização offline: {e}", 'red')
+        return False
+
 def generate_test_traffic():
     """Gera tráfego de rede para teste"""
     print_colored("🚦 Gerando tráfego de teste...", 'blue')
@@ -229,8 +1489,32 @@ def run_all_tests():
         ("Imports", test_imports),
         ("Permissões Scapy", test_scapy_permissions),
         ("Análise de Pacotes", test_packet_analysis),
+        ("Tabela de Serviços", test_service_table),
+        ("Entropia", test_entropy),
+        ("Snaplen e Janela", test_snaplen_window),
+        ("Harness de Benchmark", test_benchmark_harness),
+        ("PacketView", test_packet_view),
+        ("Métricas", test_metrics),
+        ("Codificação JSON", test_json_encoding),
+        ("Buffer Circular", test_packet_ring),
+        ("Fluxo ao Vivo", test_packet_stream),
+        ("Tabela de Conversas", test_flow_table),
+        ("Histórico Colunar", test_column_store),
+        ("Séries Temporais", test_traffic_series),
+        ("Top Talkers", test_top_talkers),
+        ("Detecção de Varreduras", test_scan_detection),
+        ("Consultas de Pacotes", test_packet_query),
+        ("Cache HTTP", test_http_cache),
+        ("Armazenamento Persistente", test_packet_store),
+        ("Arquivamento pcapng", test_frame_archive),
+        ("Filtros BPF", test_capture_filters),
+        ("Ingestão de pcap", test_pcap_ingest),
+        ("Dissecação Paralela", test_parallel_dissection),
+        ("Enriquecimento", test_enrichment),
+        ("Geolocalização Offline", test_offline_geodb),
         ("Servidor Flask", test_flask_server),
-        ("Endpoints API", test_api_endpoints)
+        ("Endpoints API", test_api_endpoints),
+        ("Servidor de Produção", test_production_server)
     ]
     
     results = {}